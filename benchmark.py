@@ -0,0 +1,286 @@
+# Benchmarks do editor. Rodam sem janela (driver de vídeo "dummy").
+# Uso: python benchmark.py undo [--shapes 10000 --edits 500]
+#      python benchmark.py raster|clip|transform|render|scene [--sizes 1000 10000 --thickness 1 3 8]
+#      python benchmark.py all
+import os
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import argparse
+import copy
+import gc
+import io
+import random
+import contextlib
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pygame
+
+import main
+
+
+def random_shape(rng):
+    shape_type = rng.choice(['linha', 'desenho livre', 'polígono', 'círculo'])
+    x, y = rng.uniform(0, 1100), rng.uniform(50, 800)
+    count = {'linha': 2, 'círculo': 1}.get(shape_type, rng.randint(3, 40))
+    points = [(x + rng.uniform(-60, 60), y + rng.uniform(-60, 60)) for _ in range(count)]
+    return main.Shape(shape_type, points, main.COLORS['draw'], radius=rng.randint(5, 60),
+                      thickness=rng.randint(1, 4))
+
+
+def build_editor(shapes, seed=0):
+    rng = random.Random(seed)
+    editor = main.GraphicsEditor(headless=True)
+    editor.shapes = [random_shape(rng) for _ in range(shapes)]
+    editor.index.rebuild(editor.shapes)
+    editor.invalidate()
+    return editor, rng
+
+
+def random_edit(editor, rng):
+    # Mistura de operações típicas: transformar alguns objetos ou criar um novo.
+    op = rng.random()
+    if op < 0.2:
+        editor.add_shape(random_shape(rng))
+        return
+    editor.clear_selection()
+    for shape in rng.sample(editor.shapes, 5):
+        shape.selected = True
+        editor.selected_shapes.append(shape)
+    if op < 0.5:
+        editor.rotate_selected(rng.choice([1, -1]))
+    elif op < 0.7:
+        editor.apply_reflection_x_operation()
+    elif op < 0.9:
+        editor.apply_reflection_y_operation()
+    else:
+        editor.apply_reflection_origin_operation()
+
+
+def bench_undo(shapes, edits, legacy_edits):
+    editor, rng = build_editor(shapes)
+    quiet = io.StringIO()
+
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(quiet):
+        for _ in range(edits):
+            random_edit(editor, rng)
+    elapsed = time.perf_counter() - start
+    used = tracemalloc.get_traced_memory()[0] - base
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(quiet):
+        while editor.history.undo_stack:
+            editor.history.undo(editor)
+    undo_time = time.perf_counter() - start
+    # Memória que só o histórico mantém viva: a liberada ao descartá-lo
+    # (depois de desfazer tudo, os estados novos só existem nele).
+    estimate = editor.history.nbytes
+    before = tracemalloc.get_traced_memory()[0]
+    editor.history = main.History()
+    gc.collect()
+    held = before - tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    # Referência: o esquema antigo guardava uma cópia profunda da cena a cada edição.
+    start = time.perf_counter()
+    copy.deepcopy(editor.shapes)
+    legacy_time = time.perf_counter() - start
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    snapshots = [copy.deepcopy(editor.shapes) for _ in range(legacy_edits)]
+    legacy = (tracemalloc.get_traced_memory()[0] - base) / legacy_edits
+    tracemalloc.stop()
+    del snapshots
+
+    print(f"Cena: {shapes} formas, {edits} edições")
+    print(f"  comandos:  {used / 1e6:9.2f} MB no total (com o índice espacial), "
+          f"{elapsed / edits * 1e3:.2f} ms/edição, desfazer tudo em {undo_time * 1e3:.1f} ms")
+    print(f"  histórico: {held / 1e6:9.2f} MB retidos só por ele "
+          f"(contados em nbytes: {estimate / 1e6:.2f} MB)")
+    print(f"  cópias:    {legacy / 1e6:9.2f} MB por edição -> "
+          f"{legacy * edits / 1e6:9.2f} MB para {edits} edições, "
+          f"{legacy_time * 1e3:.2f} ms/edição (medido em {legacy_edits} cópias)")
+
+
+def timed(func, repeat=3):
+    # Melhor de repeat execuções, em segundos.
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def report(name, size, elapsed, pixels=None):
+    line = f"  {name:<28} {size:>8} formas  {elapsed * 1e3:9.2f} ms  {size / elapsed:12.0f} formas/s"
+    if pixels is not None:
+        line += f"  {pixels / elapsed / 1e6:9.2f} Mpixels/s"
+    print(line)
+
+
+def random_segments(rng, count):
+    area = pygame.Rect(0, 50, main.WIDTH - 300, main.HEIGHT - 50)
+    xs = rng.uniform(area.left - 100, area.right + 100, (count, 2))
+    ys = rng.uniform(area.top - 100, area.bottom + 100, (count, 2))
+    return np.stack((xs[:, 0], ys[:, 0], xs[:, 1], ys[:, 1]), axis=1)
+
+
+def bench_raster(sizes, thicknesses):
+    # Pixels = centros calculados por cada algoritmo (antes do carimbo do
+    # pincel); no AA, os pixels com cobertura, que dependem da espessura.
+    rng = np.random.default_rng(0)
+    surface = pygame.Surface((main.WIDTH, main.HEIGHT))
+    surface.set_clip(pygame.Rect(0, 50, main.WIDTH - 300, main.HEIGHT - 50))
+    for size in sizes:
+        segments = random_segments(rng, size).round()
+        lines = [((x0, y0), (x1, y1)) for x0, y0, x1, y1 in segments.tolist()]
+        circles = [((x, y), r) for (x, y), r in zip(segments[:, :2].tolist(),
+                                                    rng.integers(1, 120, size).tolist())]
+        dda_pixels = sum(len(main.dda_points(a, b)) for a, b in lines)
+        bresenham_pixels = sum(len(main.bresenham_points(a, b)) for a, b in lines)
+        circle_pixels = sum(len(main.circle_points(c, r)) for c, r in circles)
+        for thickness in thicknesses:
+            print(f"Rasterização: {size} formas, espessura {thickness}")
+            aa_line_pixels = sum(len(main.segment_coverage([a], [b], thickness)) for a, b in lines)
+            aa_circle_pixels = sum(len(main.circle_coverage(c, r, thickness)) for c, r in circles)
+            for name, draw, pixels in (('draw_line_dda', main.draw_line_dda, dda_pixels),
+                                       ('draw_line_bresenham', main.draw_line_bresenham, bresenham_pixels),
+                                       ('draw_line_aa', main.draw_line_aa, aa_line_pixels)):
+                elapsed = timed(lambda: [draw(surface, a, b, (0, 0, 0), thickness) for a, b in lines])
+                report(name, size, elapsed, pixels)
+            for name, draw, pixels in (('draw_circle_bresenham', main.draw_circle_bresenham, circle_pixels),
+                                       ('draw_circle_aa', main.draw_circle_aa, aa_circle_pixels)):
+                elapsed = timed(lambda: [draw(surface, c, r, (0, 0, 0), thickness) for c, r in circles])
+                report(name, size, elapsed, pixels)
+
+
+def bench_clip(sizes, thicknesses):
+    rng = np.random.default_rng(0)
+    rect = pygame.Rect(200, 150, 500, 400)
+    for size in sizes:
+        print(f"Recorte: {size} formas")
+        segments = random_segments(rng, size)
+        lines = [((x0, y0), (x1, y1)) for x0, y0, x1, y1 in segments.tolist()]
+        report('cohen_sutherland_clip', size,
+               timed(lambda: [main.cohen_sutherland_clip(line, rect) for line in lines]))
+        report('liang_barsky_clip', size,
+               timed(lambda: [main.liang_barsky_clip(line, rect) for line in lines]))
+        report('cohen_sutherland_clip_batch', size,
+               timed(lambda: main.cohen_sutherland_clip_batch(segments, rect)))
+        report('liang_barsky_clip_batch', size,
+               timed(lambda: main.liang_barsky_clip_batch(segments, rect)))
+        # Polígonos estrelados (simples) de 3 a 40 vértices.
+        polygons = []
+        for x, y in segments[:, :2].tolist():
+            count = int(rng.integers(3, 41))
+            angles = np.sort(rng.uniform(0, 2 * np.pi, count))
+            radii = rng.uniform(20, 150, count)
+            polygons.append(list(zip((x + radii * np.cos(angles)).tolist(),
+                                     (y + radii * np.sin(angles)).tolist())))
+        report('sutherland_hodgman_clip', size,
+               timed(lambda: [main.sutherland_hodgman_clip(poly, rect) for poly in polygons]))
+        report('weiler_atherton_clip', size,
+               timed(lambda: [main.weiler_atherton_clip(poly, rect) for poly in polygons]))
+
+
+def bench_transform(sizes, thicknesses):
+    quiet = io.StringIO()
+    for size in sizes:
+        print(f"Transformações: {size} formas")
+        editor, rng = build_editor(size)
+        editor.selected_shapes = list(editor.shapes)
+
+        def rotate():
+            with contextlib.redirect_stdout(quiet):
+                editor.rotate_selected(1)
+
+        def flatten():
+            with contextlib.redirect_stdout(quiet):
+                editor.rotate_selected(1)
+                editor.flatten_selected()
+
+        def undo():
+            # Desfazer substitui a restauração do antigo save_state.
+            with contextlib.redirect_stdout(quiet):
+                editor.rotate_selected(1)
+                editor.undo()
+
+        def save_state():
+            # O save_state antigo copiava a cena inteira; hoje guardar o estado
+            # é registrar a geometria das formas num comando de desfazer.
+            geometry = [shape.geometry for shape in editor.shapes]
+            editor.history.push(main.GeometryCommand(
+                [(shape, state, state) for shape, state in zip(editor.shapes, geometry)]))
+
+        report('rotate_selected', size, timed(rotate))
+        report('rotate + flatten_selected', size, timed(flatten))
+        report('rotate + undo', size, timed(undo))
+        report('save_state (comando)', size, timed(save_state))
+        report('save_state (deepcopy antigo)', size, timed(lambda: copy.deepcopy(editor.shapes)))
+
+
+def bench_render(sizes, thicknesses):
+    for size in sizes:
+        for thickness in thicknesses:
+            print(f"Renderização sem janela: {size} formas, espessura {thickness}")
+            editor, rng = build_editor(size)
+            for shape in editor.shapes:
+                shape.thickness = thickness
+            editor.tile_workers = 1
+            report('render_frames (frio)', size, timed(lambda: editor.render_frames(1, cold=True)))
+            report('render_frames (cache)', size, timed(lambda: editor.render_frames(1)))
+            # Blocos em paralelo só entram com TILE_MIN_SHAPES formas fora do cache.
+            if size >= main.TILE_MIN_SHAPES:
+                editor.tile_workers = max(2, main.TILE_WORKERS)
+                report(f'render_frames ({editor.tile_workers} proc.)', size,
+                       timed(lambda: editor.render_frames(1, cold=True)))
+                editor.close_tiles()
+
+
+def bench_scene(sizes, thicknesses):
+    path = os.path.join(tempfile.gettempdir(), 'benchmark_cena.tp1')
+    for size in sizes:
+        print(f"Arquivo de cena: {size} formas")
+        editor, rng = build_editor(size)
+        report('save_scene', size, timed(lambda: main.save_scene(path, editor.shapes)))
+        report('load_scene', size, timed(lambda: main.load_scene(path)))
+        loaded = main.GraphicsEditor(headless=True)
+        report('load_scene + set_scene', size, timed(lambda: loaded.set_scene(*main.load_scene(path))))
+    main.release_scene_maps(path)
+    os.remove(path)
+
+
+BENCHMARKS = {
+    'undo': bench_undo,
+    'raster': bench_raster,
+    'clip': bench_clip,
+    'transform': bench_transform,
+    'render': bench_render,
+    'scene': bench_scene,
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmarks do editor gráfico.")
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS) + ['all'])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--thickness', type=int, nargs='+', default=[1, 3, 8])
+    parser.add_argument('--shapes', type=int, default=10000)
+    parser.add_argument('--edits', type=int, default=500)
+    parser.add_argument('--legacy-edits', type=int, default=3)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    names = sorted(BENCHMARKS) if args.benchmark == 'all' else [args.benchmark]
+    for name in names:
+        if name == 'undo':
+            bench_undo(args.shapes, args.edits, args.legacy_edits)
+        else:
+            BENCHMARKS[name](args.sizes, args.thickness)
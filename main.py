@@ -1,9 +1,24 @@
 import pygame
 import math
 import sys
-import copy
-
-pygame.init()
+import csv
+import gc
+import json
+import mmap
+import os
+import struct
+import time
+import weakref
+import argparse
+import atexit
+import contextlib
+import io
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+import numpy as np
 
 # Configs
 WIDTH, HEIGHT = 1400, 800
@@ -20,70 +35,527 @@ COLORS = {
     'clip': (255, 0, 0),
     'text': (220, 220, 220)
 }
+# Memória máxima (bytes) das superfícies rasterizadas guardadas pelas formas.
+SHAPE_CACHE_BUDGET = 64 * 1024 * 1024
+# Limites do histórico de desfazer: número de entradas e bytes estimados.
+HISTORY_LIMIT = 500
+HISTORY_MAX_BYTES = 256 * 1024 * 1024
+# Lado (px) das células do índice espacial.
+GRID_CELL = 64
+# Clique de seleção: folga (px da tela) além do pincel até o traço, e
+# segmentos por folha da hierarquia de caixas das polilinhas.
+PICK_TOLERANCE = 3
+BVH_LEAF = 8
+# Desenho livre: distância mínima (px) entre pontos capturados, desvio
+# máximo (px) de um ponto em relação à reta do último segmento para ainda
+# contar como colinear, e tolerância (px) da simplificação de Douglas–Peucker
+# ao terminar o traço.
+STROKE_MIN_DISTANCE = 3
+STROKE_COLLINEAR = 0.25
+STROKE_TOLERANCE = 1.0
+MAX_BRUSH = 20
+# Limites do zoom da câmera e passo da roda do mouse / das setas.
+MIN_ZOOM, MAX_ZOOM = 0.1, 16.0
+ZOOM_STEP = 1.25
+PAN_STEP = 40
+# Arquivo usado por Ctrl+S / Ctrl+O.
+SCENE_FILE = 'cena.tp1'
+# Ctrl+E exporta para estes arquivos; Ctrl+I importa o primeiro que existir.
+EXPORT_FILES = ('cena.svg', 'cena.json')
+IMPORT_FILES = ('importar.svg', 'importar.json')
+# Redesenhos completos com pelo menos TILE_MIN_SHAPES formas fora do cache
+# são divididos em blocos de TILE_SIZE px rasterizados em TILE_WORKERS
+# processos (1 = tudo no processo principal).
+TILE_SIZE = 256
+TILE_MIN_SHAPES = 2000
+TILE_WORKERS = os.cpu_count() or 1
+# Limite de quadros por segundo do laço principal.
+FRAME_RATE = 60
+# Algoritmos de linha do botão da barra lateral ('AA' = antisserrilhado).
+LINE_ALGOS = ['DDA', 'Bresenham', 'AA']
+
+# ================ (rasterização) ================
+# As linhas são calculadas como um conjunto de centros (DDA ou Bresenham),
+# expandidos pelo carimbo do pincel em spans horizontais e gravados de uma
+# só vez na superfície.
+_BRUSH_SPANS = {}
+
+def brush_spans(thickness):
+    # Spans (dy, x_ini, x_fim) do carimbo que pygame.draw.circle pinta com raio = espessura.
+    spans = _BRUSH_SPANS.get(thickness)
+    if spans is None:
+        size = 2 * thickness + 3
+        stamp = pygame.Surface((size, size))
+        stamp.fill((0, 0, 0))
+        pygame.draw.circle(stamp, (255, 255, 255), (thickness + 1, thickness + 1), thickness)
+        mask = pygame.surfarray.array2d(stamp) != 0
+        rows = []
+        for y in range(size):
+            xs = np.flatnonzero(mask[:, y])
+            if len(xs):
+                rows.append((y - thickness - 1, xs[0] - thickness - 1, xs[-1] - thickness - 1))
+        spans = np.array(rows, dtype=np.int64).reshape(-1, 3)
+        _BRUSH_SPANS[thickness] = spans
+    return spans
+
+def dda_segments(starts, ends):
+    # Centros DDA de vários segmentos de uma vez (arrays Nx2).
+    starts = np.asarray(starts, dtype=np.float64).reshape(-1, 2)
+    ends = np.asarray(ends, dtype=np.float64).reshape(-1, 2)
+    delta = ends - starts
+    steps = np.abs(delta).max(axis=1).astype(np.int64)
+    # Segmentos de tamanho zero desenham um ponto no início truncado.
+    parts = [np.trunc(starts[steps == 0]).astype(np.int64)]
+    # Soma acumulada sequencial por linha de uma matriz [x0, inc, inc, ...]
+    # reproduz exatamente o x += x_inc do laço. Os segmentos são agrupados
+    # por potência de 2 do comprimento para limitar o preenchimento.
+    buckets = np.zeros(len(steps), dtype=np.int64)
+    buckets[steps > 0] = np.ceil(np.log2(steps[steps > 0])).astype(np.int64)
+    for bucket in np.unique(buckets[steps > 0]):
+        sel = np.flatnonzero((buckets == bucket) & (steps > 0))
+        n = steps[sel]
+        width = int(n.max())
+        inc = delta[sel] / n[:, None]
+        valid = np.arange(width) < n[:, None]
+        for axis in (0, 1):
+            acc = np.empty((len(sel), width))
+            acc[:, 0] = starts[sel, axis]
+            acc[:, 1:] = inc[:, axis:axis + 1]
+            np.cumsum(acc, axis=1, out=acc)
+            if axis == 0:
+                xs = np.rint(acc[valid])
+            else:
+                ys = np.rint(acc[valid])
+        parts.append(np.stack((xs, ys), axis=1).astype(np.int64))
+    return np.concatenate(parts)
+
+def bresenham_segments(starts, ends):
+    # Centros Bresenham de vários segmentos de uma vez (arrays Nx2).
+    starts = np.trunc(np.asarray(starts, dtype=np.float64).reshape(-1, 2)).astype(np.int64)
+    ends = np.trunc(np.asarray(ends, dtype=np.float64).reshape(-1, 2)).astype(np.int64)
+    x0, y0 = starts[:, 0], starts[:, 1]
+    dx = np.abs(ends[:, 0] - x0)
+    dy = np.abs(ends[:, 1] - y0)
+    sx = np.where(x0 < ends[:, 0], 1, -1)
+    sy = np.where(y0 < ends[:, 1], 1, -1)
+    # Forma fechada do erro acumulado: o eixo maior anda sempre, o menor
+    # anda quando o erro passa da metade (empates resolvidos como no laço).
+    x_major = dx >= dy
+    major = np.where(x_major, dx, dy)
+    minor_len = np.where(x_major, dy, dx)
+    counts = major + 1
+    seg = np.repeat(np.arange(len(major)), counts)
+    i = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+    minor = (2 * i * minor_len[seg] + major[seg] - 1) // (2 * np.maximum(major[seg], 1))
+    minor = np.where(major[seg] == 0, 0, minor)
+    xm = x_major[seg]
+    xs = x0[seg] + sx[seg] * np.where(xm, i, minor)
+    ys = y0[seg] + sy[seg] * np.where(xm, minor, i)
+    return np.stack((xs, ys), axis=1)
+
+def dda_points(start, end):
+    return dda_segments([start], [end])
+
+def bresenham_points(start, end):
+    return bresenham_segments([start], [end])
+
+def polyline_points(points, line_algo='DDA', closed=False):
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if len(points) < 2:
+        return np.empty((0, 2), dtype=np.int64)
+    ends = np.roll(points, -1, axis=0) if closed else points[1:]
+    starts = points if closed else points[:-1]
+    if line_algo == 'DDA':
+        return dda_segments(starts, ends)
+    return bresenham_segments(starts, ends)
+
+def stamp_bounds(centers, thickness):
+    # Retângulo exato que stamp_points pintaria (None se nada for pintado).
+    spans = brush_spans(thickness)
+    if not len(centers) or not len(spans):
+        return None
+    left = int(centers[:, 0].min() + spans[:, 1].min())
+    top = int(centers[:, 1].min() + spans[:, 0].min())
+    right = int(centers[:, 0].max() + spans[:, 2].max())
+    bottom = int(centers[:, 1].max() + spans[:, 0].max())
+    return pygame.Rect(left, top, right - left + 1, bottom - top + 1)
+
+def _write_pixels(surface, xs, ys, color):
+    try:
+        pixels = pygame.surfarray.pixels2d(surface)
+        # map_rgb devolve inteiro com sinal em superfícies com alpha.
+        pixels[xs, ys] = surface.map_rgb(color) & 0xFFFFFFFF
+    except ValueError:
+        # Superfícies de 24 bits não têm acesso 2D.
+        pixels = pygame.surfarray.pixels3d(surface)
+        pixels[xs, ys] = color[:3]
+    del pixels
+
+def stamp_points(surface, centers, color, thickness=1, offset=(0, 0)):
+    # Carimba o pincel em todos os centros de uma vez; offset desloca as
+    # coordenadas (ex.: superfícies recortadas). Retorna o retângulo afetado.
+    centers = np.asarray(centers, dtype=np.int64).reshape(-1, 2)
+    clip = surface.get_clip()
+    spans = brush_spans(thickness)
+    if not len(centers) or not len(spans):
+        return pygame.Rect(clip.x, clip.y, 0, 0)
+    cx = centers[:, 0:1] - offset[0]
+    cy = centers[:, 1:2] - offset[1]
+    ys = (cy + spans[:, 0]).ravel()
+    starts = np.maximum((cx + spans[:, 1]).ravel(), clip.left)
+    ends = np.minimum((cx + spans[:, 2]).ravel(), clip.right - 1)
+    keep = (ys >= clip.top) & (ys < clip.bottom) & (starts <= ends)
+    ys, starts, ends = ys[keep], starts[keep], ends[keep]
+    if not len(ys):
+        return pygame.Rect(clip.x, clip.y, 0, 0)
+    # Une spans sobrepostos da mesma linha para gravar cada pixel uma vez.
+    # A chave linear (linha * largura + x) ordena por linha e depois por início.
+    row_base = (ys - clip.top) * (clip.width + 2)
+    lo = starts + row_base
+    order = np.argsort(lo)
+    lo = lo[order]
+    reach = np.maximum.accumulate((ends + row_base)[order])
+    new_span = np.ones(len(lo), dtype=bool)
+    new_span[1:] = lo[1:] > reach[:-1] + 1
+    first = np.flatnonzero(new_span)
+    last = np.append(first[1:], len(lo)) - 1
+    span_y = ys[order[first]]
+    base = (span_y - clip.top) * (clip.width + 2)
+    span_lo = lo[first] - base
+    span_hi = reach[last] - base
+    lengths = span_hi - span_lo + 1
+    total = int(lengths.sum())
+    run_start = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    px = np.repeat(span_lo, lengths) + np.arange(total) - run_start
+    py = np.repeat(span_y, lengths)
+    _write_pixels(surface, px, py, color)
+    left, top = int(span_lo.min()), int(span_y.min())
+    return pygame.Rect(left, top, int(span_hi.max()) - left + 1, int(span_y.max()) - top + 1)
 
 # Linha DDA.
 def draw_line_dda(surface, start, end, color, thickness=1):
-    x0, y0 = start
-    x1, y1 = end
-    dx = x1 - x0
-    dy = y1 - y0
-    steps = int(max(abs(dx), abs(dy)))
-    if steps == 0:
-        pygame.draw.circle(surface, color, (int(x0), int(y0)), thickness)
-        return
-    x_inc = dx / steps
-    y_inc = dy / steps
-    x, y = x0, y0
-    for _ in range(steps):
-        pygame.draw.circle(surface, color, (int(round(x)), int(round(y))), thickness)
-        x += x_inc
-        y += y_inc
+    return stamp_points(surface, dda_points(start, end), color, thickness)
 
 # Linha Bresenham.
 def draw_line_bresenham(surface, start, end, color, thickness=1):
-    x0, y0 = map(int, start)
-    x1, y1 = map(int, end)
-    dx = abs(x1 - x0)
-    dy = abs(y1 - y0)
-    sx = 1 if x0 < x1 else -1
-    sy = 1 if y0 < y1 else -1
-    err = dx - dy
-    while True:
-        pygame.draw.circle(surface, color, (x0, y0), thickness)
-        if x0 == x1 and y0 == y1:
-            break
-        e2 = 2 * err
-        if e2 > -dy:
-            err -= dy
-            x0 += sx
-        if e2 < dx:
-            err += dx
-            y0 += sy
+    return stamp_points(surface, bresenham_points(start, end), color, thickness)
+
+def draw_polyline(surface, points, color, thickness=1, line_algo='DDA', closed=False):
+    if line_algo == 'AA':
+        return blend_coverage(surface, polyline_coverage(points, thickness, closed), color)
+    return stamp_points(surface, polyline_points(points, line_algo, closed), color, thickness)
 
 # Círculo Bresenham.
-def draw_circle_bresenham(surface, center, radius, color, thickness=1):
-    cx, cy = center
-    x = 0
-    y = radius
-    d = 3 - 2 * radius
-    def draw_circle_points(cx, cy, x, y):
-        pts = [
-            (cx + x, cy + y), (cx - x, cy + y),
-            (cx + x, cy - y), (cx - x, cy - y),
-            (cx + y, cy + x), (cx - y, cy + x),
-            (cx + y, cy - x), (cx - y, cy - x)
-        ]
-        for pt in pts:
-            pygame.draw.circle(surface, color, pt, thickness)
-    while y >= x:
-        draw_circle_points(cx, cy, x, y)
-        x += 1
+def circle_octant(radius):
+    # Pontos (x, y) que o laço de Bresenham (d = 3 - 2r) visita no primeiro
+    # octante, calculados de uma vez. O laço mantém d = D(x, y) com
+    # D = 2x² + 2y² + 8x - 6y - 2r² + 4r + 3 e só desce y quando D > 0, então,
+    # enquanto y cai no máximo 1 por passo, y(x + 1) é o maior y com D(x, y) <= 0.
+    r = int(radius)
+    x = np.arange(0, int(r / math.sqrt(2)) + 2, dtype=np.int64)
+    c = 2 * x * x + 8 * x - 2 * r * r + 4 * r + 3
+    y = np.floor((6 + np.sqrt(np.maximum(36 - 8 * c, 0))) / 4).astype(np.int64)
+    y = np.where(2 * (y + 1) ** 2 - 6 * (y + 1) + c <= 0, y + 1, y)
+    y = np.where(2 * y * y - 6 * y + c > 0, y - 1, y)
+    ys = np.concatenate(([r], y))
+    xs = np.arange(len(ys), dtype=np.int64)
+    drop = ys[:-1] - ys[1:]
+    bad = np.flatnonzero((drop < 0) | (drop > 1) | (ys[1:] < xs[1:]))
+    n = bad[0] + 1 if len(bad) else len(ys)
+    xs, ys = xs[:n].tolist(), ys[:n].tolist()
+    # Perto da diagonal segue o próprio laço até o ponto final (já com y < x),
+    # que o laço original também desenha.
+    px, py = xs[-1], ys[-1]
+    while py >= px:
+        d = 2 * px * px + 2 * py * py + 8 * px - 6 * py - 2 * r * r + 4 * r + 3
+        px += 1
         if d > 0:
-            y -= 1
-            d += 4 * (x - y) + 10
+            py -= 1
+        xs.append(px)
+        ys.append(py)
+    return np.array(xs, dtype=np.int64), np.array(ys, dtype=np.int64)
+
+def circle_points(center, radius):
+    cx, cy = center
+    x, y = circle_octant(radius)
+    # Espelha o octante nos 8 octantes e remove pixels repetidos.
+    ox = np.concatenate((x, -x, x, -x, y, -y, y, -y))
+    oy = np.concatenate((y, y, -y, -y, x, x, -x, -x))
+    # pygame.draw.circle trunca centros fracionários.
+    px = np.trunc(cx + ox).astype(np.int64)
+    py = np.trunc(cy + oy).astype(np.int64)
+    left, top = px.min(), py.min()
+    width = py.max() - top + 1
+    keys = np.unique((px - left) * width + (py - top))
+    return np.stack((keys // width + left, keys % width + top), axis=1)
+
+def draw_circle_bresenham(surface, center, radius, color, thickness=1):
+    return stamp_points(surface, circle_points(center, radius), color, thickness)
+
+# Antisserrilhado (Wu generalizado para espessura): a cobertura de cada pixel
+# vem da distância do seu centro ao traço, com meia largura thickness + 1/2
+# (a mesma do carimbo do pincel). Os pixels são linhas (x, y, alpha 0-255),
+# misturadas na superfície de uma vez; um pixel repetido (juntas entre
+# segmentos) fica com a maior cobertura.
+def expand_runs(starts, lengths):
+    # Posições de todos os spans [início, início + comprimento) de uma vez.
+    ends = np.cumsum(lengths)
+    return np.repeat(starts - ends + lengths, lengths) + np.arange(int(ends[-1]) if len(ends) else 0)
+
+def segment_coverage(starts, ends, thickness=1):
+    # Todos os segmentos numa passada, em coordenadas (u, v) = (eixo maior,
+    # eixo menor) com u crescente. Cada coluna u do segmento vira spans de v:
+    # no meio do segmento (projeção de toda a coluna dentro dele), os pixels a
+    # até thickness da reta saem com alpha 255 e só as bordas têm alpha
+    # calculado, pela distância perpendicular |v - centro| * cos; nas colunas
+    # das pontas todo o span é medido até o segmento (com os discos dos
+    # extremos) e os pixels fora do alcance são descartados.
+    starts = np.asarray(starts, dtype=np.float64).reshape(-1, 2)
+    ends = np.asarray(ends, dtype=np.float64).reshape(-1, 2)
+    if not len(starts):
+        return np.empty((0, 3), dtype=np.int64)
+    reach = thickness + 1.0
+    steep = (np.abs(ends[:, 1] - starts[:, 1]) > np.abs(ends[:, 0] - starts[:, 0]))[:, None]
+    a, b = np.where(steep, starts[:, ::-1], starts), np.where(steep, ends[:, ::-1], ends)
+    back = a[:, :1] > b[:, :1]
+    a, b = np.where(back, b, a), np.where(back, a, b)
+    au, av = a[:, 0], a[:, 1]
+    du, dv = b[:, 0] - au, b[:, 1] - av
+    # du >= |dv|: du = 0 só em segmentos de tamanho zero.
+    slope = dv / np.maximum(du, 1e-12)
+    stretch = np.sqrt(1 + slope * slope)  # 1 / cos(ângulo)
+    length2 = np.maximum(du * du + dv * dv, 1e-24)
+    # Alcance até reach - 0,5/255: além dele o alpha arredonda para 0.
+    outer = (reach - 0.5 / 255) * stretch
+    # A projeção do centro da coluna x é x / du e varia ± margin / du no span.
+    margin = outer * np.abs(dv) * du / length2
+    first = np.ceil(au - reach).astype(np.int64)
+    count = np.floor(au + du + reach).astype(np.int64) - first + 1
+    seg = np.repeat(np.arange(len(a)), count)
+    u = expand_runs(first, count)
+    x = u - au[seg]
+    # Fora do segmento o span fica em volta do extremo (cobre o disco dele).
+    center = av[seg] + np.clip(x, 0, du[seg]) * slope[seg]
+    lo = np.ceil(center - outer[seg]).astype(np.int64)
+    hi = np.floor(center + outer[seg]).astype(np.int64)
+    body = (x >= margin[seg]) & (x <= (du - margin)[seg])
+    inner = (thickness * stretch)[seg]
+    in_lo = np.where(body, np.ceil(center - inner).astype(np.int64), hi + 1)
+    in_hi = np.where(body, np.floor(center + inner).astype(np.int64), hi)
+    # Spans [cheios | bordas | pontas], cada parte um trecho contíguo; linhas
+    # u, v e alpha num só bloco (devolvido Nx3).
+    cols, tips = np.flatnonzero(body), np.flatnonzero(~body)
+    lows = np.concatenate((in_lo, lo[cols], in_hi[cols] + 1, lo[tips]))
+    sizes = np.concatenate((in_hi - in_lo + 1, (in_lo - lo)[cols], (hi - in_hi)[cols], (hi - lo + 1)[tips]))
+    col = np.repeat(np.concatenate((np.arange(len(u)), cols, cols, tips)), sizes)
+    rows = np.empty((3, len(col)), dtype=np.int64)
+    pu, pv, alpha = rows
+    pv[:] = expand_runs(lows, sizes)
+    np.take(u, col, out=pu)
+    f = int(sizes[:len(u)].sum())
+    e = f + int(sizes[len(u):len(u) + 2 * len(cols)].sum())
+    alpha[:f] = 255
+    edge = col[f:e]
+    alpha[f:e] = np.rint(reach * 255 - np.abs(pv[f:e] - center[edge]) * (255 / stretch[seg[edge]]))
+    tip = col[e:]
+    s = seg[tip]
+    tx, tv = x[tip], pv[e:] - av[s]
+    t = np.clip((tx * du[s] + tv * dv[s]) / length2[s], 0.0, 1.0)
+    alpha[e:] = np.rint(np.minimum(reach - np.hypot(tx - t * du[s], tv - t * dv[s]), 1.0) * 255)
+    # Descarta os pixels das pontas fora do alcance (alpha <= 0).
+    kept = e + np.flatnonzero(alpha[e:] > 0)
+    rows = np.concatenate((rows[:, :e], rows[:, kept]), axis=1)
+    # Volta para (x, y): troca u e v dos segmentos íngremes.
+    steep = steep[:, 0]
+    if steep.all():
+        rows[:2] = rows[1::-1]
+    elif steep.any():
+        swap = steep[seg[np.concatenate((col[:e], col[kept]))]]
+        rows[:2] = np.where(swap, rows[1::-1], rows[:2])
+    return rows.T
+
+def polyline_coverage(points, thickness=1, closed=False):
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if len(points) < 2:
+        return np.empty((0, 3), dtype=np.int64)
+    ends = np.roll(points, -1, axis=0) if closed else points[1:]
+    starts = points if closed else points[:-1]
+    return segment_coverage(starts, ends, thickness)
+
+def circle_coverage(center, radius, thickness=1):
+    # Anel de pixels a até thickness + 1 da circunferência: dois spans por
+    # linha (à esquerda e à direita do furo), um só quando não há furo.
+    cx, cy = float(center[0]), float(center[1])
+    reach = thickness + 1.0
+    outer, inner = radius + reach, max(radius - reach, 0.0)
+    ys = np.arange(math.floor(cy - outer), math.ceil(cy + outer) + 1, dtype=np.int64)
+    dy = ys - cy
+    w_out = np.sqrt(np.maximum(outer * outer - dy * dy, 0.0))
+    w_in = np.sqrt(np.maximum(inner * inner - dy * dy, 0.0))
+    left_end = np.floor(cx - w_in).astype(np.int64)
+    starts = np.concatenate((np.ceil(cx - w_out).astype(np.int64),
+                             np.maximum(np.ceil(cx + w_in).astype(np.int64), left_end + 1)))
+    ends = np.concatenate((left_end, np.floor(cx + w_out).astype(np.int64)))
+    rows = np.concatenate((ys, ys))
+    lengths = np.maximum(ends - starts + 1, 0)
+    run_start = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    px = np.repeat(starts, lengths) + np.arange(int(lengths.sum())) - run_start
+    py = np.repeat(rows, lengths)
+    distance = np.abs(np.hypot(px - cx, py - cy) - radius)
+    alpha = np.rint(np.clip(reach - distance, 0.0, 1.0) * 255).astype(np.int64)
+    keep = alpha > 0
+    return np.stack((px[keep], py[keep], alpha[keep]), axis=1)
+
+# Peso de cada alpha na mistura em inteiros (A = 255 vira 256: só a cor).
+COVER_WEIGHTS = np.append(np.arange(255, dtype=np.uint32), np.uint32(256))
+
+def blend_coverage(surface, pixels, color, offset=(0, 0)):
+    # Mistura a cor pela cobertura de cada pixel, em lote. Em superfícies com
+    # alpha (cache das formas, rascunho) o alpha também é composto ("sobre").
+    # Pixels repetidos ficam com a maior cobertura.
+    clip = surface.get_clip()
+    if not len(pixels):
+        return pygame.Rect(clip.x, clip.y, 0, 0)
+    xs, ys, alpha = pixels[:, 0], pixels[:, 1], pixels[:, 2]
+    if offset[0] or offset[1]:
+        xs, ys = xs - offset[0], ys - offset[1]
+    left, top, right, bottom = int(xs.min()), int(ys.min()), int(xs.max()), int(ys.max())
+    if left < clip.left or top < clip.top or right >= clip.right or bottom >= clip.bottom:
+        keep = (xs >= clip.left) & (xs < clip.right) & (ys >= clip.top) & (ys < clip.bottom)
+        if not keep.any():
+            return pygame.Rect(clip.x, clip.y, 0, 0)
+        xs, ys, alpha = xs[keep], ys[keep], alpha[keep]
+        left, top, right, bottom = int(xs.min()), int(ys.min()), int(xs.max()), int(ys.max())
+    rect = pygame.Rect(left, top, right - left + 1, bottom - top + 1)
+    # Maior cobertura de cada pixel num plano do retângulo; as leituras da
+    # superfície vêm antes das escritas, então repetidos gravam o mesmo valor.
+    local = (ys - top) * rect.width + (xs - left)
+    cover = np.zeros(rect.width * rect.height, dtype=np.uint8)
+    np.maximum.at(cover, local, alpha.astype(np.uint8))
+    alpha = cover[local]
+    if surface.get_flags() & pygame.SRCALPHA:
+        rgb = pygame.surfarray.pixels3d(surface)
+        alphas = pygame.surfarray.pixels_alpha(surface)
+        cover = alpha[:, None] / 255.0
+        under = alphas[xs, ys, None] / 255.0 * (1 - cover)
+        total = cover + under
+        rgb[xs, ys] = np.rint((np.array(color[:3]) * cover + rgb[xs, ys] * under) / total)
+        alphas[xs, ys] = np.rint(total[:, 0] * 255)
+        del rgb, alphas
+    else:
+        # A mesma conta do blit RLE do SDL (usado pelas formas em cache), para
+        # o desenho direto coincidir com ele pixel a pixel: d + ((c - d) * A >> 8)
+        # = (c * A + d * (256 - A)) >> 8, e A = 255 vale a cor (A = 256). Sem
+        # negativos, dá para fazer dois canais por vez nos pixels empacotados.
+        rgb = sum(surface.get_masks()[:3])
+        even, odd = np.uint32(rgb & 0x00FF00FF), np.uint32((rgb & 0xFF00FF00) >> 8)
+        packed = np.uint32(surface.map_rgb(color) & 0xFFFFFFFF)
+        cover = COVER_WEIGHTS[alpha]
+        rest = np.uint32(256) - cover
+        # Índice linear numa vista 1D dos pixels: bem mais barato que o 2D.
+        pixels = pygame.surfarray.pixels2d(surface)
+        step = pixels.strides[1] // 4
+        if pixels.flags.f_contiguous:
+            flat = pixels.ravel(order='F')
+        else:
+            flat = np.lib.stride_tricks.as_strided(pixels, shape=(bottom * step + right + 1,), strides=(4,))
+        index = ys * step + xs
+        dst = flat[index]
+        low = (((packed & even) * cover + (dst & even) * rest) >> 8) & even
+        high = (((packed >> 8) & odd) * cover + ((dst >> 8) & odd) * rest) & (odd << 8)
+        flat[index] = (dst & np.uint32(~rgb & 0xFFFFFFFF)) | low | high
+        del pixels, flat
+    return rect
+
+def draw_line_aa(surface, start, end, color, thickness=1):
+    return blend_coverage(surface, segment_coverage([start], [end], thickness), color)
+
+def draw_circle_aa(surface, center, radius, color, thickness=1):
+    return blend_coverage(surface, circle_coverage(center, radius, thickness), color)
+
+def pixel_bounds(pixels, thickness):
+    # Centros do pincel (Nx2) ou pixels antisserrilhados (Nx3).
+    if pixels.shape[1] == 2:
+        return stamp_bounds(pixels, thickness)
+    if not len(pixels):
+        return None
+    left, top = pixels[:, :2].min(axis=0).tolist()
+    right, bottom = pixels[:, :2].max(axis=0).tolist()
+    return pygame.Rect(left, top, right - left + 1, bottom - top + 1)
+
+def paint_pixels(surface, pixels, color, thickness=1, offset=(0, 0)):
+    if pixels.shape[1] == 2:
+        return stamp_points(surface, pixels, color, thickness, offset)
+    return blend_coverage(surface, pixels, color, offset)
+
+# Arcos de círculos recortados: tuplas (início, comprimento) em radianos, com
+# ângulos medidos por atan2 nas coordenadas da tela.
+TWO_PI = 2 * math.pi
+
+def arc_contains(arcs, angles):
+    angles = np.asarray(angles, dtype=np.float64)
+    inside = np.zeros(angles.shape, dtype=bool)
+    for start, length in arcs:
+        inside |= np.mod(angles - start, TWO_PI) <= length
+    return inside
+
+def transform_arcs(arcs, linear):
+    # Leva os arcos por uma parte linear ortogonal (rotação/reflexão); numa
+    # reflexão o sentido se inverte e o arco passa a começar no antigo fim.
+    if arcs is None:
+        return None
+    flip = linear[0][0] * linear[1][1] - linear[0][1] * linear[1][0] < 0
+    result = []
+    for start, length in arcs:
+        edge = start + length if flip else start
+        x = linear[0][0] * math.cos(edge) + linear[0][1] * math.sin(edge)
+        y = linear[1][0] * math.cos(edge) + linear[1][1] * math.sin(edge)
+        result.append((math.atan2(y, x) % TWO_PI, length))
+    return tuple(result)
+
+# ================ (simplificação de traços) ================
+# Durante o desenho livre, pontos repetidos, muito próximos ou colineares
+# só movem a ponta do traço; ao soltar o mouse, Douglas–Peucker remove os
+# pontos que desviam menos que a tolerância.
+def capture_point(points, point, min_distance=STROKE_MIN_DISTANCE, collinear=STROKE_COLLINEAR):
+    if len(points) >= 2:
+        (x0, y0), (x1, y1) = points[-2], points[-1]
+        dx, dy = x1 - x0, y1 - y0
+        ex, ey = point[0] - x1, point[1] - y1
+        # Ponta ainda perto do ponto anterior, ou seguindo na mesma reta (a até
+        # collinear dela: o produto vetorial é essa distância vezes |d|): só anda.
+        length = math.hypot(dx, dy)
+        if length < min_distance or (abs(dx * ey - dy * ex) <= collinear * length and dx * ex + dy * ey >= 0):
+            points[-1] = point
+            return
+    if not points or points[-1] != point:
+        points.append(point)
+
+def simplify_stroke(points, tolerance=STROKE_TOLERANCE):
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if len(points) < 3 or tolerance <= 0:
+        return points
+    keep = np.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        rest = points[first + 1:last] - points[first]
+        dx, dy = points[last] - points[first]
+        norm = math.hypot(dx, dy)
+        if norm:
+            dist = np.abs(rest[:, 0] * dy - rest[:, 1] * dx) / norm
         else:
-            d += 4 * x + 6
-        draw_circle_points(cx, cy, x, y)
+            dist = np.hypot(rest[:, 0], rest[:, 1])
+        k = int(np.argmax(dist))
+        if dist[k] > tolerance:
+            mid = first + 1 + k
+            keep[mid] = True
+            stack.append((first, mid))
+            stack.append((mid, last))
+    return points[keep]
 
 # ================ (clipping) ================ 
 INSIDE, LEFT, RIGHT, BOTTOM, TOP = 0, 1, 2, 4, 8
@@ -161,49 +633,292 @@ def liang_barsky_clip(line, clip_rect):
     new_end = (x0 + u2 * dx, y0 + u2 * dy)
     return [new_start, new_end]
 
-# Rcorte de Sutherland–Hodgman polígonos.
-def sutherland_hodgman_clip(polygon, clip_rect):
-    def inside(p, edge):
-        x, y = p
-        if edge == 'left':
-            return x >= clip_rect.left
-        elif edge == 'right':
-            return x <= clip_rect.right
-        elif edge == 'top':
-            return y >= clip_rect.top
-        elif edge == 'bottom':
-            return y <= clip_rect.bottom
-    def intersection(p1, p2, edge):
-        x1, y1 = p1
-        x2, y2 = p2
-        if edge in ['left', 'right']:
-            x_edge = clip_rect.left if edge == 'left' else clip_rect.right
-            t = (x_edge - x1) / (x2 - x1) if x2 != x1 else 0
-            y = y1 + t * (y2 - y1)
-            return (x_edge, y)
+# Versões em lote: segments é Nx4 (x0, y0, x1, y1). Devolvem os segmentos
+# recortados (Nx4) e a máscara dos aceitos, com a mesma aritmética das
+# versões acima.
+def compute_out_codes(xs, ys, rect):
+    codes = np.where(xs < rect.left, LEFT, np.where(xs > rect.right, RIGHT, INSIDE))
+    codes |= np.where(ys < rect.top, TOP, np.where(ys > rect.bottom, BOTTOM, INSIDE))
+    return codes
+
+def cohen_sutherland_clip_batch(segments, clip_rect):
+    segments = np.array(segments, dtype=np.float64).reshape(-1, 4)
+    codes0 = compute_out_codes(segments[:, 0], segments[:, 1], clip_rect)
+    codes1 = compute_out_codes(segments[:, 2], segments[:, 3], clip_rect)
+    accept = np.zeros(len(segments), dtype=bool)
+    active = np.ones(len(segments), dtype=bool)
+    while True:
+        inside = active & ((codes0 | codes1) == 0)
+        accept |= inside
+        active &= ~inside & ((codes0 & codes1) == 0)
+        if not active.any():
+            break
+        # Cada passada move um extremo de fora de todos os segmentos pendentes.
+        idx = np.flatnonzero(active)
+        first = codes0[idx] != 0
+        outcode_out = np.where(first, codes0[idx], codes1[idx])
+        x0, y0, x1, y1 = segments[idx].T
+        x = np.empty(len(idx))
+        y = np.empty(len(idx))
+        top = (outcode_out & TOP) != 0
+        bottom = ~top & ((outcode_out & BOTTOM) != 0)
+        right = ~top & ~bottom & ((outcode_out & RIGHT) != 0)
+        left = ~top & ~bottom & ~right
+        for mask, edge in ((top, clip_rect.top), (bottom, clip_rect.bottom)):
+            x[mask] = x0[mask] + (x1[mask] - x0[mask]) * (edge - y0[mask]) / (y1[mask] - y0[mask])
+            y[mask] = edge
+        for mask, edge in ((right, clip_rect.right), (left, clip_rect.left)):
+            y[mask] = y0[mask] + (y1[mask] - y0[mask]) * (edge - x0[mask]) / (x1[mask] - x0[mask])
+            x[mask] = edge
+        moved0, moved1 = idx[first], idx[~first]
+        segments[moved0, 0], segments[moved0, 1] = x[first], y[first]
+        segments[moved1, 2], segments[moved1, 3] = x[~first], y[~first]
+        codes0[moved0] = compute_out_codes(x[first], y[first], clip_rect)
+        codes1[moved1] = compute_out_codes(x[~first], y[~first], clip_rect)
+    return segments, accept
+
+def liang_barsky_clip_batch(segments, clip_rect):
+    segments = np.asarray(segments, dtype=np.float64).reshape(-1, 4)
+    x0, y0, x1, y1 = segments.T
+    dx = x1 - x0
+    dy = y1 - y0
+    p = np.stack((-dx, dx, -dy, dy), axis=1)
+    q = np.stack((x0 - clip_rect.left, clip_rect.right - x0,
+                  y0 - clip_rect.top, clip_rect.bottom - y0), axis=1)
+    accept = ~((p == 0) & (q < 0)).any(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = q / p
+    u1 = np.maximum(0, np.where(p < 0, t, -np.inf).max(axis=1))
+    u2 = np.minimum(1, np.where(p > 0, t, np.inf).min(axis=1))
+    accept &= u1 <= u2
+    clipped = np.stack((x0 + u1 * dx, y0 + u1 * dy, x0 + u2 * dx, y0 + u2 * dy), axis=1)
+    return clipped, accept
+
+# Recorta várias polilinhas (pontos concatenados + offsets) numa passada:
+# todos os segmentos vão juntos para o recortador em lote e os aceitos são
+# emendados em trechos contínuos. Devolve (polilinha de cada trecho, trechos).
+def clip_polylines(points, offsets, clip_rect, clip_batch=liang_barsky_clip_batch):
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    owners = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    # Segmento k liga o ponto first[k] ao seguinte da mesma polilinha.
+    first = np.flatnonzero(owners[:-1] == owners[1:])
+    if not len(first):
+        return np.empty(0, dtype=np.int64), []
+    clipped, accept = clip_batch(np.hstack((points[first], points[first + 1])), clip_rect)
+    inside = compute_out_codes(points[:, 0], points[:, 1], clip_rect) == 0
+    # Extremos dentro da janela não mudam: usa o vértice original, exato.
+    starts = np.where(inside[first, None], points[first], clipped[:, :2])
+    ends = np.where(inside[first + 1, None], points[first + 1], clipped[:, 2:])
+    # O trecho continua enquanto segmentos aceitos consecutivos se encontram
+    # num vértice dentro da janela; senão a polilinha saiu e voltou.
+    continues = np.zeros(len(first), dtype=bool)
+    continues[1:] = accept[:-1] & accept[1:] & (first[1:] == first[:-1] + 1) & inside[first[1:]]
+    keep = np.flatnonzero(accept)
+    new_run = ~continues[keep]
+    pairs = np.stack((starts[keep], ends[keep]), axis=1)
+    emit = np.stack((new_run, np.ones(len(keep), dtype=bool)), axis=1)
+    run_sizes = np.bincount(np.cumsum(new_run) - 1, weights=new_run + 1).astype(np.int64)
+    runs = np.split(pairs[emit], np.cumsum(run_sizes)[:-1])
+    return owners[first[keep[new_run]]], runs
+
+# Arcos (início, comprimento) do contorno de um círculo dentro do retângulo,
+# opcionalmente restritos aos arcos que ele já tinha. Tupla vazia: nada sobra.
+def clip_circle_arcs(center, radius, clip_rect, arcs=None):
+    cx, cy = float(center[0]), float(center[1])
+    cuts = [0.0]
+    for edge in (clip_rect.left, clip_rect.right):
+        dx = edge - cx
+        if abs(dx) < radius:
+            h = math.sqrt(radius * radius - dx * dx)
+            cuts += [math.atan2(h, dx), math.atan2(-h, dx)]
+    for edge in (clip_rect.top, clip_rect.bottom):
+        dy = edge - cy
+        if abs(dy) < radius:
+            w = math.sqrt(radius * radius - dy * dy)
+            cuts += [math.atan2(dy, w), math.atan2(dy, -w)]
+    if arcs is not None:
+        cuts += [angle for start, length in arcs for angle in (start, start + length)]
+    cuts = sorted(angle % TWO_PI for angle in cuts)
+    cuts.append(cuts[0] + TWO_PI)
+    kept = []
+    for a, b in zip(cuts, cuts[1:]):
+        if b - a <= 1e-12:
+            continue
+        # Cada intervalo entre cortes está todo dentro ou todo fora: testa o meio.
+        mid = (a + b) / 2
+        x, y = cx + radius * math.cos(mid), cy + radius * math.sin(mid)
+        if not (clip_rect.left <= x <= clip_rect.right and clip_rect.top <= y <= clip_rect.bottom):
+            continue
+        if arcs is not None and not arc_contains(arcs, mid):
+            continue
+        if kept and abs(kept[-1][0] + kept[-1][1] - a) <= 1e-12:
+            kept[-1] = (kept[-1][0], b - kept[-1][0])
         else:
-            y_edge = clip_rect.top if edge == 'top' else clip_rect.bottom
-            t = (y_edge - y1) / (y2 - y1) if y2 != y1 else 0
-            x = x1 + t * (x2 - x1)
-            return (x, y_edge)
-    def clip_polygon(poly, edge):
-        clipped = []
-        if not poly:
-            return clipped
-        prev = poly[-1]
-        for curr in poly:
-            if inside(curr, edge):
-                if not inside(prev, edge):
-                    clipped.append(intersection(prev, curr, edge))
-                clipped.append(curr)
-            elif inside(prev, edge):
-                clipped.append(intersection(prev, curr, edge))
-            prev = curr
-        return clipped
-    for edge in ['left', 'right', 'top', 'bottom']:
-        polygon = clip_polygon(polygon, edge)
-    return polygon
+            kept.append((a, b - a))
+    # Emenda o último arco com o primeiro quando se tocam em cuts[0].
+    if len(kept) > 1 and kept[0][0] == cuts[0] and abs(kept[-1][0] + kept[-1][1] - cuts[-1]) <= 1e-12:
+        kept[0] = (kept[-1][0], kept[-1][1] + kept[0][1])
+        kept.pop()
+    return tuple((start % TWO_PI, length) for start, length in kept)
+
+# Rcorte de Sutherland–Hodgman polígonos. Cada borda da janela é um estágio
+# (gerador) que consome os vértices do anterior e já repassa os seus, sem
+# listas intermediárias; a borda é descrita pelo eixo, pelo valor e pelo
+# lado que fica dentro (sign), em vez de nomes comparados a cada vértice.
+def clip_edge(vertices, axis, bound, sign):
+    first = prev = prev_in = None
+    for curr in vertices:
+        curr_in = sign * (curr[axis] - bound) >= 0
+        if first is None:
+            first, first_in = curr, curr_in
+        else:
+            if curr_in != prev_in:
+                yield edge_intersection(prev, curr, axis, bound)
+            if curr_in:
+                yield curr
+        prev, prev_in = curr, curr_in
+    # A aresta de fechamento (último -> primeiro) fica para o fim do fluxo.
+    if first is not None:
+        if first_in != prev_in:
+            yield edge_intersection(prev, first, axis, bound)
+        if first_in:
+            yield first
+
+def edge_intersection(p1, p2, axis, bound):
+    other = 1 - axis
+    t = (bound - p1[axis]) / (p2[axis] - p1[axis]) if p2[axis] != p1[axis] else 0
+    value = p1[other] + t * (p2[other] - p1[other])
+    return (bound, value) if axis == 0 else (value, bound)
+
+def sutherland_hodgman_clip(polygon, clip_rect):
+    vertices = iter(polygon)
+    for axis, bound, sign in ((0, clip_rect.left, 1), (0, clip_rect.right, -1),
+                              (1, clip_rect.top, 1), (1, clip_rect.bottom, -1)):
+        vertices = clip_edge(vertices, axis, bound, sign)
+    return list(vertices)
+
+# Recorte de Weiler–Atherton para polígonos côncavos: cada parte do polígono
+# dentro da janela vira um polígono separado, fechado pela borda da janela
+# (o Sutherland–Hodgman liga as partes com arestas degeneradas sobre a borda).
+# Devolve uma lista de polígonos.
+def weiler_atherton_clip(polygon, clip_rect):
+    points = [(float(x), float(y)) for x, y in polygon]
+    left, top, right, bottom = clip_rect.left, clip_rect.top, clip_rect.right, clip_rect.bottom
+    if len(points) < 3 or right <= left or bottom <= top:
+        return []
+    width, height = right - left, bottom - top
+    perimeter = 2 * (width + height)
+    corners = [(left, top), (right, top), (right, bottom), (left, bottom)]
+    # A borda é percorrida no mesmo sentido do polígono.
+    area = sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in zip(points, points[1:] + points[:1]))
+    forward = area >= 0
 
+    def inside(x, y):
+        return left <= x <= right and top <= y <= bottom
+
+    def position(point):
+        # Coordenada ao longo da borda de um ponto sobre ela.
+        x, y = point
+        _, s = min((abs(y - top), x - left), (abs(x - right), width + y - top),
+                   (abs(y - bottom), width + height + right - x),
+                   (abs(x - left), 2 * width + height + bottom - y))
+        return s % perimeter if forward else -s % perimeter
+
+    # Divide cada aresta nos pontos em que cruza as retas da janela e marca
+    # cada pedaço como dentro ou fora (pelo ponto médio).
+    pieces = []
+    for (x0, y0), (x1, y1) in zip(points, points[1:] + points[:1]):
+        dx, dy = x1 - x0, y1 - y0
+        cuts = {0.0, 1.0}
+        for bound in (left, right):
+            if dx:
+                cuts.add((bound - x0) / dx)
+        for bound in (top, bottom):
+            if dy:
+                cuts.add((bound - y0) / dy)
+        cuts = sorted(t for t in cuts if 0.0 <= t <= 1.0)
+        for t0, t1 in zip(cuts, cuts[1:]):
+            if t1 - t0 <= 1e-12:
+                continue
+            mid = (t0 + t1) / 2
+            start = (x0 + t0 * dx, y0 + t0 * dy) if t0 else (x0, y0)
+            end = (x0 + t1 * dx, y0 + t1 * dy) if t1 != 1.0 else (x1, y1)
+            pieces.append((start, end, inside(x0 + mid * dx, y0 + mid * dy)))
+    if all(status for _, _, status in pieces):
+        return [points]
+    if not any(status for _, _, status in pieces):
+        # Sem partes dentro: ou a janela inteira está dentro do polígono ou nada sobra.
+        cx, cy = (left + right) / 2, (top + bottom) / 2
+        crossings = sum(1 for (x0, y0), (x1, y1) in zip(points, points[1:] + points[:1])
+                        if (y0 > cy) != (y1 > cy) and cx < x0 + (cy - y0) * (x1 - x0) / (y1 - y0))
+        if crossings % 2:
+            return [corners if forward else corners[::-1]]
+        return []
+    # Trechos contínuos dentro da janela: cada um entra e sai pela borda.
+    first = next(k for k in range(len(pieces)) if pieces[k][2] and not pieces[k - 1][2])
+    runs = []
+    for k in range(first, first + len(pieces)):
+        start, end, status = pieces[k % len(pieces)]
+        if not status:
+            continue
+        if not pieces[k % len(pieces) - 1][2]:
+            runs.append([start])
+        runs[-1].append(end)
+    entries = [position(run[0]) for run in runs]
+    corner_positions = [position(corner) for corner in corners]
+    result = []
+    used = [False] * len(runs)
+    for k in range(len(runs)):
+        polygon = []
+        while not used[k]:
+            used[k] = True
+            polygon.extend(runs[k])
+            # Da saída, segue pela borda até a próxima entrada, pegando os cantos.
+            exit_at = position(runs[k][-1])
+            k = min(range(len(runs)), key=lambda j: (entries[j] - exit_at) % perimeter)
+            gap = (entries[k] - exit_at) % perimeter
+            polygon.extend(corner for _, corner in sorted(
+                ((s - exit_at) % perimeter, corner) for s, corner in zip(corner_positions, corners)
+                if 0 < (s - exit_at) % perimeter < gap))
+        if len(polygon) >= 3:
+            result.append(polygon)
+    return result
+
+
+# ================ (textos e botões) ================
+# Fontes criadas uma vez só (SysFont é lento) e textos/botões renderizados
+# guardados por chave, para a interface ser apenas blits a cada quadro.
+_FONTS = {}
+_TEXTS = {}
+_BUTTON_FACES = {}
+TEXT_CACHE_LIMIT = 1024
+
+def get_font(size, name='Arial'):
+    font = _FONTS.get((name, size))
+    if font is None:
+        font = _FONTS[(name, size)] = pygame.font.SysFont(name, size)
+    return font
+
+def render_text(text, size, color=COLORS['text']):
+    key = (size, text, color)
+    surface = _TEXTS.get(key)
+    if surface is None:
+        if len(_TEXTS) >= TEXT_CACHE_LIMIT:
+            _TEXTS.clear()
+        surface = _TEXTS[key] = get_font(size).render(text, True, color)
+    return surface
+
+def button_face(size, text, color):
+    # Fundo arredondado com o rótulo; os cantos ficam transparentes.
+    key = (size, text, color)
+    face = _BUTTON_FACES.get(key)
+    if face is None:
+        if len(_BUTTON_FACES) >= TEXT_CACHE_LIMIT:
+            _BUTTON_FACES.clear()
+        face = _BUTTON_FACES[key] = pygame.Surface(size, pygame.SRCALPHA)
+        pygame.draw.rect(face, color, face.get_rect(), border_radius=3)
+        face.blit(render_text(text, 14), (5, 5))
+    return face
 
 # Botoes
 class Button:
@@ -211,75 +926,1711 @@ class Button:
         self.rect = pygame.Rect(rect)
         self.text = text
         self.callback = callback
-        self.font = pygame.font.SysFont('Arial', 14)
     def draw(self, surface):
         mouse_pos = pygame.mouse.get_pos()
         color = COLORS['active'] if self.rect.collidepoint(mouse_pos) else COLORS['button']
-        pygame.draw.rect(surface, color, self.rect, border_radius=3)
-        txt = self.font.render(self.text, True, COLORS['text'])
-        surface.blit(txt, (self.rect.x + 5, self.rect.y + 5))
+        surface.blit(button_face(self.rect.size, self.text, color), self.rect)
     def is_clicked(self, event):
         if event.type == pygame.MOUSEBUTTONDOWN and self.rect.collidepoint(event.pos):
             self.callback()
 
+# ================ (cache de superfícies) ================
+# Cada forma guarda sua rasterização numa superfície recortada; o cache só
+# controla o orçamento em bytes e descarta as menos usadas (LRU).
+class SurfaceCache:
+    def __init__(self, budget):
+        self.budget = budget
+        self.used = 0
+        self.frame = 0
+        self.entries = OrderedDict()
+
+    def next_frame(self):
+        self.frame += 1
+
+    def store(self, shape, nbytes):
+        # Nunca descarta superfícies já usadas neste quadro: se a cena não
+        # cabe no orçamento, as que sobram são desenhadas direto em vez de
+        # expulsarem umas às outras a cada quadro.
+        self.discard(shape)
+        while self.used + nbytes > self.budget:
+            if not self.entries:
+                return False
+            old = next(iter(self.entries))
+            size, frame = self.entries[old]
+            if frame == self.frame:
+                return False
+            del self.entries[old]
+            old._cache = None
+            self.used -= size
+        self.entries[shape] = (nbytes, self.frame)
+        self.used += nbytes
+        return True
+
+    def touch(self, shape):
+        entry = self.entries.get(shape)
+        if entry is not None:
+            self.entries[shape] = (entry[0], self.frame)
+            self.entries.move_to_end(shape)
+
+    def discard(self, shape):
+        entry = self.entries.pop(shape, None)
+        if entry is not None:
+            self.used -= entry[0]
+
+    def clear(self):
+        for shape in self.entries:
+            shape._cache = None
+        self.entries.clear()
+        self.used = 0
+
+SHAPE_CACHE = SurfaceCache(SHAPE_CACHE_BUDGET)
+
+# ================ (hierarquia de volumes) ================
+# Geometria exata para testes de clique e limites sob transformações, no
+# referencial dos pontos base (vale para qualquer matriz pendente).
+def convex_hull(points):
+    # Índices dos vértices do fecho convexo (cadeia monótona de Andrew). Antes,
+    # os pontos estritamente dentro do polígono dos extremos em 8 direções
+    # (Akl–Toussaint) são descartados de uma vez.
+    points = np.asarray(points, dtype=np.float64)
+    if len(points) <= 3:
+        return np.arange(len(points))
+    x, y = points[:, 0], points[:, 1]
+    ring = [x.argmin(), (x + y).argmin(), y.argmin(), (x - y).argmax(),
+            x.argmax(), (x + y).argmax(), y.argmax(), (x - y).argmin()]
+    ring = [i for k, i in enumerate(ring) if not np.array_equal(points[i], points[ring[k - 1]])]
+    candidates = np.arange(len(points))
+    if len(ring) >= 3:
+        a = points[ring]
+        b = np.roll(a, -1, axis=0)
+        sign = np.sign(np.sum(a[:, 0] * b[:, 1] - b[:, 0] * a[:, 1]))
+        inside = np.ones(len(points), dtype=bool)
+        for (ax, ay), (bx, by) in zip(a.tolist(), b.tolist()):
+            inside &= sign * ((bx - ax) * (y - ay) - (by - ay) * (x - ax)) > 0
+        candidates = np.flatnonzero(~inside)
+    order = candidates[np.lexsort((y[candidates], x[candidates]))].tolist()
+    px, py = x.tolist(), y.tolist()
+
+    def chain(indices):
+        result = []
+        for i in indices:
+            while len(result) >= 2:
+                o, a = result[-2], result[-1]
+                if (px[a] - px[o]) * (py[i] - py[o]) - (py[a] - py[o]) * (px[i] - px[o]) > 0:
+                    break
+                result.pop()
+            result.append(i)
+        return result
+
+    lower, upper = chain(order), chain(reversed(order))
+    return np.array(lower[:-1] + upper[:-1], dtype=np.int64)
+
+def segment_distances(point, starts, ends):
+    # Distância do ponto a cada segmento (starts[i], ends[i]).
+    starts = np.asarray(starts, dtype=np.float64)
+    delta = np.asarray(ends, dtype=np.float64) - starts
+    offset = np.asarray(point, dtype=np.float64) - starts
+    length = np.maximum(np.einsum('ij,ij->i', delta, delta), 1e-12)
+    t = np.clip(np.einsum('ij,ij->i', offset, delta) / length, 0.0, 1.0)
+    return np.hypot(*(offset - t[:, None] * delta).T)
+
+class SegmentBVH:
+    # Caixas de BVH_LEAF segmentos consecutivos (vizinhos no traço também são
+    # vizinhos no espaço), unidas de duas em duas até a raiz. Um teste de
+    # ponto desce só pelos ramos cujas caixas o alcançam: O(log n).
+    def __init__(self, points, closed=False, leaf=BVH_LEAF):
+        self.points = points
+        self.closed = closed
+        self.leaf = leaf
+        self.count = len(points) if closed else max(len(points) - 1, 1)
+        starts, ends = self.segments(np.arange(self.count))
+        low, high = np.minimum(starts, ends), np.maximum(starts, ends)
+        pad = -self.count % leaf
+        if pad:
+            low = np.concatenate((low, np.repeat(low[-1:], pad, axis=0)))
+            high = np.concatenate((high, np.repeat(high[-1:], pad, axis=0)))
+        boxes = np.concatenate((low.reshape(-1, leaf, 2).min(axis=1),
+                                high.reshape(-1, leaf, 2).max(axis=1)), axis=1)
+        self.levels = [boxes]
+        while len(boxes) > 1:
+            if len(boxes) % 2:
+                boxes = np.concatenate((boxes, boxes[-1:]))
+            pairs = boxes.reshape(-1, 2, 4)
+            boxes = np.concatenate((pairs[:, :, :2].min(axis=1), pairs[:, :, 2:].max(axis=1)), axis=1)
+            self.levels.append(boxes)
+
+    def segments(self, index):
+        ends = index + 1
+        ends = ends % len(self.points) if self.closed else np.minimum(ends, len(self.points) - 1)
+        return self.points[index], self.points[ends]
+
+    def candidates(self, x, y, radius):
+        # Índices dos segmentos cujas caixas ficam a até radius do ponto.
+        nodes = np.zeros(1, dtype=np.int64)
+        for depth, boxes in enumerate(reversed(self.levels)):
+            if depth:
+                nodes = np.concatenate((2 * nodes, 2 * nodes + 1))
+                nodes = nodes[nodes < len(boxes)]
+            box = boxes[nodes]
+            nodes = nodes[(box[:, 0] - radius <= x) & (box[:, 2] + radius >= x) &
+                          (box[:, 1] - radius <= y) & (box[:, 3] + radius >= y)]
+            if not len(nodes):
+                break
+        index = (nodes[:, None] * self.leaf + np.arange(self.leaf)).ravel()
+        return index[index < self.count]
+
+# ================ (índice espacial) ================
+# Grade uniforme: cada forma é registrada nas células que sua caixa cobre.
+# Formas que cobrem células demais ficam numa lista à parte, sempre testada.
+# rebuild monta a grade em lote, como arrays (células ordenadas -> linhas das
+# formas), sem um objeto por célula; inserções e remoções posteriores vão para
+# os dicionários, e as formas da base que mudaram ficam em stale.
+CELL_KEY = 1 << 32
+
+class SpatialGrid:
+    def __init__(self, cell=GRID_CELL, max_cells=1024):
+        self.cell = cell
+        self.max_cells = max_cells
+        self.cells = {}
+        self.shape_cells = {}
+        self.large = set()
+        self.order = {}
+        self.counter = 0
+        self.static = []
+        self.static_keys = np.empty(0, dtype=np.int64)
+        self.static_cells = np.empty((0, 2), dtype=np.int64)
+        self.static_starts = np.zeros(1, dtype=np.int64)
+        self.static_rows = np.empty(0, dtype=np.int64)
+        self.static_large = np.empty(0, dtype=np.int64)
+        self.stale = set()
+
+    def _cell_range(self, left, top, right, bottom):
+        c = self.cell
+        return (math.floor(left / c), math.floor(top / c),
+                math.floor(right / c), math.floor(bottom / c))
+
+    def insert(self, shape, bounds=None):
+        if shape not in self.order:
+            self.order[shape] = self.counter
+            self.counter += 1
+        # Margem de 2px cobre o truncamento do pygame.Rect da forma.
+        left, top, right, bottom = bounds or shape.bounds()
+        i0, j0, i1, j1 = self._cell_range(left - 2, top - 2, right + 2, bottom + 2)
+        if (i1 - i0 + 1) * (j1 - j0 + 1) > self.max_cells:
+            self.large.add(shape)
+            self.shape_cells[shape] = ()
+            return
+        keys = [(i, j) for i in range(i0, i1 + 1) for j in range(j0, j1 + 1)]
+        for key in keys:
+            self.cells.setdefault(key, set()).add(shape)
+        self.shape_cells[shape] = keys
+
+    def remove(self, shape):
+        for key in self.shape_cells.pop(shape, ()):
+            bucket = self.cells[key]
+            bucket.discard(shape)
+            if not bucket:
+                del self.cells[key]
+        self.large.discard(shape)
+        # Na base a ordem de desenho é a própria linha da forma.
+        if self.order.pop(shape, len(self.static)) < len(self.static):
+            self.stale.add(shape)
+
+    def update(self, shape):
+        order = self.order.get(shape)
+        self.remove(shape)
+        if order is not None:
+            self.order[shape] = order
+        self.insert(shape)
+
+    def rebuild(self, shapes, bounds=None):
+        self.cells.clear()
+        self.shape_cells.clear()
+        self.large.clear()
+        self.stale.clear()
+        self.static = list(shapes)
+        if bounds is None:
+            bounds = shape_bounds(self.static)
+        bounds = np.asarray(bounds, dtype=np.float64).reshape(-1, 4)
+        low = np.floor((bounds[:, :2] - 2) / self.cell).astype(np.int64)
+        size = np.floor((bounds[:, 2:] + 2) / self.cell).astype(np.int64) - low + 1
+        counts = size[:, 0] * size[:, 1]
+        large = counts > self.max_cells
+        small = np.flatnonzero(~large)
+        counts = counts[small]
+        # Uma entrada (célula, linha) por célula coberta, ordenada pela célula;
+        # a ordenação estável mantém as linhas em ordem dentro de cada célula.
+        rows = np.repeat(small, counts)
+        k = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+        i = low[rows, 0] + k // size[rows, 1]
+        j = low[rows, 1] + k % size[rows, 1]
+        keys = i * CELL_KEY + j
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        first = np.flatnonzero(np.diff(keys, prepend=keys[:1] - 1))
+        self.static_keys = keys[first]
+        self.static_cells = np.stack((i[order[first]], j[order[first]]), axis=1)
+        self.static_starts = np.append(first, len(keys))
+        self.static_rows = rows[order]
+        self.static_large = np.flatnonzero(large)
+        self.order = dict(zip(self.static, range(len(self.static))))
+        self.counter = len(self.static)
+
+    def static_query(self, i0, j0, i1, j1):
+        # Linhas da base (ordenadas) nas células do intervalo.
+        keys = self.static_keys
+        if (i1 - i0 + 1) * (j1 - j0 + 1) > len(keys):
+            cells = self.static_cells
+            hit = np.flatnonzero((cells[:, 0] >= i0) & (cells[:, 0] <= i1) &
+                                 (cells[:, 1] >= j0) & (cells[:, 1] <= j1))
+        else:
+            wanted = (np.arange(i0, i1 + 1)[:, None] * CELL_KEY + np.arange(j0, j1 + 1)).ravel()
+            hit = np.searchsorted(keys, wanted)
+            found = hit < len(keys)
+            hit = hit[found][keys[hit[found]] == wanted[found]]
+        starts = self.static_starts[hit]
+        lengths = self.static_starts[hit + 1] - starts
+        index = np.arange(int(lengths.sum())) + np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return np.unique(np.concatenate((self.static_rows[index], self.static_large)))
+
+    def query_rect(self, rect):
+        # Candidatas cuja caixa pode tocar o retângulo, na ordem de desenho.
+        area = pygame.Rect(rect)
+        area.normalize()
+        i0, j0, i1, j1 = self._cell_range(area.left, area.top, area.right, area.bottom)
+        static = self.static
+        result = [static[row] for row in self.static_query(i0, j0, i1, j1).tolist()]
+        if self.stale:
+            result = [shape for shape in result if shape not in self.stale]
+        found = set(self.large)
+        if (i1 - i0 + 1) * (j1 - j0 + 1) > len(self.cells):
+            for (i, j), bucket in self.cells.items():
+                if i0 <= i <= i1 and j0 <= j <= j1:
+                    found |= bucket
+        else:
+            for i in range(i0, i1 + 1):
+                for j in range(j0, j1 + 1):
+                    bucket = self.cells.get((i, j))
+                    if bucket:
+                        found |= bucket
+        if not found:
+            return result
+        found.update(result)
+        return sorted(found, key=self.order.__getitem__)
+
+    def query_point(self, pos):
+        return self.query_rect((pos[0], pos[1], 0, 0))
+
+def as_points(points):
+    # Pontos como bloco contíguo float32 Nx2, somente leitura: transformações
+    # e recortes sempre criam arrays novos, e o histórico compartilha os antigos.
+    # Arrays que já estão no formato (ex.: vistas do arquivo mapeado) não são copiados.
+    if (isinstance(points, np.ndarray) and points.dtype == np.float32 and points.ndim == 2
+            and points.shape[1] == 2 and not points.flags.writeable):
+        return points
+    array = np.array(points, dtype=np.float32).reshape(-1, 2)
+    array.flags.writeable = False
+    return array
+
+IDENTITY = np.eye(3)
+IDENTITY.flags.writeable = False
+
+def linear_part(matrix):
+    return IDENTITY[:2, :2] if matrix is None else matrix[:2, :2]
+
+def transform_points(points, matrix, shift=(0, 0)):
+    # x' = a*x + b*y + (c - deslocamento) em float64, sempre nessa ordem e
+    # sem BLAS, para que consolidar, salvar e desenhar dêem os mesmos valores.
+    points = np.asarray(points, dtype=np.float64)
+    return points[:, 0:1] * matrix[:2, 0] + points[:, 1:2] * matrix[:2, 1] + (matrix[:2, 2] - shift)
+
 # Representa as formas desenhadas.
 class Shape:
+    __slots__ = ('type', 'revision', '_cache', '_points', 'matrix', '_extent', 'color',
+                 'radius', 'arcs', 'thickness', 'selected', 'bounding_box', '_hull', '_bvh',
+                 '_source', '_row')
+
     def __init__(self, shape_type, points, color, **kwargs):
+        self._source = None
+        self._row = None
         self.type = shape_type  
-        self.points = [tuple(p) for p in points]
+        self.revision = 0
+        self._cache = None
+        self.points = points
         self.color = color
         self.radius = kwargs.get('radius', 0)
+        self.arcs = kwargs.get('arcs')  # círculo recortado: arcos que sobraram
         self.thickness = kwargs.get('thickness', 2)
         self.selected = False
+        # Fecho convexo e hierarquia de segmentos dos pontos base, calculados sob demanda.
+        self._hull = None
+        self._bvh = None
+        # Limites já conhecidos (ex.: lidos do arquivo) evitam varrer os pontos.
+        self._extent = kwargs.get('extent')
         self.bounding_box = self.calculate_bounding_box()
+
+    @classmethod
+    def unloaded(cls, source, row, shape_type, color, radius, thickness, arcs, bounding_box):
+        # Forma de um arquivo de cena montada só com a tabela (os atributos de
+        # __init__, sem calcular nada): load() lê os pontos no primeiro uso de base.
+        shape = cls.__new__(cls)
+        shape._source, shape._row = source, row
+        shape.type, shape.color, shape.radius, shape.thickness, shape.arcs = shape_type, color, radius, thickness, arcs
+        shape._points = shape.matrix = shape._extent = shape._cache = shape._hull = shape._bvh = None
+        shape.revision, shape.selected, shape.bounding_box = 1, False, bounding_box
+        return shape
+
+    def load(self):
+        if self._source is not None:
+            self.extent()
+            self._points = self._source.shape_points(self._row)
+            self._source = None
+
+    # Os pontos guardados (base) recebem uma transformação pendente (matrix,
+    # 3x3 ou None), composta a cada operação e só aplicada de fato quando
+    # alguém lê points (recorte, salvar) ou ao consolidar (flatten).
+    @property
+    def points(self):
+        if self.matrix is None:
+            return self.base
+        return as_points(transform_points(self.base, self.matrix))
+
+    # Toda troca de pontos (recorte, consolidação) invalida a rasterização.
+    @points.setter
+    def points(self, points):
+        self._points = as_points(points)
+        self._source = None
+        self.matrix = None
+        self._extent = None
+        self.revision += 1
+
+    @property
+    def base(self):
+        self.load()
+        return self._points
+
+    @property
+    def geometry(self):
+        # Estado imutável (pontos base, matriz, arcos) guardado pelo histórico.
+        return (self.base, self.matrix, self.arcs)
+
+    def restore_geometry(self, geometry):
+        # Reaproveita os arrays guardados no histórico, sem copiar.
+        points, matrix, self.arcs = geometry
+        if points is not self.base:
+            self._points = points
+            self._extent = None
+            self.revision += 1
+        self.set_matrix(matrix)
+
+    def set_matrix(self, matrix, extent=None):
+        # extent: limites já calculados dos pontos sob a parte linear da matriz.
+        # Matrizes já somente leitura (ex.: vindas do histórico) são reaproveitadas.
+        if matrix is not None and (not isinstance(matrix, np.ndarray) or matrix.flags.writeable):
+            matrix = np.array(matrix, dtype=np.float64)
+            matrix.flags.writeable = False
+        if extent is not None:
+            self._extent = extent
+        elif not np.array_equal(linear_part(matrix), linear_part(self.matrix)):
+            self._extent = None
+        self.matrix = matrix
+
+    def transform(self, matrix):
+        self.set_matrix(matrix if self.matrix is None else matrix @ self.matrix)
+
+    def flatten(self):
+        if self.matrix is not None:
+            arcs = transform_arcs(self.arcs, self.matrix[:2, :2])
+            self.points = self.points
+            self.arcs = arcs
+
+    def __getstate__(self):
+        self.load()
+        state = {name: getattr(self, name) for name in self.__slots__}
+        state.update(_cache=None, _hull=None, _bvh=None)
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
     def calculate_bounding_box(self):
         if self.type in ['linha', 'desenho livre', 'polígono']:
-            x_coords = [p[0] for p in self.points]
-            y_coords = [p[1] for p in self.points]
-            return pygame.Rect(min(x_coords), min(y_coords),
-                               max(x_coords) - min(x_coords),
-                               max(y_coords) - min(y_coords))
+            left, top, right, bottom = self.bounds()
+            return pygame.Rect(left, top, right - left, bottom - top)
         elif self.type == 'círculo':
-            return pygame.Rect(self.points[0][0] - self.radius,
-                               self.points[0][1] - self.radius,
-                               self.radius * 2,
-                               self.radius * 2)
+            left, top, _, _ = self.bounds()
+            return pygame.Rect(left, top, self.radius * 2, self.radius * 2)
         return pygame.Rect(0, 0, 0, 0)
-    def draw(self, surface, line_algo='DDA'):
-        if self.type == 'linha':
-            if line_algo == 'DDA':
-                draw_line_dda(surface, self.points[0], self.points[1], self.color, self.thickness)
-            else:
-                draw_line_bresenham(surface, self.points[0], self.points[1], self.color, self.thickness)
+
+    def hull(self):
+        # Vértices do fecho convexo dos pontos base (guardados até os pontos mudarem).
+        points = self.base
+        if self._hull is None or self._hull[0] is not points:
+            self._hull = (points, points[convex_hull(points)])
+        return self._hull[1]
+
+    def segment_bvh(self):
+        if self._bvh is None or self._bvh.points is not self.base:
+            self._bvh = SegmentBVH(self.base, closed=self.type == 'polígono')
+        return self._bvh
+
+    def local_bounds(self):
+        # Extremos dos pontos base sob a parte linear da matriz (sem translação).
+        # Os extremos de uma transformação afim estão nos vértices do fecho
+        # convexo: só eles são transformados.
+        points = self.base
+        if self.matrix is not None:
+            points = self.hull() @ self.matrix[:2, :2].T
+        if self.type == 'círculo':
+            cx, cy = float(points[0][0]), float(points[0][1])
+            return (cx - self.radius, cy - self.radius, cx + self.radius, cy + self.radius)
+        low = points.min(axis=0)
+        high = points.max(axis=0)
+        return (float(low[0]), float(low[1]), float(high[0]), float(high[1]))
+
+    def extent(self):
+        # local_bounds guardado até a parte linear ou os pontos mudarem; numa
+        # forma ainda não carregada, os limites vêm da tabela do arquivo.
+        if self._extent is None:
+            self._extent = self.local_bounds() if self._source is None else self._source.shape_extent(self._row)
+        return self._extent
+
+    def bounds(self):
+        # Extremos exatos (float) da geometria: (esq, topo, dir, base). Numa
+        # translação só o deslocamento muda, então o custo é O(1).
+        if self.matrix is None:
+            return self.extent()
+        tx, ty = float(self.matrix[0, 2]), float(self.matrix[1, 2])
+        left, top, right, bottom = self.extent()
+        return (left + tx, top + ty, right + tx, bottom + ty)
+
+    def hit_test(self, pos, tolerance=PICK_TOLERANCE, zoom=1.0):
+        # O ponto (mundo) está no traço? Alcance = pincel + tolerância, em px da tela.
+        reach = (self.thickness + tolerance) / zoom
+        x, y = pos
+        left, top, right, bottom = self.bounds()
+        if not (left - reach <= x <= right + reach and top - reach <= y <= bottom + reach):
+            return False
+        linear = linear_part(self.matrix)
+        if self.type == 'círculo':
+            cx, cy = self.points[0].tolist()
+            dx, dy = x - cx, y - cy
+            if abs(math.hypot(dx, dy) - self.radius) > reach:
+                return False
+            if self.arcs is None:
+                return True
+            # Os arcos estão no referencial dos pontos base.
+            dx, dy = (np.linalg.inv(linear) @ (dx, dy)).tolist()
+            return bool(arc_contains(self.arcs, [math.atan2(dy, dx)])[0])
+        # O ponto vai para o referencial da hierarquia; o alcance cresce com o
+        # maior alongamento da inversa, e a distância exata é medida no mundo.
+        radius = reach
+        if self.matrix is not None:
+            inverse = np.linalg.inv(self.matrix)
+            x0, y0 = (inverse[:2, :2] @ (x, y) + inverse[:2, 2]).tolist()
+            radius = reach * float(np.linalg.norm(inverse[:2, :2], 2))
+        else:
+            x0, y0 = x, y
+        bvh = self.segment_bvh()
+        index = bvh.candidates(x0, y0, radius)
+        if not len(index):
+            return False
+        starts, ends = bvh.segments(index)
+        if self.matrix is not None:
+            starts = starts @ linear.T + self.matrix[:2, 2]
+            ends = ends @ linear.T + self.matrix[:2, 2]
+        return bool(segment_distances((x, y), starts, ends).min() <= reach)
+
+    def dirty_rect(self, view=None):
+        # Área que o traço pode ocupar: caixa + pincel + arredondamentos,
+        # na tela quando há uma vista (o pincel não muda com o zoom).
+        pad = 2 * (self.thickness + 3)
+        return view_rect(self.bounding_box, view).inflate(pad, pad)
+
+    def view_matrix(self, view=None):
+        # Transformação até a tela: vista (zoom + deslocamento) após a pendente.
+        if view is None:
+            return self.matrix
+        return view if self.matrix is None else view @ self.matrix
+
+    def view_radius(self, view=None):
+        return self.radius if view is None else int(self.radius * view[0, 0])
+
+    def raster_state(self, view=None):
+        # A parte inteira da translação vira só deslocamento do blit; o resto
+        # (parte linear + fração) define a rasterização guardada no cache.
+        matrix = self.view_matrix(view)
+        if matrix is None:
+            linear, fraction, shift = (1.0, 0.0, 0.0, 1.0), (0.0, 0.0), np.zeros(2)
+        else:
+            offset = matrix[:2, 2]
+            shift = np.floor(offset)
+            linear = tuple(matrix[:2, :2].ravel().tolist())
+            fraction = tuple((offset - shift).tolist())
+        # Os rasterizadores truncam (como o pygame), o que só comuta com
+        # deslocamentos inteiros em coordenadas positivas: um deslocamento
+        # fixo (que só depende da parte linear) mantém os pontos rasterizados
+        # >= 1, com folga para o arredondamento em float32. Assim a forma sai
+        # igual com a transformação pendente ou já consolidada.
+        left, top = self.extent()[:2]
+        if view is not None:
+            # O zoom (uniforme, positivo) escala os extremos; o raio do círculo é arredondado.
+            zoom = float(view[0, 0])
+            left, top = left * zoom, top * zoom
+            if self.type == 'círculo':
+                left += self.radius * zoom - self.view_radius(view)
+                top += self.radius * zoom - self.view_radius(view)
+        lift = (max(0, math.floor(1 - left)), max(0, math.floor(1 - top)))
+        shift -= lift
+        if linear == (1.0, 0.0, 0.0, 1.0) and fraction == (0.0, 0.0) and lift == (0, 0):
+            return None, (int(shift[0]), int(shift[1]))
+        return (linear, fraction), (int(shift[0]), int(shift[1]))
+
+    def raster_points(self, view=None):
+        # Pontos a rasterizar, sem a parte inteira da translação. A transformação
+        # pendente é arredondada para float32 como em points, que é o que
+        # consolidar, recortar e salvar guardam: a forma não se move nessas operações.
+        state, shift = self.raster_state(view)
+        if state is None:
+            return self.base
+        points = self.base if self.matrix is None else self.points
+        return transform_points(points, IDENTITY if view is None else view, shift)
+
+    def pixel_centers(self, line_algo='DDA', view=None):
+        # Centros do pincel ou, com 'AA', pixels (x, y, alpha).
+        points = self.raster_points(view)
+        aa = line_algo == 'AA'
+        if self.type in ['linha', 'desenho livre']:
+            return polyline_coverage(points, self.thickness) if aa else polyline_points(points, line_algo)
         elif self.type == 'círculo':
-            draw_circle_bresenham(surface, self.points[0], self.radius, self.color, self.thickness)
-        elif self.type == 'desenho livre':
-            for i in range(len(self.points) - 1):
-                if line_algo == 'DDA':
-                    draw_line_dda(surface, self.points[i], self.points[i+1], self.color, self.thickness)
-                else:
-                    draw_line_bresenham(surface, self.points[i], self.points[i+1], self.color, self.thickness)
-        elif self.type == 'polígono':
-            if len(self.points) >= 3:
-                for i in range(len(self.points)):
-                    start_pt = self.points[i]
-                    end_pt = self.points[(i + 1) % len(self.points)]
-                    if line_algo == 'DDA':
-                        draw_line_dda(surface, start_pt, end_pt, self.color, self.thickness)
-                    else:
-                        draw_line_bresenham(surface, start_pt, end_pt, self.color, self.thickness)
+            if aa:
+                centers = circle_coverage(points[0], self.view_radius(view), self.thickness)
+            else:
+                centers = circle_points(points[0], self.view_radius(view))
+            if self.arcs is not None:
+                # Os arcos estão no referencial dos pontos base: desfaz a parte linear.
+                offsets = centers[:, :2] - points[0]
+                matrix = self.view_matrix(view)
+                if matrix is not None:
+                    offsets = offsets @ np.linalg.inv(matrix[:2, :2]).T
+                centers = centers[arc_contains(self.arcs, np.arctan2(offsets[:, 1], offsets[:, 0]))]
+            return centers
+        elif self.type == 'polígono' and len(points) >= 3:
+            if aa:
+                return polyline_coverage(points, self.thickness, closed=True)
+            return polyline_points(points, line_algo, closed=True)
+        return np.empty((0, 3 if aa else 2), dtype=np.int64)
+
+    def render_visible(self, surface, line_algo='DDA', view=None):
+        # Só os segmentos que tocam o recorte da superfície, desenhados direto.
+        _, (sx, sy) = self.raster_state(view)
+        points = np.asarray(self.raster_points(view), dtype=np.float64)
+        if self.type == 'polígono':
+            starts, ends = points, np.roll(points, -1, axis=0)
+        else:
+            starts, ends = points[:-1], points[1:]
+        pad = self.thickness + 2
+        clip = surface.get_clip().move(-sx, -sy).inflate(2 * pad, 2 * pad)
+        low, high = np.minimum(starts, ends), np.maximum(starts, ends)
+        keep = ((high[:, 0] >= clip.left) & (low[:, 0] <= clip.right) &
+                (high[:, 1] >= clip.top) & (low[:, 1] <= clip.bottom))
+        if line_algo == 'AA':
+            pixels = segment_coverage(starts[keep], ends[keep], self.thickness)
+            return blend_coverage(surface, pixels, self.color, offset=(-sx, -sy))
+        segments = dda_segments if line_algo == 'DDA' else bresenham_segments
+        centers = segments(starts[keep], ends[keep]) if keep.any() else np.empty((0, 2), dtype=np.int64)
+        return stamp_points(surface, centers, self.color, self.thickness, offset=(-sx, -sy))
+
+    def cache_key(self, line_algo='DDA', view=None):
+        # Chave da rasterização guardada e o deslocamento inteiro do blit.
+        state, shift = self.raster_state(view)
+        return (self.revision, state, self.view_radius(view), self.arcs, self.thickness, self.color, line_algo), shift
+
+    def is_cached(self, line_algo='DDA', view=None):
+        return self._cache is not None and self._cache[0] == self.cache_key(line_algo, view)[0]
+
+    def render(self, surface, line_algo='DDA', view=None):
+        key, (sx, sy) = self.cache_key(line_algo, view)
+        if self._cache is None or self._cache[0] != key:
+            # Polilinhas longas que saem da superfície (ex.: com zoom) não são
+            # guardadas inteiras: a cada vez só a parte visível é rasterizada.
+            if (self.type != 'círculo' and len(self.base) > 2
+                    and not surface.get_rect().contains(self.dirty_rect(view))):
+                return self.render_visible(surface, line_algo, view)
+            SHAPE_CACHE.discard(self)
+            self._cache = None
+            centers = self.pixel_centers(line_algo, view)
+            bounds = pixel_bounds(centers, self.thickness)
+            if bounds is None:
+                self._cache = (key, None, (0, 0))
+            elif not SHAPE_CACHE.store(self, bounds.width * bounds.height * 4):
+                # Fora do orçamento: desenha direto, sem guardar.
+                return paint_pixels(surface, centers, self.color, self.thickness, offset=(-sx, -sy))
+            else:
+                image = pygame.Surface(bounds.size, pygame.SRCALPHA)
+                image.fill((0, 0, 0, 0))
+                paint_pixels(image, centers, self.color, self.thickness, offset=bounds.topleft)
+                # RLE torna o blit proporcional aos pixels pintados, não à área.
+                image.set_alpha(255, pygame.RLEACCEL)
+                self._cache = (key, image, bounds.topleft)
+        image, (x, y) = self._cache[1], self._cache[2]
+        if image is None:
+            return pygame.Rect(x + sx, y + sy, 0, 0)
+        SHAPE_CACHE.touch(self)
+        return surface.blit(image, (x + sx, y + sy))
+
+    def render_direct(self, surface, line_algo='DDA', view=None):
+        # Sem cache: carimba direto na superfície (ex.: blocos em outros processos).
+        if self.type != 'círculo' and len(self.base) > 2:
+            return self.render_visible(surface, line_algo, view)
+        _, (sx, sy) = self.raster_state(view)
+        return paint_pixels(surface, self.pixel_centers(line_algo, view), self.color, self.thickness,
+                            offset=(-sx, -sy))
+
+    def draw(self, surface, line_algo='DDA', view=None):
+        self.render(surface, line_algo, view)
         if self.selected:
-            self.draw_selection(surface)
-    def draw_selection(self, surface):
-        pygame.draw.rect(surface, COLORS['highlight'], self.bounding_box.inflate(5, 5), 2)
+            self.draw_selection(surface, view)
 
-class GraphicsEditor:
-    def __init__(self):
-        self.screen = pygame.display.set_mode((WIDTH, HEIGHT))
-        pygame.display.set_caption("Editor Gráfico - TP1")
+    def draw_selection(self, surface, view=None):
+        return pygame.draw.rect(surface, COLORS['highlight'], view_rect(self.bounding_box, view).inflate(5, 5), 2)
+
+# ================ (armazenamento da cena) ================
+# Estrutura de arrays: os pontos de um lote de formas num único bloco float32
+# contíguo (com offsets) e os atributos em colunas. O lote é montado por
+# operação, só com as formas que ela muda (seleção, formas cortadas pela
+# janela): os arrays das formas são somente leitura e compartilhados com o
+# histórico, então um bloco da cena inteira teria de ser refeito a cada
+# mudança de qualquer forma. Depois de scatter, os pontos das formas do lote
+# são vistas desse bloco.
+SHAPE_TYPES = ['desenho livre', 'linha', 'círculo', 'polígono']
+
+def shape_bounds(shapes):
+    # (esq, topo, dir, base) de cada forma a partir dos limites que ela guarda,
+    # sem juntar os pontos num bloco.
+    return np.array([shape.bounds() for shape in shapes], dtype=np.float64).reshape(-1, 4)
+
+class ShapeStore:
+    def __init__(self, shapes=()):
+        self.pack(shapes)
+
+    def pack(self, shapes):
+        self.shapes = list(shapes)
+        counts = np.array([len(s.base) for s in self.shapes], dtype=np.int64)
+        self.offsets = np.zeros(len(self.shapes) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.offsets[1:])
+        if self.shapes:
+            self.points = np.concatenate([s.base for s in self.shapes])
+        else:
+            self.points = np.empty((0, 2), dtype=np.float32)
+        # Transformações pendentes de cada forma (identidade quando não há).
+        self.matrices = np.array([IDENTITY if s.matrix is None else s.matrix
+                                  for s in self.shapes]).reshape(-1, 3, 3)
+        self.lazy = any(s.matrix is not None for s in self.shapes)
+        self.types = np.array([SHAPE_TYPES.index(s.type) for s in self.shapes], dtype=np.int8)
+        self.colors = np.array([s.color for s in self.shapes], dtype=np.uint8).reshape(-1, 3)
+        self.radius = np.array([s.radius for s in self.shapes], dtype=np.float32)
+        self.thickness = np.array([s.thickness for s in self.shapes], dtype=np.int16)
+
+    def __len__(self):
+        return len(self.shapes)
+
+    def apply(self, matrices, points=None, offsets=None):
+        # Aplica uma matriz por forma (Sx3x3) a todos os pontos numa passada.
+        source = self.points if points is None else points
+        offsets = self.offsets if offsets is None else offsets
+        owners = np.repeat(np.arange(len(self.shapes)), np.diff(offsets))
+        matrices = np.asarray(matrices, dtype=np.float64)[owners]
+        # Mesma ordem de operações de transform_points.
+        source = np.asarray(source, dtype=np.float64)
+        return source[:, 0:1] * matrices[:, :2, 0] + source[:, 1:2] * matrices[:, :2, 1] + matrices[:, :2, 2]
+
+    def world_points(self):
+        return self.apply(self.matrices) if self.lazy else self.points
+
+    def bounds(self, matrices=None, hulls=False):
+        # (esq, topo, dir, base) de cada forma, calculados em lote sobre os
+        # pontos transformados (pelas matrizes pendentes ou pelas dadas). Com
+        # hulls, só os vértices do fecho convexo de cada forma são transformados.
+        offsets = self.offsets
+        if hulls:
+            parts = [shape.hull() for shape in self.shapes]
+            offsets = np.zeros(len(parts) + 1, dtype=np.int64)
+            np.cumsum([len(part) for part in parts], out=offsets[1:])
+            source = np.concatenate(parts) if parts else self.points
+            points = self.apply(self.matrices if matrices is None else matrices, source, offsets)
+        else:
+            points = self.world_points() if matrices is None else self.apply(matrices)
+        result = np.zeros((len(self.shapes), 4))
+        filled = offsets[1:] > offsets[:-1]
+        if filled.any():
+            starts = offsets[:-1][filled]
+            result[filled, :2] = np.minimum.reduceat(points, starts, axis=0)
+            result[filled, 2:] = np.maximum.reduceat(points, starts, axis=0)
+        circles = self.types == SHAPE_TYPES.index('círculo')
+        if circles.any():
+            centers = points[offsets[:-1][circles]].astype(np.float64)
+            radius = self.radius[circles, None].astype(np.float64)
+            result[circles, :2] = centers - radius
+            result[circles, 2:] = centers + radius
+        return result
+
+    def bounding_boxes(self):
+        # Mesmos retângulos de Shape.calculate_bounding_box, a partir de bounds().
+        bounds = self.bounds()
+        sizes = bounds[:, 2:] - bounds[:, :2]
+        circles = self.types == SHAPE_TYPES.index('círculo')
+        sizes[circles] = self.radius[circles, None] * 2
+        return [pygame.Rect(left, top, width, height)
+                for (left, top), (width, height) in zip(bounds[:, :2].tolist(), sizes.tolist())]
+
+    def scatter(self, points):
+        # Troca o bloco por um novo (mesmo layout, sem transformação pendente)
+        # e religa cada forma a uma vista somente leitura dele; o bloco antigo
+        # continua válido no histórico.
+        self.points = as_points(points)
+        for shape, matrix, start, end in zip(self.shapes, self.matrices, self.offsets[:-1], self.offsets[1:]):
+            arcs = transform_arcs(shape.arcs, matrix[:2, :2]) if shape.matrix is not None else shape.arcs
+            shape.restore_geometry((self.points[start:end], None, arcs))
+        self.matrices = np.repeat(IDENTITY[None], len(self.shapes), axis=0)
+        self.lazy = False
+        for shape, box in zip(self.shapes, self.bounding_boxes()):
+            shape.bounding_box = box
+
+    def flatten(self):
+        # Aplica de fato as transformações pendentes de todas as formas.
+        if self.lazy:
+            self.scatter(self.world_points())
+
+    def compose(self, matrices):
+        # Compõe uma matriz 3x3 (a mesma para todas) ou uma por forma (Sx3x3)
+        # com as pendentes, sem tocar nos pontos. Só os limites sob a nova parte
+        # linear são recalculados, em lote e a partir dos fechos convexos.
+        matrices = np.broadcast_to(np.asarray(matrices, dtype=np.float64), self.matrices.shape)
+        self.matrices = matrices @ self.matrices
+        self.lazy = True
+        linear = self.matrices.copy()
+        linear[:, :2, 2] = 0
+        extents = self.bounds(linear, hulls=True).tolist()
+        for shape, matrix, extent in zip(self.shapes, self.matrices, extents):
+            shape.set_matrix(matrix, tuple(extent))
+            shape.bounding_box = shape.calculate_bounding_box()
+
+# ================ (arquivo de cena) ================
+# Formato binário (little-endian): cabeçalho, um bloco float32 contíguo com os
+# pontos de todas as formas, a tabela de formas (tipo, cor, espessura, raio,
+# posição no bloco, arcos e limites) e os arcos em float64. Os pontos são
+# gravados em fluxo, forma a forma; a tabela vai no fim, quando já se sabe o
+# tamanho de tudo. Na leitura o arquivo é mapeado (mmap) e as formas são
+# montadas só com a tabela: os pontos de cada uma são copiados do mapeamento
+# no primeiro uso (Shape.load), então abrir uma cena não lê o bloco de pontos.
+SCENE_MAGIC = b'TP1S'
+SCENE_VERSION = 2  # 2: raio em float64 (círculos importados de SVG/JSON mantêm a fração)
+SCENE_HEADER = struct.Struct('<4sHHQQQQ')  # magic, versão, livre, formas, pontos, arcos, tabela
+SCENE_RECORD = np.dtype([('type', 'u1'), ('color', 'u1', (3,)), ('thickness', '<u2'),
+                         ('radius', '<f8'), ('start', '<u8'), ('count', '<u8'),
+                         ('arc_start', '<u8'), ('arc_count', '<u4'), ('bounds', '<f8', (4,))])
+
+class SceneWriter:
+    def __init__(self, path):
+        # Grava num temporário e troca no fim: o arquivo antigo pode estar mapeado.
+        self.path = path
+        self.file = open(path + '.tmp', 'wb')
+        self.file.write(bytes(SCENE_HEADER.size))
+        self.records = []
+        self.arcs = []
+        self.count = 0
+
+    def add(self, shape):
+        # Transformações pendentes são aplicadas: o arquivo guarda a geometria final.
+        points = shape.points
+        arcs = shape.arcs
+        if shape.matrix is not None:
+            arcs = transform_arcs(arcs, shape.matrix[:2, :2])
+        if shape.type == 'círculo':
+            cx, cy = float(points[0][0]), float(points[0][1])
+            bounds = (cx - shape.radius, cy - shape.radius, cx + shape.radius, cy + shape.radius)
+        else:
+            bounds = tuple(points.min(axis=0).tolist() + points.max(axis=0).tolist())
+        self.file.write(points.astype('<f4', copy=False).tobytes())
+        self.records.append((SHAPE_TYPES.index(shape.type), shape.color, shape.thickness, shape.radius,
+                             self.count, len(points), len(self.arcs), len(arcs or ()), bounds))
+        self.arcs.extend(arcs or ())
+        self.count += len(points)
+
+    def close(self):
+        table = np.array(self.records, dtype=SCENE_RECORD)
+        table_offset = self.file.tell()
+        self.file.write(table.tobytes())
+        self.file.write(np.array(self.arcs, dtype='<f8').reshape(-1, 2).tobytes())
+        self.file.seek(0)
+        self.file.write(SCENE_HEADER.pack(SCENE_MAGIC, SCENE_VERSION, 0, len(table),
+                                          self.count, len(self.arcs), table_offset))
+        self.file.close()
+        # No Windows um arquivo mapeado não pode ser substituído.
+        release_scene_maps(self.path)
+        try:
+            os.replace(self.path + '.tmp', self.path)
+        except OSError:
+            os.remove(self.path + '.tmp')
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+            os.remove(self.path + '.tmp')
+
+def save_scene(path, shapes):
+    with SceneWriter(path) as writer:
+        for shape in shapes:
+            writer.add(shape)
+
+@contextmanager
+def paused_gc():
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+class SceneData:
+    # Colunas do arquivo mapeado, lidas pelas formas ainda vazias.
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.data) < SCENE_HEADER.size:
+            self.data.close()
+            raise ValueError("Arquivo de cena inválido: " + path)
+        magic, version, _, shapes, count, arc_count, table_offset = SCENE_HEADER.unpack_from(self.data)
+        end = table_offset + shapes * SCENE_RECORD.itemsize + arc_count * 16
+        if (magic != SCENE_MAGIC or version != SCENE_VERSION or end > len(self.data)
+                or SCENE_HEADER.size + count * 8 > table_offset):
+            self.data.close()
+            raise ValueError("Arquivo de cena inválido: " + path)
+        self.points = np.frombuffer(self.data, dtype='<f4', count=2 * count,
+                                    offset=SCENE_HEADER.size).reshape(-1, 2)
+        self.table = np.frombuffer(self.data, dtype=SCENE_RECORD, count=shapes, offset=table_offset)
+        self.arcs = np.frombuffer(self.data, dtype='<f8', count=2 * arc_count,
+                                  offset=table_offset + self.table.nbytes).reshape(-1, 2)
+        # A tabela é conferida de uma vez, para que montar uma forma depois não falhe.
+        table = self.table
+        if ((table['type'] >= len(SHAPE_TYPES)).any() or (table['start'] + table['count'] > count).any()
+                or (table['arc_start'] + table['arc_count'] > arc_count).any()):
+            del self.points, self.table, self.arcs, table
+            self.data.close()
+            raise ValueError("Arquivo de cena inválido: " + path)
+        _SCENE_MAPS.add(self)
+
+    def shapes(self):
+        # Uma forma por registro, montada das colunas da tabela; os pontos ficam
+        # no arquivo até o primeiro uso (Shape.load chama shape_points).
+        table = self.table
+        arcs = [None] * len(table)
+        for row in np.flatnonzero(table['arc_count']).tolist():
+            start = int(table['arc_start'][row])
+            arcs[row] = tuple(map(tuple, self.arcs[start:start + int(table['arc_count'][row])].tolist()))
+        # Mesmos retângulos de Shape.calculate_bounding_box, a partir dos limites.
+        # As colunas viram listas simples, sem uma lista intermediária por forma.
+        bounds = table['bounds']
+        sizes = bounds[:, 2:] - bounds[:, :2]
+        circles = table['type'] == SHAPE_TYPES.index('círculo')
+        sizes[circles] = table['radius'][circles, None] * 2
+        boxes = map(pygame.Rect, bounds[:, 0].tolist(), bounds[:, 1].tolist(),
+                    sizes[:, 0].tolist(), sizes[:, 1].tolist())
+        colors = zip(*(table['color'][:, k].tolist() for k in range(3)))
+        columns = zip([SHAPE_TYPES[kind] for kind in table['type'].tolist()], colors, table['radius'].tolist(),
+                      table['thickness'].tolist(), arcs, boxes)
+        # Os objetos novos não formam ciclos: a coleta automática, disparada
+        # a cada poucas centenas deles, só atrasaria a montagem.
+        with paused_gc():
+            return [Shape.unloaded(self, row, *column) for row, column in enumerate(columns)]
+
+    def bounds(self):
+        return np.array(self.table['bounds'], dtype=np.float64)
+
+    def shape_extent(self, row):
+        return tuple(self.table['bounds'][row].tolist())
+
+    def shape_points(self, row):
+        # Cópia (somente leitura) dos pontos da linha: o mapeamento pode fechar depois.
+        record = self.table[row]
+        start, size = int(record['start']), int(record['count'])
+        points = self.points[start:start + size].astype(np.float32)
+        points.flags.writeable = False
+        return points
+
+    def release(self):
+        # Copia as colunas para a memória e fecha o mapeamento.
+        if self.data.closed:
+            return
+        self.points = self.points.copy()
+        self.table = self.table.copy()
+        self.arcs = self.arcs.copy()
+        try:
+            self.data.close()
+        except BufferError:
+            # Ainda há uma vista do mapeamento em uso: ele fecha quando ela for liberada.
+            pass
+
+_SCENE_MAPS = weakref.WeakSet()
+
+def release_scene_maps(path):
+    path = os.path.abspath(path)
+    for scene in list(_SCENE_MAPS):
+        if scene.path == path:
+            scene.release()
+
+def load_scene(path):
+    # Devolve as formas (vazias até o primeiro acesso) e seus limites.
+    scene = SceneData(path)
+    return scene.shapes(), scene.bounds()
+
+# ================ (importar / exportar) ================
+# SVG e JSON lidos e gravados em fluxo: a exportação escreve forma a forma e
+# a importação devolve um gerador, sem montar o documento inteiro na memória.
+# linha -> <line>, círculo -> <circle>, polígono -> <polygon> e desenho
+# livre -> <polyline>. O pincel tem raio = espessura, então o traço SVG tem
+# largura 2 * espessura + 1. Arcos de círculos recortados vão em data-arcs.
+SVG_NS = 'http://www.w3.org/2000/svg'
+SVG_TAGS = {'linha': 'line', 'círculo': 'circle', 'polígono': 'polygon', 'desenho livre': 'polyline'}
+# Quantidade de pontos aceita na importação: (mínimo, máximo ou None).
+SHAPE_POINT_COUNTS = {'linha': (2, 2), 'círculo': (1, 1), 'polígono': (3, None), 'desenho livre': (2, None)}
+
+def valid_point_count(shape_type, count):
+    low, high = SHAPE_POINT_COUNTS[shape_type]
+    return count >= low and (high is None or count <= high)
+
+def shape_export_data(shape):
+    # Geometria final (com transformações pendentes aplicadas) e arcos no mesmo referencial.
+    arcs = shape.arcs
+    if shape.matrix is not None:
+        arcs = transform_arcs(arcs, shape.matrix[:2, :2])
+    return shape.points, arcs
+
+def svg_number(value):
+    return repr(float(value))
+
+def export_svg(path, shapes):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f'<svg xmlns="{SVG_NS}" width="{WIDTH}" height="{HEIGHT}" '
+                f'viewBox="0 0 {WIDTH} {HEIGHT}">\n')
+        for shape in shapes:
+            points, arcs = shape_export_data(shape)
+            style = f'fill="none" stroke="rgb{tuple(shape.color)}" stroke-width="{2 * shape.thickness + 1}"'
+            if shape.type == 'linha':
+                (x1, y1), (x2, y2) = points.tolist()
+                geometry = (f'x1="{svg_number(x1)}" y1="{svg_number(y1)}" '
+                            f'x2="{svg_number(x2)}" y2="{svg_number(y2)}"')
+            elif shape.type == 'círculo':
+                cx, cy = points[0].tolist()
+                geometry = f'cx="{svg_number(cx)}" cy="{svg_number(cy)}" r="{svg_number(shape.radius)}"'
+                if arcs:
+                    geometry += ' data-arcs="' + ' '.join(f'{a!r},{b!r}' for a, b in arcs) + '"'
+            else:
+                geometry = 'points="' + ' '.join(f'{svg_number(x)},{svg_number(y)}'
+                                                 for x, y in points.tolist()) + '"'
+            f.write(f'  <{SVG_TAGS[shape.type]} {geometry} {style}/>\n')
+        f.write('</svg>\n')
+
+# Cores com nome: as 16 básicas do HTML/SVG e laranja. Outros nomes usam a
+# cor de desenho, com aviso.
+SVG_COLORS = {
+    'black': (0, 0, 0), 'silver': (192, 192, 192), 'gray': (128, 128, 128), 'grey': (128, 128, 128),
+    'white': (255, 255, 255), 'maroon': (128, 0, 0), 'red': (255, 0, 0), 'purple': (128, 0, 128),
+    'fuchsia': (255, 0, 255), 'magenta': (255, 0, 255), 'green': (0, 128, 0), 'lime': (0, 255, 0),
+    'olive': (128, 128, 0), 'yellow': (255, 255, 0), 'navy': (0, 0, 128), 'blue': (0, 0, 255),
+    'teal': (0, 128, 128), 'aqua': (0, 255, 255), 'cyan': (0, 255, 255), 'orange': (255, 165, 0),
+}
+
+def parse_svg_color(value):
+    # None para nomes desconhecidos; valores mal formados levantam ValueError.
+    value = (value or '').strip()
+    if not value:
+        return COLORS['draw']
+    if value.startswith('#') and len(value) in (4, 7):
+        digits = value[1:] if len(value) == 7 else ''.join(c * 2 for c in value[1:])
+        return tuple(int(digits[i:i + 2], 16) for i in (0, 2, 4))
+    if value.startswith('rgb(') and value.endswith(')'):
+        return tuple(max(0, min(255, int(float(v)))) for v in value[4:-1].split(','))
+    return SVG_COLORS.get(value.lower())
+
+def parse_svg_points(value):
+    return np.array(value.replace(',', ' ').split(), dtype=np.float64).reshape(-1, 2)
+
+def svg_shape(shape_type, get, report):
+    # Forma de um elemento SVG já lido; ValueError quando ele é inválido.
+    try:
+        style = dict(item.split(':', 1) for item in get('style', '').split(';') if ':' in item)
+        stroke = get('stroke', style.get('stroke'))
+        color = parse_svg_color(stroke)
+        width = float(get('stroke-width', style.get('stroke-width', '1')).rstrip('px'))
+        kwargs = {'thickness': max(1, round((width - 1) / 2))}
+        if shape_type == 'linha':
+            points = np.array([[get('x1', 0), get('y1', 0)], [get('x2', 0), get('y2', 0)]],
+                              dtype=np.float64)
+        elif shape_type == 'círculo':
+            points = np.array([[get('cx', 0), get('cy', 0)]], dtype=np.float64)
+            kwargs['radius'] = max(0.0, float(get('r', 0)))
+            if get('data-arcs'):
+                kwargs['arcs'] = tuple((float(a), float(b)) for a, b in
+                                       (arc.split(',') for arc in get('data-arcs').split()))
+        else:
+            points = parse_svg_points(get('points', ''))
+    except (TypeError, ValueError, OverflowError) as error:
+        raise ValueError(f"forma inválida no SVG: {error}") from error
+    if color is None:
+        report(f"Cor desconhecida no SVG: {stroke!r}; usando {COLORS['draw']}")
+        color = COLORS['draw']
+    if len(color) != 3:
+        raise ValueError(f"cor inválida no SVG: {stroke!r}")
+    if not np.isfinite(points).all() or not np.isfinite(kwargs.get('arcs', ())).all() \
+            or not math.isfinite(kwargs.get('radius', 0)):
+        raise ValueError("coordenada não finita no SVG")
+    if valid_point_count(shape_type, len(points)):
+        return Shape(shape_type, points, color, **kwargs)
+    return None
+
+def import_svg(path, report=print):
+    # Só os elementos que correspondem às formas do editor; os demais
+    # (grupos, transform, path) são ignorados. Um elemento inválido é
+    # descartado e relatado (report) sem interromper a importação.
+    tags = {tag: shape_type for shape_type, tag in SVG_TAGS.items()}
+    root = None
+    count = 0
+    for event, elem in ET.iterparse(path, events=('start', 'end')):
+        if root is None:
+            root = elem
+        if event != 'end':
+            continue
+        shape_type = tags.get(elem.tag.rsplit('}', 1)[-1])
+        if shape_type is None:
+            continue
+        count += 1
+        try:
+            shape = svg_shape(shape_type, elem.get, report)
+        except ValueError as error:
+            report(f"Elemento {count} ({SVG_TAGS[shape_type]}) ignorado: {error}")
+            shape = None
+        # Libera a forma já lida (e as anteriores, presas na raiz).
+        elem.clear()
+        if elem is not root:
+            root.clear()
+        if shape is not None:
+            yield shape
+
+def export_json(path, shapes):
+    # {"shapes": [...]} com uma forma por linha.
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{"shapes": [\n')
+        for i, shape in enumerate(shapes):
+            points, arcs = shape_export_data(shape)
+            data = {'type': shape.type, 'color': list(shape.color), 'thickness': shape.thickness,
+                    'radius': shape.radius, 'points': points.tolist()}
+            if arcs:
+                data['arcs'] = [list(arc) for arc in arcs]
+            f.write((',\n' if i else '') + json.dumps(data, ensure_ascii=False))
+        f.write('\n]}\n')
+
+def iter_json_array(f, chunk_size=1 << 20):
+    # Decodifica um a um os objetos do array de formas, lendo o arquivo em
+    # blocos. O documento deve ser um array ou um objeto com a chave
+    # "shapes" (as demais chaves são lidas e ignoradas).
+    decoder = json.JSONDecoder()
+    buffer, pos = '', 0
+
+    def skip_space():
+        # Avança até o próximo caractere útil; False no fim do arquivo.
+        nonlocal buffer, pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+                pos += 1
+            if pos < len(buffer):
+                return True
+            buffer, pos = f.read(chunk_size), 0
+            if not buffer:
+                return False
+
+    def expect(chars):
+        nonlocal pos
+        if not skip_space() or buffer[pos] not in chars:
+            raise ValueError(f"JSON inválido: esperado um de {chars!r}")
+        pos += 1
+        return buffer[pos - 1]
+
+    def decode():
+        # Um valor completo; lê mais blocos se ele estiver cortado (um número
+        # no fim do bloco pode continuar no próximo).
+        nonlocal buffer, pos
+        skip_space()
+        while True:
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                item, end = None, None
+            if end is None or end == len(buffer):
+                chunk = f.read(chunk_size)
+                if chunk:
+                    buffer, pos = buffer[pos:] + chunk, 0
+                    continue
+                if end is None:
+                    raise ValueError("JSON inválido: valor incompleto ou mal formado")
+            pos = end
+            return item
+
+    if not skip_space():
+        return
+    if buffer[pos] == '{':
+        pos += 1
+        while True:
+            if skip_space() and buffer[pos] == '}':
+                return
+            key = decode()
+            if not isinstance(key, str):
+                raise ValueError("JSON inválido: chave de objeto não é texto")
+            expect(':')
+            if key == 'shapes':
+                break
+            decode()
+            if expect(',}') == '}':
+                return
+    expect('[')
+    if skip_space() and buffer[pos] == ']':
+        return
+    while True:
+        yield decode()
+        if expect(',]') == ']':
+            return
+
+def import_json(path, report=print):
+    # Registros com tipo desconhecido ou pontos de menos são ignorados (como
+    # no SVG); registros mal formados são descartados e relatados (report).
+    with open(path, encoding='utf-8') as f:
+        for count, item in enumerate(iter_json_array(f), 1):
+            if not isinstance(item, dict) or not isinstance(item.get('type'), str) \
+                    or item['type'] not in SHAPE_POINT_COUNTS:
+                continue
+            try:
+                shape = json_shape(item)
+            except ValueError as error:
+                report(f"Registro {count} ({item['type']}) ignorado: {error}")
+                continue
+            if shape is not None:
+                yield shape
+
+def json_shape(item):
+    # Forma de um registro JSON; ValueError quando ele é inválido.
+    try:
+        points = np.asarray(item.get('points', ()), dtype=np.float64).reshape(-1, 2)
+        color = tuple(max(0, min(255, int(v))) for v in item.get('color', COLORS['draw']))
+        kwargs = {'radius': max(0.0, float(item.get('radius', 0))),
+                  'thickness': max(1, int(item.get('thickness', 2)))}
+        if item.get('arcs'):
+            kwargs['arcs'] = tuple((float(a), float(b)) for a, b in item['arcs'])
+    except (TypeError, ValueError, OverflowError) as error:
+        raise ValueError(f"forma inválida no JSON: {error}") from error
+    if len(color) != 3:
+        raise ValueError(f"cor inválida no JSON: {item.get('color')!r}")
+    if not np.isfinite(points).all() or not np.isfinite(kwargs.get('arcs', ())).all() \
+            or not math.isfinite(kwargs['radius']):
+        raise ValueError("coordenada não finita no JSON")
+    if valid_point_count(item['type'], len(points)):
+        return Shape(item['type'], points, color, **kwargs)
+    return None
+
+def import_shapes(path, report=print):
+    return import_json(path, report) if path.lower().endswith('.json') else import_svg(path, report)
+
+def export_shapes(path, shapes):
+    if path.lower().endswith('.json'):
+        export_json(path, shapes)
+    else:
+        export_svg(path, shapes)
+
+# ================ (transformações afins) ================
+# Matrizes homogêneas 3x3; compõem-se com @ (a da direita é aplicada primeiro).
+def translation_matrix(dx, dy):
+    return np.array([[1.0, 0.0, dx],
+                     [0.0, 1.0, dy],
+                     [0.0, 0.0, 1.0]])
+
+def rotation_matrix(angle):
+    angle_rad = math.radians(angle)
+    cos, sin = math.cos(angle_rad), math.sin(angle_rad)
+    return np.array([[cos, -sin, 0.0],
+                     [sin, cos, 0.0],
+                     [0.0, 0.0, 1.0]])
+
+def scale_matrix(sx, sy):
+    return np.array([[sx, 0.0, 0.0],
+                     [0.0, sy, 0.0],
+                     [0.0, 0.0, 1.0]])
+
+def about_centers(matrix, centers):
+    # translation(c) @ matrix @ translation(-c) para cada centro, em lote.
+    centers = np.asarray(centers, dtype=np.float64).reshape(-1, 2)
+    result = np.repeat(matrix[None], len(centers), axis=0)
+    result[:, :2, 2] += centers - centers @ matrix[:2, :2].T
+    return result
+
+# Câmera: mundo -> tela = zoom uniforme seguido de deslocamento. None é a
+# identidade (mundo e tela coincidem, como antes da câmera existir).
+def view_matrix(zoom, pan):
+    if zoom == 1 and pan == (0, 0):
+        return None
+    matrix = translation_matrix(*pan) @ scale_matrix(zoom, zoom)
+    matrix.flags.writeable = False
+    return matrix
+
+def view_rect(rect, view):
+    # Menor retângulo inteiro da tela que contém rect (em coordenadas do mundo).
+    if view is None:
+        return rect
+    area = pygame.Rect(rect)
+    area.normalize()
+    zoom, tx, ty = float(view[0, 0]), float(view[0, 2]), float(view[1, 2])
+    left, top = math.floor(area.left * zoom + tx), math.floor(area.top * zoom + ty)
+    right, bottom = math.ceil(area.right * zoom + tx), math.ceil(area.bottom * zoom + ty)
+    return pygame.Rect(left, top, right - left, bottom - top)
+
+# ================ (histórico de comandos) ================
+# Cada operação guarda só o que mudou. Os arrays de pontos e as matrizes são
+# somente leitura (transformações e recortes criam arrays novos), então o
+# histórico compartilha os arrays com as formas em vez de copiá-los.
+def value_nbytes(value):
+    # Tamanho real de arrays, tuplas e números, com os cabeçalhos. Vistas
+    # contam os dados que mantêm vivos.
+    if value is None:
+        return 0
+    if isinstance(value, np.ndarray):
+        return sys.getsizeof(value) + (value.nbytes if value.base is not None else 0)
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(value_nbytes(v) for v in value)
+    return sys.getsizeof(value)
+
+def geometry_nbytes(shape, *geometries):
+    # Pontos, matrizes e arcos de cada estado, contando uma vez os arrays
+    # compartilhados (uma translação só troca a matriz), mais o fecho convexo
+    # e a BVH que a forma guarda para esses pontos.
+    size, seen = 0, set()
+    for geometry in geometries:
+        size += sys.getsizeof(geometry)
+        for value in geometry:
+            if value is not None and id(value) not in seen:
+                seen.add(id(value))
+                size += value_nbytes(value)
+    points = [geometry[0] for geometry in geometries]
+    hull, bvh = shape._hull, shape._bvh
+    if hull is not None and any(hull[0] is p for p in points):
+        size += value_nbytes(hull[1])
+    if bvh is not None and any(bvh.points is p for p in points):
+        size += value_nbytes(bvh.levels)
+    return size
+
+class AddShapesCommand:
+    def __init__(self, entries):
+        self.entries = entries  # [(posição em shapes, forma)]
+        self.nbytes = sys.getsizeof(entries)
+        for entry in entries:
+            shape = entry[1]
+            self.nbytes += (sys.getsizeof(entry) + sys.getsizeof(shape) + value_nbytes(shape.color)
+                            + sys.getsizeof(shape.bounding_box) + geometry_nbytes(shape, shape.geometry))
+
+    def undo(self, editor):
+        editor.remove_shapes([s for _, s in self.entries])
+
+    def redo(self, editor):
+        editor.insert_shapes(self.entries)
+
+class RemoveShapesCommand(AddShapesCommand):
+    def undo(self, editor):
+        AddShapesCommand.redo(self, editor)
+
+    def redo(self, editor):
+        AddShapesCommand.undo(self, editor)
+
+class GeometryCommand:
+    def __init__(self, changes):
+        self.changes = changes  # [(forma, geometria antes, geometria depois)]
+        self.nbytes = sys.getsizeof(changes) + sum(
+            sys.getsizeof(change) + geometry_nbytes(*change) for change in changes)
+
+    def undo(self, editor):
+        for shape, before, _ in self.changes:
+            editor.set_geometry(shape, before)
+
+    def redo(self, editor):
+        for shape, _, after in self.changes:
+            editor.set_geometry(shape, after)
+
+class CompositeCommand:
+    def __init__(self, commands):
+        self.commands = commands
+        self.nbytes = sum(c.nbytes for c in commands)
+
+    def undo(self, editor):
+        for command in reversed(self.commands):
+            command.undo(editor)
+
+    def redo(self, editor):
+        for command in self.commands:
+            command.redo(editor)
+
+class History:
+    def __init__(self, max_entries=HISTORY_LIMIT, max_bytes=HISTORY_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.undo_stack = []
+        self.redo_stack = []
+        self.nbytes = 0
+
+    def push(self, command):
+        self.undo_stack.append(command)
+        self.nbytes += command.nbytes
+        for old in self.redo_stack:
+            self.nbytes -= old.nbytes
+        self.redo_stack.clear()
+        # Descarta as entradas mais antigas quando passa dos limites.
+        while self.undo_stack and (len(self.undo_stack) > self.max_entries or self.nbytes > self.max_bytes):
+            self.nbytes -= self.undo_stack.pop(0).nbytes
+
+    def undo(self, editor):
+        if not self.undo_stack:
+            return False
+        command = self.undo_stack.pop()
+        command.undo(editor)
+        self.redo_stack.append(command)
+        return True
+
+    def redo(self, editor):
+        if not self.redo_stack:
+            return False
+        command = self.redo_stack.pop()
+        command.redo(editor)
+        self.undo_stack.append(command)
+        return True
+
+# ================ (perfil de quadros) ================
+# Tempo de cada fase do laço principal e contadores por quadro, guardados
+# num buffer circular. F3 mostra o resumo na tela e F4 grava CSV/JSON.
+PROFILE_PHASES = ('eventos', 'cena', 'barras', 'sobreposições', 'prévias', 'tela', 'espera')
+PROFILE_FRAMES = 600
+
+class FrameProfiler:
+    def __init__(self, size=PROFILE_FRAMES):
+        self.frames = deque(maxlen=size)
+        self.visible = False
+        self.stack = []
+        self.begin()
+
+    def begin(self):
+        self.current = dict.fromkeys(PROFILE_PHASES, 0.0)
+        self.current.update(formas=0, area_suja=0)
+        self.start = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name):
+        # Tempo exclusivo: fases aninhadas são descontadas da que as contém.
+        start = time.perf_counter()
+        self.stack.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.current[name] += elapsed - self.stack.pop()
+            if self.stack:
+                self.stack[-1] += elapsed
+
+    def count(self, shapes=0, dirty_area=0):
+        # dirty_area: pixels dos retângulos enviados à tela (não os rasterizados).
+        self.current['formas'] += shapes
+        self.current['area_suja'] += dirty_area
+
+    def end(self, history_bytes, cache_bytes):
+        self.current.update(total=time.perf_counter() - self.start,
+                            historico=history_bytes, cache=cache_bytes)
+        self.frames.append(self.current)
+        self.begin()
+
+    def summary(self, last=60):
+        frames = list(self.frames)[-last:]
+        if not frames:
+            return ["Perfil: sem quadros"]
+        total = sum(f['total'] for f in frames) / len(frames)
+        lines = [f"{1 / total if total else 0:6.1f} qps  {total * 1e3:6.2f} ms/quadro"]
+        for name in PROFILE_PHASES:
+            values = [f[name] * 1e3 for f in frames]
+            lines.append(f"{name:<14}{sum(values) / len(values):7.2f} ms  máx {max(values):7.2f}")
+        last_frame = frames[-1]
+        lines.append(f"formas {last_frame['formas']}  área suja {last_frame['area_suja']} px")
+        lines.append(f"histórico {last_frame['historico'] / 1e6:.2f} MB  cache {last_frame['cache'] / 1e6:.2f} MB")
+        return lines
+
+    def dump(self, base='perfil_quadros'):
+        frames = list(self.frames)
+        if not frames:
+            return None
+        fields = list(frames[0])
+        with open(base + '.csv', 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(frames)
+        with open(base + '.json', 'w', encoding='utf-8') as f:
+            json.dump(frames, f, ensure_ascii=False)
+        return base
+
+# ================ (entrada e agendamento de quadros) ================
+# Os eventos são lidos a cada quadro com a posição de cada um (event.pos).
+# Sem nada para redesenhar o laço dorme até o próximo evento; o custo dos
+# quadros desenhados é acompanhado e, acima do orçamento, as prévias ficam
+# mais simples até a carga cair.
+def coalesce_motion(events):
+    # Movimentos seguidos viram um só (o último): os arrastes usam só a posição final.
+    return [event for event, following in zip(events, events[1:] + [None])
+            if not (event.type == pygame.MOUSEMOTION and following is not None
+                    and following.type == pygame.MOUSEMOTION)]
+
+class FrameScheduler:
+    def __init__(self, rate=FRAME_RATE):
         self.clock = pygame.time.Clock()
-        self.font = pygame.font.SysFont('Arial', 18)
-        self.small_font = pygame.font.SysFont('Arial', 14)
+        self.rate = rate
+        self.budget = 1 / rate
+        self.load = 0.0
+        self.degraded = False
+
+    def next_events(self, busy):
+        if not busy:
+            # Nada mudou: bloqueia até chegar um evento, sem acordar a cada quadro.
+            events = [pygame.event.wait()]
+        else:
+            events = []
+        # Limita a taxa de quadros; os eventos que chegam enquanto isso entram no mesmo lote.
+        self.clock.tick(self.rate)
+        return events + pygame.event.get()
+
+    def record(self, seconds):
+        # Média móvel do tempo de desenho, com histerese para não alternar a cada quadro.
+        self.load += 0.2 * (seconds - self.load)
+        if self.load > self.budget:
+            self.degraded = True
+        elif self.load < self.budget / 2:
+            self.degraded = False
+
+# ================ (renderização em blocos) ================
+# A área de desenho é dividida em blocos; cada forma vai para os blocos que
+# sua caixa toca. Os processos rasterizam os blocos direto numa tela em
+# memória compartilhada, que o processo principal usa como camada de formas.
+_TILE_CANVAS = None
+_TILE_SCENE = None
+
+# Geometria da cena na memória compartilhada: uma linha por forma (pontos
+# base, matriz pendente e limites, para que o processo rasterize exatamente
+# como o principal), seguida dos arcos (float64) e dos pontos (float32).
+TILE_RECORD = np.dtype([('type', 'u1'), ('lazy', 'u1'), ('color', 'u1', (3,)), ('thickness', '<u2'),
+                        ('radius', '<f8'), ('start', '<u8'), ('count', '<u8'), ('arc_start', '<u8'),
+                        ('arc_count', '<u4'), ('matrix', '<f8', (3, 3)), ('extent', '<f8', (4,))])
+
+def tile_layout(shapes, arcs, points):
+    # Posições (tabela, arcos, pontos) no bloco e o tamanho total, alinhados a 8 bytes.
+    arc_offset = -(-shapes * TILE_RECORD.itemsize // 8) * 8
+    point_offset = arc_offset + arcs * 16
+    return arc_offset, point_offset, point_offset + points * 8
+
+def tile_canvas(memory, size):
+    # Superfície sem cópia sobre a memória compartilhada, com os canais na
+    # ordem da tela; sem alfa por pixel, o blit para a tela é uma cópia simples.
+    canvas = pygame.image.frombuffer(memory.buf, size, 'BGRA')
+    canvas.set_alpha(None)
+    return canvas
+
+def init_tile_worker(name, size):
+    global _TILE_CANVAS
+    memory = shared_memory.SharedMemory(name=name)
+    _TILE_CANVAS = (memory, tile_canvas(memory, size))
+
+def tile_shape(scene, row):
+    # Monta (uma vez por versão da cena) a forma da linha row; os pontos são
+    # copiados, então o bloco pode ser reescrito ou fechado depois.
+    shape = scene['shapes'].get(row)
+    if shape is None:
+        record = scene['table'][row]
+        start, size = int(record['start']), int(record['count'])
+        arc_start, arc_size = int(record['arc_start']), int(record['arc_count'])
+        points = scene['points'][start:start + size].astype(np.float32)
+        points.flags.writeable = False
+        arcs = tuple(map(tuple, scene['arcs'][arc_start:arc_start + arc_size].tolist())) if arc_size else None
+        extent = tuple(record['extent'].tolist())
+        shape = Shape(SHAPE_TYPES[int(record['type'])], points, tuple(record['color'].tolist()),
+                      radius=float(record['radius']), thickness=int(record['thickness']), arcs=arcs, extent=extent)
+        if record['lazy']:
+            shape.set_matrix(record['matrix'], extent)
+        scene['shapes'][row] = shape
+    return shape
+
+def tile_scene(layout):
+    # Cena compartilhada da versão pedida; as formas da versão anterior são
+    # descartadas, e o bloco antigo fechado quando foi trocado por outro.
+    global _TILE_SCENE
+    name, version, shapes, arcs, points = layout
+    scene = _TILE_SCENE
+    if scene is not None and scene['version'] == (name, version):
+        return scene
+    memory = None
+    if scene is not None:
+        memory = scene['memory']
+        _TILE_SCENE = scene = None
+        if memory.name != name:
+            memory.close()
+            memory = None
+    if memory is None:
+        memory = shared_memory.SharedMemory(name=name)
+    arc_offset, point_offset, _ = tile_layout(shapes, arcs, points)
+    _TILE_SCENE = {
+        'version': (name, version),
+        'memory': memory,
+        'table': np.frombuffer(memory.buf, dtype=TILE_RECORD, count=shapes),
+        'arcs': np.frombuffer(memory.buf, dtype=np.float64, count=2 * arcs, offset=arc_offset).reshape(-1, 2),
+        'points': np.frombuffer(memory.buf, dtype=np.float32, count=2 * points, offset=point_offset).reshape(-1, 2),
+        'shapes': {},
+    }
+    return _TILE_SCENE
+
+def render_tile(tile, rows, layout, line_algo, view):
+    scene = tile_scene(layout)
+    canvas = _TILE_CANVAS[1]
+    canvas.set_clip(tile)
+    canvas.fill(COLORS['background'])
+    for row in rows.tolist():
+        tile_shape(scene, row).render_direct(canvas, line_algo, view)
+    return len(rows)
+
+class TileRenderer:
+    def __init__(self, size, workers=TILE_WORKERS, tile=TILE_SIZE):
+        self.size = size
+        self.tile = tile
+        self.workers = workers
+        self.memory = shared_memory.SharedMemory(create=True, size=size[0] * size[1] * 4)
+        # Vista sem cópia da memória compartilhada, no mesmo formato dos processos.
+        self.canvas = tile_canvas(self.memory, size)
+        self.pool = ProcessPoolExecutor(max_workers=workers, initializer=init_tile_worker,
+                                        initargs=(self.memory.name, size))
+        # Geometria compartilhada: bloco, versão e o estado das formas que ela contém.
+        self.scene = None
+        self.version = 0
+        self.layout = None
+        self.shared = []
+        atexit.register(self.close)
+
+    def tiles(self, area):
+        # Formas na divisa entre blocos são desenhadas em cada um deles: com
+        # poucos processos, blocos maiores (cerca de dois por processo) repetem menos.
+        side = max(self.tile, math.ceil(math.sqrt(area.width * area.height / (2 * self.workers))))
+        return [pygame.Rect(x, y, min(side, area.right - x), min(side, area.bottom - y))
+                for y in range(area.top, area.bottom, side)
+                for x in range(area.left, area.right, side)]
+
+    def share(self, shapes):
+        # Grava a geometria no bloco compartilhado só quando alguma forma mudou
+        # (os arrays são somente leitura: basta comparar identidades). Com a
+        # cena igual, os processos reaproveitam as formas que já montaram.
+        state = [(s, s.base, s.matrix, s.arcs, s.color, s.thickness, s.radius) for s in shapes]
+        if len(state) == len(self.shared) and all(
+                a is b for new, old in zip(state, self.shared) for a, b in zip(new, old)):
+            return self.layout
+        table = np.zeros(len(shapes), dtype=TILE_RECORD)
+        counts = np.array([len(s.base) for s in shapes], dtype=np.int64)
+        arcs = [s.arcs or () for s in shapes]
+        table['start'][1:] = np.cumsum(counts)[:-1]
+        table['count'] = counts
+        table['arc_count'] = [len(a) for a in arcs]
+        table['arc_start'][1:] = np.cumsum(table['arc_count'], dtype=np.int64)[:-1]
+        table['type'] = [SHAPE_TYPES.index(s.type) for s in shapes]
+        table['lazy'] = [s.matrix is not None for s in shapes]
+        table['color'] = [s.color for s in shapes]
+        table['thickness'] = [s.thickness for s in shapes]
+        table['radius'] = [s.radius for s in shapes]
+        table['matrix'] = [IDENTITY if s.matrix is None else s.matrix for s in shapes]
+        table['extent'] = [s.extent() for s in shapes]
+        arcs = [arc for shape_arcs in arcs for arc in shape_arcs]
+        total = int(counts.sum())
+        arc_offset, point_offset, size = tile_layout(len(table), len(arcs), total)
+        if self.scene is None or self.scene.size < size:
+            # Bloco maior: os processos abrem o novo e fecham o antigo.
+            self.release_scene()
+            self.scene = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        buffer = self.scene.buf
+        np.frombuffer(buffer, dtype=TILE_RECORD, count=len(table))[:] = table
+        np.frombuffer(buffer, dtype=np.float64, count=2 * len(arcs), offset=arc_offset)[:] = \
+            np.array(arcs, dtype=np.float64).ravel()
+        if total:
+            np.frombuffer(buffer, dtype=np.float32, count=2 * total, offset=point_offset)[:] = \
+                np.concatenate([s.base for s in shapes]).ravel()
+        del buffer
+        self.version += 1
+        self.shared = state
+        self.layout = (self.scene.name, self.version, len(table), len(arcs), total)
+        return self.layout
+
+    def render(self, area, shapes, line_algo='DDA', view=None):
+        # Cada bloco recebe os índices das formas na ordem de desenho, então o
+        # resultado é igual ao do redesenho sequencial; a geometria vai pela
+        # memória compartilhada e os pixels ficam direto em canvas. Retorna
+        # quantas formas foram desenhadas.
+        layout = self.share(shapes)
+        rects = np.array([tuple(shape.dirty_rect(view)) for shape in shapes], dtype=np.int64).reshape(-1, 4)
+        left, top = rects[:, 0], rects[:, 1]
+        right, bottom = left + rects[:, 2], top + rects[:, 3]
+        tiles, jobs = [], []
+        for tile in self.tiles(area):
+            hit = np.flatnonzero((left < tile.right) & (right > tile.left) &
+                                 (top < tile.bottom) & (bottom > tile.top))
+            tiles.append(tile)
+            jobs.append(hit.astype(np.int32))
+        count = len(tiles)
+        return sum(self.pool.map(render_tile, tiles, jobs, [layout] * count, [line_algo] * count, [view] * count))
+
+    def release_scene(self):
+        if self.scene is not None:
+            self.scene.close()
+            self.scene.unlink()
+            self.scene = None
+            self.shared = []
+
+    def close(self):
+        if self.pool is None:
+            return
+        self.pool.shutdown()
+        self.pool = None
+        self.release_scene()
+        # A superfície segura o buffer: ela (e quem a usa como camada) precisa
+        # sair antes de fechar a memória.
+        self.canvas = None
+        self.memory.close()
+        self.memory.unlink()
+
+class GraphicsEditor:
+    def __init__(self, headless=False):
+        # Sem janela (headless) a tela é uma superfície comum fora da tela,
+        # para renderizar e medir cenas sem display. O driver de vídeo do SDL
+        # é escolhido em pygame.init(), então o "dummy" vem antes dele.
+        self.headless = headless
+        if headless:
+            os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+        pygame.init()
+        if headless:
+            self.screen = pygame.Surface((WIDTH, HEIGHT))
+        else:
+            self.screen = pygame.display.set_mode((WIDTH, HEIGHT))
+            pygame.display.set_caption("Editor Gráfico - TP1")
+        self.scheduler = FrameScheduler()
 
         self.toolbar_rect = pygame.Rect(0, 0, WIDTH, 50)
         self.sidebar_rect = pygame.Rect(WIDTH - 300, 0, 300, HEIGHT)
@@ -289,6 +2640,7 @@ class GraphicsEditor:
         self.modes = ['desenho livre', 'linha', 'círculo', 'polígono', 'selecionar', 'recorte']
         self.current_mode = 'linha'
         self.shapes = []
+        self.index = SpatialGrid()
         self.selected_shapes = []
         self.temp_points = []
         self.dragging = False
@@ -296,31 +2648,67 @@ class GraphicsEditor:
         self.clipping_window = None
         self.brush_size = 2
         self.drawing = False
+        self.stroke_min_distance = STROKE_MIN_DISTANCE
+        self.stroke_collinear = STROKE_COLLINEAR
+        self.stroke_tolerance = STROKE_TOLERANCE
         self.selection_start = None
 
         self.mode_button_width = 130
+        # Posições fixas dos botões de modo na barra superior.
+        self.mode_rects = [pygame.Rect(20 + i * (self.mode_button_width + 10), 10, self.mode_button_width, 30)
+                           for i in range(len(self.modes))]
         self.line_algo = 'DDA'
+        self.polygon_clip = 'SH'
 
         self.translation_active = False
         self.translation_start = None
         self.translation_orig = {}
         self.transformation_mode = None
 
+        # Câmera: zoom e deslocamento inteiro (pan) da tela; view é a matriz
+        # mundo -> tela (None enquanto coincidem). Botão do meio arrasta a vista.
+        self.zoom = 1.0
+        self.pan = (0, 0)
+        self.view = None
+        self.panning = None
+
         self.rotation_angle = 5
         self.transform_controls = []
         self.setup_transform_controls()
 
         self.toggle_line_algo_button = Button((WIDTH - 280, 700, 180, 30),
                                               f"Linha: {self.line_algo}", self.toggle_line_algo)
+        self.toggle_polygon_clip_button = Button((WIDTH - 280, 740, 180, 30),
+                                                 f"Polígono: {self.polygon_clip}", self.toggle_polygon_clip)
 
         self.size_minus_button = Button(pygame.Rect(0, 0, 30, 30), "-", self.decrease_brush_size)
         self.size_plus_button = Button(pygame.Rect(0, 0, 30, 30), "+", self.increase_brush_size)
 
         self.recorte_rect = None
 
-        self.undo_stack = []
-        self.redo_stack = []
-        self.save_state()
+        # Camadas: formas confirmadas ficam numa superfície persistente; a
+        # tela só recebe as regiões alteradas (display.update com retângulos).
+        self.scene_layer = pygame.Surface((WIDTH, HEIGHT))
+        self.scene_layer.fill(COLORS['background'])
+        self.scene_repaint = [self.drawing_area.copy()]
+        self.scene_present = []
+        self.overlay_rects = []
+        self.frame_dirty = True
+        self.hover = None
+        self.sidebar_base = None
+        # Rascunho da prévia: segmentos já fixos do traço/polígono em
+        # andamento, rasterizados uma única vez.
+        self.preview_layer = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
+        self.preview_layer.set_clip(self.drawing_area)
+        self.preview_rect = None
+        self.preview_count = 0
+        self.preview_key = None
+
+        self.history = History()
+        self.profiler = FrameProfiler()
+        # Redesenhos completos de cenas grandes em vários processos (criados na primeira vez).
+        self.tile_workers = TILE_WORKERS
+        self.tile_renderer = None
 
     def setup_transform_controls(self):
         self.transform_controls.clear()
@@ -363,61 +2751,58 @@ class GraphicsEditor:
         if not self.selected_shapes:
             print("Nenhuma forma selecionada!")
             return
-        for shape in self.selected_shapes:
-            cx, cy = shape.bounding_box.center
-            angle_rad = math.radians(delta_angle)
-            new_points = []
-            for p in shape.points:
-                new_points.append((cx + (p[0]-cx)*math.cos(angle_rad) - (p[1]-cy)*math.sin(angle_rad),
-                                   cy + (p[0]-cx)*math.sin(angle_rad) + (p[1]-cy)*math.cos(angle_rad)))
-            shape.points = new_points
-            shape.bounding_box = shape.calculate_bounding_box()
+        centers = [shape.bounding_box.center for shape in self.selected_shapes]
+        self.transform_selected(about_centers(rotation_matrix(delta_angle), centers))
         print(f"Rotação de {delta_angle}° aplicada.")
-        self.save_state()
 
     def apply_reflection_x_operation(self):
         if not self.selected_shapes:
             print("Nenhuma forma selecionada!")
             return
-        for shape in self.selected_shapes:
-            cx = shape.bounding_box.centerx
-            new_points = [(2*cx - p[0], p[1]) for p in shape.points]
-            shape.points = new_points
-            shape.bounding_box = shape.calculate_bounding_box()
+        centers = [shape.bounding_box.center for shape in self.selected_shapes]
+        self.transform_selected(about_centers(scale_matrix(-1, 1), centers))
         print("Reflexão em X aplicada.")
-        self.save_state()
 
     def apply_reflection_y_operation(self):
         if not self.selected_shapes:
             print("Nenhuma forma selecionada!")
             return
-        for shape in self.selected_shapes:
-            cy = shape.bounding_box.centery
-            new_points = [(p[0], 2*cy - p[1]) for p in shape.points]
-            shape.points = new_points
-            shape.bounding_box = shape.calculate_bounding_box()
+        centers = [shape.bounding_box.center for shape in self.selected_shapes]
+        self.transform_selected(about_centers(scale_matrix(1, -1), centers))
         print("Reflexão em Y aplicada.")
-        self.save_state()
 
     def apply_reflection_origin_operation(self):
         center_drawing = self.drawing_area.center
         if not self.selected_shapes:
             print("Nenhuma forma selecionada!")
             return
-        for shape in self.selected_shapes:
-            new_points = [(2*center_drawing[0] - p[0], 2*center_drawing[1] - p[1]) for p in shape.points]
-            shape.points = new_points
-            shape.bounding_box = shape.calculate_bounding_box()
+        self.transform_selected(about_centers(scale_matrix(-1, -1), center_drawing)[0])
         print("Reflexão pela Origem aplicada.")
-        self.save_state()
+
+    def transform_selected(self, matrices):
+        # Só compõe as matrizes pendentes; os pontos não são reescritos.
+        before = [shape.geometry for shape in self.selected_shapes]
+        self.invalidate_shapes(self.selected_shapes)
+        ShapeStore(self.selected_shapes).compose(matrices)
+        self.reindex(self.selected_shapes)
+        self.invalidate_shapes(self.selected_shapes)
+        self.record_geometry(self.selected_shapes, before)
 
     def toggle_line_algo(self):
-        self.line_algo = 'Bresenham' if self.line_algo == 'DDA' else 'DDA'
+        # DDA -> Bresenham -> AA (antisserrilhado) -> DDA.
+        self.line_algo = LINE_ALGOS[(LINE_ALGOS.index(self.line_algo) + 1) % len(LINE_ALGOS)]
         self.toggle_line_algo_button.text = f"Linha: {self.line_algo}"
+        self.invalidate()
         print("Algoritmo de linha definido para", self.line_algo)
 
+    def toggle_polygon_clip(self):
+        self.polygon_clip = 'WA' if self.polygon_clip == 'SH' else 'SH'
+        self.toggle_polygon_clip_button.text = f"Polígono: {self.polygon_clip}"
+        print("Recorte de polígonos definido para",
+              "Weiler-Atherton" if self.polygon_clip == 'WA' else "Sutherland-Hodgman")
+
     def increase_brush_size(self):
-        self.brush_size = min(20, self.brush_size + 1)
+        self.brush_size = min(MAX_BRUSH, self.brush_size + 1)
         print("Tamanho do pincel aumentado para", self.brush_size)
 
     def decrease_brush_size(self):
@@ -426,52 +2811,336 @@ class GraphicsEditor:
 
 
 # ================== (CTRL Z/ CTRL Y) ==================
-    def save_state(self):
-        shapes_copy = copy.deepcopy(self.shapes)
-        for shape in shapes_copy:
+    def record_geometry(self, shapes, before):
+        changes = [(s, b, s.geometry) for s, b in zip(shapes, before)
+                   if s.base is not b[0] or s.matrix is not b[1] or s.arcs is not b[2]]
+        if changes:
+            self.history.push(GeometryCommand(changes))
+
+    def set_geometry(self, shape, geometry):
+        self.invalidate(shape.dirty_rect(self.view))
+        shape.restore_geometry(geometry)
+        shape.bounding_box = shape.calculate_bounding_box()
+        self.index.update(shape)
+        self.invalidate(shape.dirty_rect(self.view))
+
+    def remove_shapes(self, shapes):
+        removed = set(shapes)
+        for shape in shapes:
+            self.index.remove(shape)
+            self.invalidate(shape.dirty_rect(self.view))
             shape.selected = False
-        self.undo_stack.append(shapes_copy)
-        self.redo_stack.clear()
+        self.shapes = [s for s in self.shapes if s not in removed]
+        self.selected_shapes = [s for s in self.selected_shapes if s not in removed]
+
+    def insert_shapes(self, entries):
+        # Reinsere cada forma na posição original (entries em ordem crescente).
+        appended = not entries or entries[0][0] >= len(self.shapes)
+        merged = []
+        pending = iter(self.shapes)
+        for position, shape in entries:
+            while len(merged) < position:
+                merged.append(next(pending))
+            merged.append(shape)
+            self.invalidate(shape.dirty_rect(self.view))
+        merged.extend(pending)
+        self.shapes = merged
+        # No fim da lista a ordem de desenho se mantém; no meio, refaz o índice.
+        if appended:
+            for _, shape in entries:
+                self.index.insert(shape)
+        else:
+            self.index.rebuild(self.shapes)
+
+    def clear_selection(self):
+        for shape in self.selected_shapes:
+            shape.selected = False
+        self.selected_shapes.clear()
 
     def undo(self):
-        if self.undo_stack:
-            self.redo_stack.append(copy.deepcopy(self.shapes))
-            self.shapes = self.undo_stack.pop()
+        if self.history.undo(self):
             print("Desfazer aplicado.")
         else:
             print("Nenhum desfazer disponível.")
 
     def redo(self):
-        if self.redo_stack:
-            self.undo_stack.append(copy.deepcopy(self.shapes))
-            self.shapes = self.redo_stack.pop()
+        if self.history.redo(self):
             print("Refazer aplicado.")
         else:
             print("Nenhum refazer disponível.")
 
+    def flatten_selected(self):
+        # Aplica de fato as transformações pendentes aos pontos (Ctrl+F).
+        shapes = [s for s in self.selected_shapes if s.matrix is not None]
+        if not shapes:
+            print("Nenhuma transformação pendente.")
+            return
+        before = [shape.geometry for shape in shapes]
+        self.invalidate_shapes(shapes)
+        ShapeStore(shapes).flatten()
+        self.reindex(shapes)
+        self.invalidate_shapes(shapes)
+        print("Transformações consolidadas.")
+        self.record_geometry(shapes, before)
+
+
+
+# ================== (salvar / abrir) ==================
+    def save_scene_file(self, path=SCENE_FILE):
+        try:
+            save_scene(path, self.shapes)
+        except OSError as error:
+            print("Não foi possível salvar a cena:", error)
+            return
+        print("Cena salva em", path)
+
+    def load_scene_file(self, path=SCENE_FILE):
+        # Abrir uma cena começa um documento novo: o histórico é descartado.
+        try:
+            shapes, bounds = load_scene(path)
+        except (OSError, ValueError) as error:
+            print("Não foi possível abrir a cena:", error)
+            return
+        self.set_scene(shapes, bounds)
+        print("Cena carregada de", path, "-", len(shapes), "formas")
+
+    def set_scene(self, shapes, bounds=None):
+        self.clear_selection()
+        self.temp_points.clear()
+        self.clipping_window = None
+        self.shapes = shapes
+        self.index.rebuild(shapes, bounds)
+        SHAPE_CACHE.clear()
+        self.history = History()
+        self.invalidate()
+
+    def export_file(self, path):
+        try:
+            export_shapes(path, self.shapes)
+        except OSError as error:
+            print("Não foi possível exportar:", error)
+            return
+        print("Cena exportada para", path)
+
+    def import_file(self, path):
+        # Todas as formas importadas entram de uma vez, num único passo do histórico.
+        try:
+            shapes = list(import_shapes(path))
+        except (OSError, ValueError, KeyError, ET.ParseError) as error:
+            print("Não foi possível importar:", error)
+            return
+        if not shapes:
+            print("Nenhuma forma encontrada em", path)
+            return
+        entries = [(len(self.shapes) + i, shape) for i, shape in enumerate(shapes)]
+        self.insert_shapes(entries)
+        self.history.push(AddShapesCommand(entries))
+        print("Importadas", len(shapes), "formas de", path)
+
+
+
+# ================== (câmera) ==================
+    def to_world(self, pos):
+        if self.view is None:
+            return pos
+        return ((pos[0] - self.pan[0]) / self.zoom, (pos[1] - self.pan[1]) / self.zoom)
+
+    def to_screen(self, point):
+        if self.view is None:
+            return point
+        return (point[0] * self.zoom + self.pan[0], point[1] * self.zoom + self.pan[1])
+
+    def world_rect(self, rect):
+        # Retângulo da tela levado ao mundo (arredondado para fora).
+        if self.view is None:
+            return rect
+        left, top = self.to_world(rect.topleft)
+        right, bottom = self.to_world(rect.bottomright)
+        left, top = math.floor(left), math.floor(top)
+        return pygame.Rect(left, top, math.ceil(right) - left, math.ceil(bottom) - top)
+
+    def set_view(self, zoom, pan):
+        zoom = min(max(zoom, MIN_ZOOM), MAX_ZOOM)
+        pan = (int(round(pan[0])), int(round(pan[1])))
+        dx, dy = pan[0] - self.pan[0], pan[1] - self.pan[1]
+        if zoom == self.zoom and (dx, dy) == (0, 0):
+            return
+        scroll = zoom == self.zoom and not self.scene_repaint
+        self.zoom, self.pan = zoom, pan
+        self.view = view_matrix(zoom, pan)
+        if scroll:
+            # Só deslocamento: a camada é rolada e só as faixas expostas são refeitas.
+            area = self.drawing_area
+            self.scene_layer.set_clip(area)
+            self.scene_layer.scroll(dx, dy)
+            self.scene_layer.set_clip(None)
+            if dx:
+                self.invalidate(pygame.Rect(area.left if dx > 0 else area.right + dx, area.top, abs(dx), area.height))
+            if dy:
+                self.invalidate(pygame.Rect(area.left, area.top if dy > 0 else area.bottom + dy, area.width, abs(dy)))
+            self.scene_present.append(area.copy())
+        else:
+            self.invalidate()
+
+    def pan_by(self, dx, dy):
+        self.set_view(self.zoom, (self.pan[0] + dx, self.pan[1] + dy))
+
+    def zoom_at(self, factor, pos):
+        # O ponto do mundo sob pos continua sob pos.
+        x, y = self.to_world(pos)
+        zoom = min(max(self.zoom * factor, MIN_ZOOM), MAX_ZOOM)
+        self.set_view(zoom, (pos[0] - x * zoom, pos[1] - y * zoom))
+
+    def reset_view(self):
+        self.set_view(1.0, (0, 0))
+
+
+
+# ================== (camadas / retângulos sujos) ==================
+    def invalidate(self, rect=None):
+        # Marca uma região da camada de formas (na tela) para ser refeita (None = tudo).
+        if rect is None:
+            self.scene_repaint[:] = [self.drawing_area.copy()]
+        else:
+            self.scene_repaint.append(pygame.Rect(rect))
+
+    def invalidate_shapes(self, shapes):
+        for shape in shapes:
+            self.invalidate(shape.dirty_rect(self.view))
+
+    def reindex(self, shapes):
+        for shape in shapes:
+            self.index.update(shape)
+
+    def add_shape(self, shape):
+        # Forma nova fica por cima das outras: basta pintá-la na camada.
+        self.history.push(AddShapesCommand([(len(self.shapes), shape)]))
+        self.shapes.append(shape)
+        self.index.insert(shape)
+        self.scene_layer.set_clip(self.drawing_area)
+        self.scene_present.append(shape.render(self.scene_layer, self.line_algo, self.view))
+        self.scene_layer.set_clip(None)
+        self.profiler.count(shapes=1)
+
+    def repaint_scene(self):
+        rects = [r.clip(self.drawing_area) for r in self.scene_repaint]
+        rects = [r for r in rects if r.width > 0 and r.height > 0]
+        self.scene_repaint.clear()
+        if len(rects) > 16:
+            rects = [rects[0].unionall(rects[1:])]
+        pad = 2 * (MAX_BRUSH + 3)
+        for rect in rects:
+            # Só as formas cuja caixa toca a região visível são consultadas.
+            shapes = self.index.query_rect(self.world_rect(rect.inflate(pad, pad)))
+            if (rect == self.drawing_area and self.tile_workers > 1 and len(shapes) >= TILE_MIN_SHAPES
+                    and self.cache_is_cold(shapes)):
+                self.render_tiled(shapes)
+                continue
+            self.scene_layer.set_clip(rect)
+            self.scene_layer.fill(COLORS['background'])
+            for shape in shapes:
+                if shape.dirty_rect(self.view).colliderect(rect):
+                    shape.render(self.scene_layer, self.line_algo, self.view)
+                    self.profiler.count(shapes=1)
+        self.scene_layer.set_clip(None)
+        self.scene_present.extend(rects)
+
+    def cache_is_cold(self, shapes):
+        # Os blocos só compensam com ao menos TILE_MIN_SHAPES formas a
+        # rasterizar: com o cache quente, compor as superfícies guardadas é
+        # bem mais rápido (os processos não usam nem preenchem o cache).
+        warm_limit = len(shapes) - TILE_MIN_SHAPES
+        warm = 0
+        for shape in shapes:
+            if shape.is_cached(self.line_algo, self.view):
+                warm += 1
+                if warm > warm_limit:
+                    return False
+        return True
+
+    def render_tiled(self, shapes):
+        if self.tile_renderer is None:
+            # A camada de formas passa a ser a tela compartilhada: os processos
+            # desenham nela e não sobra cópia a fazer depois de cada redesenho.
+            self.tile_renderer = TileRenderer((WIDTH, HEIGHT), self.tile_workers)
+            self.tile_renderer.canvas.blit(self.scene_layer, (0, 0))
+            self.scene_layer = self.tile_renderer.canvas
+            atexit.register(self.close_tiles)
+        drawn = self.tile_renderer.render(self.drawing_area, shapes, self.line_algo, self.view)
+        self.profiler.count(shapes=drawn)
+
+    def close_tiles(self):
+        # A camada volta para uma superfície própria antes de a memória fechar.
+        if self.tile_renderer is not None:
+            self.scene_layer = self.scene_layer.copy()
+            self.tile_renderer.close()
+            self.tile_renderer = None
+
+    def draw_overlays(self):
+        # Elementos temporários desenhados direto na tela, por cima da camada.
+        rects = []
+        if self.scheduler.degraded and len(self.selected_shapes) > 1:
+            # Sob carga: uma caixa só em volta de toda a seleção.
+            box = self.selected_shapes[0].bounding_box.unionall([s.bounding_box for s in self.selected_shapes[1:]])
+            rects.append(pygame.draw.rect(self.screen, COLORS['highlight'], view_rect(box, self.view).inflate(5, 5), 2))
+        else:
+            for shape in self.selected_shapes:
+                rects.append(shape.draw_selection(self.screen, self.view))
+        with self.profiler.phase('prévias'):
+            rects.extend(self.draw_previews())
+
+        if self.dragging and self.selection_rect and self.current_mode == 'selecionar':
+            rects.append(self.draw_translucent_rect(view_rect(self.selection_rect, self.view),
+                                                    (255, 150, 50, 50), COLORS['selection']))
+
+        if self.current_mode == 'recorte' and self.recorte_rect:
+            rects.append(self.draw_translucent_rect(view_rect(self.recorte_rect, self.view),
+                                                    (255, 0, 0, 50), COLORS['clip']))
+        elif self.clipping_window:
+            if self.clipping_window.width > 0 and self.clipping_window.height > 0:
+                rects.append(self.draw_translucent_rect(view_rect(self.clipping_window, self.view),
+                                                        (255, 0, 0, 50), COLORS['clip']))
+        if self.profiler.visible:
+            rects.append(self.draw_profile())
+        return rects
+
+    def draw_profile(self):
+        # Texto que muda a cada quadro: renderizado direto, fora do cache.
+        font = get_font(14)
+        lines = [font.render(line, True, COLORS['text']) for line in self.profiler.summary()]
+        width = max(line.get_width() for line in lines) + 20
+        panel = pygame.Surface((width, 20 * len(lines) + 10), pygame.SRCALPHA)
+        panel.fill((0, 0, 0, 170))
+        for i, line in enumerate(lines):
+            panel.blit(line, (10, 5 + 20 * i))
+        return self.screen.blit(panel, (self.drawing_area.x + 10, self.drawing_area.y + 10))
 
+    def draw_translucent_rect(self, rect, fill, border):
+        area = pygame.Rect(rect)
+        area.normalize()
+        # Com zoom o retângulo pode ser enorme: só a parte perto da área de desenho.
+        area = area.clip(self.drawing_area.inflate(8, 8))
+        if area.width == 0 or area.height == 0:
+            return pygame.Rect(area.topleft, (0, 0))
+        surface = pygame.Surface(area.size, pygame.SRCALPHA)
+        surface.fill(fill)
+        pygame.draw.rect(surface, border, surface.get_rect(), 2)
+        return self.screen.blit(surface, area.topleft)
 
     def is_in_drawing_area(self, pos):
         return self.drawing_area.collidepoint(pos)
 
     def draw_toolbar(self):
         pygame.draw.rect(self.screen, COLORS['toolbar'], self.toolbar_rect)
-        buttons = []
-        spacing = 10
-        x_offset = 20
-        for i, mode in enumerate(self.modes):
-            x = x_offset + i * (self.mode_button_width + spacing)
-            btn_rect = pygame.Rect(x, 10, self.mode_button_width, 30)
+        mouse_pos = pygame.mouse.get_pos()
+        for mode, btn_rect in zip(self.modes, self.mode_rects):
             color = COLORS['active'] if mode == self.current_mode else COLORS['button']
-            if btn_rect.collidepoint(pygame.mouse.get_pos()):
+            if btn_rect.collidepoint(mouse_pos):
                 color = COLORS['hover']
-            pygame.draw.rect(self.screen, color, btn_rect, border_radius=3)
-            texto = self.small_font.render(mode.upper(), True, COLORS['text'])
-            self.screen.blit(texto, (btn_rect.x + 5, btn_rect.y + 5))
-            buttons.append(btn_rect)
+            self.screen.blit(button_face(btn_rect.size, mode.upper(), color), btn_rect)
 
-        final_modes_x = x_offset + len(self.modes)*(self.mode_button_width + spacing)
-        tamanho_texto = self.small_font.render(f'Tamanho: {self.brush_size}', True, COLORS['text'])
+        final_modes_x = self.mode_rects[-1].right + 10
+        tamanho_texto = render_text(f'Tamanho: {self.brush_size}', 14)
         text_w = tamanho_texto.get_width()
         base_x = final_modes_x + 50
         base_y = 15
@@ -485,12 +3154,22 @@ class GraphicsEditor:
         self.size_minus_button.draw(self.screen)
         self.size_plus_button.draw(self.screen)
 
-        return buttons
-
     def draw_sidebar(self):
-        pygame.draw.rect(self.screen, COLORS['sidebar'], self.sidebar_rect)
-        titulo = self.font.render("Instruções", True, COLORS['text'])
-        self.screen.blit(titulo, (WIDTH - 280, 20))
+        # Fundo, título e instruções não mudam: são renderizados uma vez.
+        if self.sidebar_base is None:
+            self.sidebar_base = self.render_sidebar_base()
+        self.screen.blit(self.sidebar_base, self.sidebar_rect)
+
+        for btn in self.transform_controls:
+            btn.draw(self.screen)
+        self.toggle_line_algo_button.draw(self.screen)
+        self.toggle_polygon_clip_button.draw(self.screen)
+
+    def render_sidebar_base(self):
+        base = pygame.Surface(self.sidebar_rect.size)
+        base.fill(COLORS['sidebar'])
+        x = WIDTH - 280 - self.sidebar_rect.x
+        base.blit(render_text("Instruções", 18), (x, 20))
         instrucoes = [
             "Modos de desenho:",
             "DESENHO LIVRE: Clique e arraste",
@@ -515,18 +3194,67 @@ class GraphicsEditor:
         ]
         y = 60
         for linha in instrucoes:
-            txt = self.small_font.render(linha, True, COLORS['text'])
-            self.screen.blit(txt, (WIDTH - 280, y))
+            base.blit(render_text(linha, 14), (x, y))
             y += 20
+        return base
 
-        for btn in self.transform_controls:
-            btn.draw(self.screen)
-        self.toggle_line_algo_button.draw(self.screen)
+    def hovered_button(self, pos):
+        # Botão destacado sob o cursor (o destaque das barras depende só disso).
+        buttons = [self.size_minus_button, self.size_plus_button, self.toggle_line_algo_button,
+                   self.toggle_polygon_clip_button] + self.transform_controls
+        rects = self.mode_rects + [button.rect for button in buttons]
+        return next((tuple(rect) for rect in rects if rect.collidepoint(pos)), None)
 
-    def handle_events(self):
-        mouse_pos = pygame.mouse.get_pos()
-        for event in pygame.event.get():
+    def changes_frame(self, event, pos):
+        # Cliques, teclas e roda podem mudar qualquer estado. Um movimento do
+        # mouse só muda o quadro se troca o botão destacado ou se há uma prévia
+        # ou arraste seguindo o cursor.
+        if event.type != pygame.MOUSEMOTION:
+            return True
+        hover = self.hovered_button(pos)
+        changed = hover != self.hover
+        self.hover = hover
+        return changed or bool(self.temp_points or self.dragging or self.translation_active
+                               or self.panning is not None)
+
+    def handle_events(self, events=None):
+        # Cada evento usa a própria posição; teclas e roda usam a posição atual.
+        # No desenho livre todos os movimentos viram amostras do traço.
+        if events is None:
+            events = pygame.event.get()
+        if self.current_mode != 'desenho livre':
+            events = coalesce_motion(events)
+        pointer = pygame.mouse.get_pos()
+        for event in events:
+            mouse_pos = getattr(event, 'pos', pointer)
+            if self.changes_frame(event, mouse_pos):
+                self.frame_dirty = True
+            # Câmera: roda = zoom no cursor, botão do meio arrasta, setas deslocam.
+            if event.type == pygame.MOUSEWHEEL and self.is_in_drawing_area(mouse_pos):
+                self.zoom_at(ZOOM_STEP ** event.y, mouse_pos)
+                continue
+            if event.type == pygame.MOUSEBUTTONDOWN and event.button == 2 and self.is_in_drawing_area(mouse_pos):
+                self.panning = mouse_pos
+                continue
+            if self.panning is not None:
+                if event.type == pygame.MOUSEMOTION:
+                    self.pan_by(mouse_pos[0] - self.panning[0], mouse_pos[1] - self.panning[1])
+                    self.panning = mouse_pos
+                    continue
+                if event.type == pygame.MOUSEBUTTONUP and event.button == 2:
+                    self.panning = None
+                    continue
+            if event.type in (pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP) and event.button in (4, 5):
+                continue
+            world_pos = self.to_world(mouse_pos)
             if event.type == pygame.KEYDOWN:
+                arrows = {pygame.K_LEFT: (PAN_STEP, 0), pygame.K_RIGHT: (-PAN_STEP, 0),
+                          pygame.K_UP: (0, PAN_STEP), pygame.K_DOWN: (0, -PAN_STEP)}
+                if event.key in arrows:
+                    self.pan_by(*arrows[event.key])
+                elif event.key == pygame.K_HOME:
+                    self.reset_view()
+                    print("Vista restaurada.")
                 if event.key == pygame.K_ESCAPE:
                     if self.clipping_window:
                         self.clipping_window = None
@@ -536,12 +3264,33 @@ class GraphicsEditor:
                             shape.selected = False
                         self.selected_shapes.clear()
                         print("Objetos desmarcados (ESC).")
+                elif event.key == pygame.K_F3:
+                    self.profiler.visible = not self.profiler.visible
+                elif event.key == pygame.K_F4:
+                    path = self.profiler.dump()
+                    if path:
+                        print("Perfil de quadros salvo em", path + ".csv/.json")
                 mods = pygame.key.get_mods()
                 if mods & pygame.KMOD_CTRL:
                     if event.key == pygame.K_z:
                         self.undo()
                     elif event.key == pygame.K_y:
                         self.redo()
+                    elif event.key == pygame.K_f:
+                        self.flatten_selected()
+                    elif event.key == pygame.K_s:
+                        self.save_scene_file()
+                    elif event.key == pygame.K_o:
+                        self.load_scene_file()
+                    elif event.key == pygame.K_e:
+                        for path in EXPORT_FILES:
+                            self.export_file(path)
+                    elif event.key == pygame.K_i:
+                        path = next((p for p in IMPORT_FILES if os.path.exists(p)), None)
+                        if path:
+                            self.import_file(path)
+                        else:
+                            print("Nenhum arquivo para importar:", ", ".join(IMPORT_FILES))
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
@@ -552,8 +3301,9 @@ class GraphicsEditor:
                     for btn in self.transform_controls:
                         btn.is_clicked(event)
                     self.toggle_line_algo_button.is_clicked(event)
+                    self.toggle_polygon_clip_button.is_clicked(event)
             if event.type == pygame.MOUSEBUTTONDOWN and mouse_pos[1] < 50:
-                for i, btn in enumerate(self.draw_toolbar()):
+                for i, btn in enumerate(self.mode_rects):
                     if btn.collidepoint(mouse_pos):
                         new_mode = self.modes[i]
                         if self.current_mode == "selecionar" and new_mode != "selecionar":
@@ -571,11 +3321,11 @@ class GraphicsEditor:
             elif self.is_in_drawing_area(mouse_pos):
                 if self.current_mode == 'recorte':
                     if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-                        self.recorte_rect = pygame.Rect(mouse_pos, (0, 0))
+                        self.recorte_rect = pygame.Rect(world_pos, (0, 0))
                         self.dragging = True
                     elif event.type == pygame.MOUSEMOTION and self.dragging:
-                        self.recorte_rect.width = mouse_pos[0] - self.recorte_rect.x
-                        self.recorte_rect.height = mouse_pos[1] - self.recorte_rect.y
+                        self.recorte_rect.width = world_pos[0] - self.recorte_rect.x
+                        self.recorte_rect.height = world_pos[1] - self.recorte_rect.y
                     elif event.type == pygame.MOUSEBUTTONUP and self.dragging:
                         self.dragging = False
                         self.clipping_window = self.recorte_rect
@@ -584,31 +3334,41 @@ class GraphicsEditor:
                 else:
                     if self.transformation_mode == "transladar":
                         if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-                            for shape in self.selected_shapes:
-                                if shape.bounding_box.collidepoint(mouse_pos):
+                            for shape in self.index.query_point(world_pos):
+                                if shape.selected and shape.bounding_box.collidepoint(world_pos):
                                     self.translation_active = True
-                                    self.translation_start = mouse_pos
-                                    self.translation_orig = {s: copy.deepcopy(s.points) for s in self.selected_shapes}
+                                    self.translation_start = world_pos
+                                    self.translation_orig = {s: s.geometry for s in self.selected_shapes}
                                     break
                         elif event.type == pygame.MOUSEMOTION and self.translation_active:
-                            dx = mouse_pos[0] - self.translation_start[0]
-                            dy = mouse_pos[1] - self.translation_start[1]
+                            dx = world_pos[0] - self.translation_start[0]
+                            dy = world_pos[1] - self.translation_start[1]
+                            self.invalidate_shapes(self.selected_shapes)
+                            # O(1) por forma: só a matriz muda, a partir da do início do arraste.
+                            move = translation_matrix(dx, dy)
                             for s in self.selected_shapes:
-                                s.points = [(orig[0] + dx, orig[1] + dy) for orig in self.translation_orig[s]]
+                                matrix = self.translation_orig[s][1]
+                                s.set_matrix(move if matrix is None else move @ matrix)
                                 s.bounding_box = s.calculate_bounding_box()
+                            self.reindex(self.selected_shapes)
+                            self.invalidate_shapes(self.selected_shapes)
                         elif event.type == pygame.MOUSEBUTTONUP and self.translation_active:
                             self.translation_active = False
                             self.transformation_mode = None
                             print("Translação aplicada.")
-                            self.save_state()
+                            shapes = list(self.translation_orig)
+                            self.record_geometry(shapes, [self.translation_orig[s] for s in shapes])
                     else:
                         if self.current_mode == 'selecionar':
                             if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-                                self.selection_start = mouse_pos
-                                self.selection_rect = pygame.Rect(mouse_pos, (0, 0))
+                                self.selection_start = world_pos
+                                self.selection_rect = pygame.Rect(world_pos, (0, 0))
                                 self.dragging = True
-                                for shape in reversed(self.shapes):
-                                    if shape.bounding_box.collidepoint(mouse_pos):
+                                # O traço pode passar fora da caixa, a até um pincel de distância.
+                                reach = (MAX_BRUSH + PICK_TOLERANCE) / self.zoom
+                                near = pygame.Rect(world_pos[0] - reach, world_pos[1] - reach, 2 * reach + 1, 2 * reach + 1)
+                                for shape in reversed(self.index.query_rect(near)):
+                                    if shape.hit_test(world_pos, zoom=self.zoom):
                                         shape.selected = not shape.selected
                                         if shape.selected and shape not in self.selected_shapes:
                                             self.selected_shapes.append(shape)
@@ -619,19 +3379,18 @@ class GraphicsEditor:
                         elif self.current_mode == 'polígono':
                             if event.type == pygame.MOUSEBUTTONDOWN:
                                 if event.button == 1:
-                                    self.temp_points.append(mouse_pos)
+                                    self.temp_points.append(world_pos)
                                 elif event.button == 3 and len(self.temp_points) >= 3:
-                                    self.shapes.append(Shape('polígono', self.temp_points.copy(), COLORS['draw'], thickness=self.brush_size))
-                                    self.save_state()
+                                    self.add_shape(Shape('polígono', self.temp_points.copy(), COLORS['draw'], thickness=self.brush_size))
                                     self.temp_points.clear()
                         elif self.current_mode == 'desenho livre':
                             if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
                                 self.drawing = True
-                                self.temp_points.append(mouse_pos)
+                                self.temp_points.append(world_pos)
                         elif self.current_mode in ['linha', 'círculo']:
                             if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
                                 if len(self.temp_points) < 2:
-                                    self.temp_points.append(mouse_pos)
+                                    self.temp_points.append(world_pos)
             if event.type == pygame.MOUSEBUTTONUP:
                 if self.current_mode == 'selecionar' and self.dragging:
                     self.dragging = False
@@ -640,133 +3399,368 @@ class GraphicsEditor:
                 elif self.current_mode == 'desenho livre' and self.drawing:
                     self.drawing = False
                     if len(self.temp_points) > 1:
-                        self.shapes.append(Shape('desenho livre', self.temp_points.copy(), COLORS['draw'], thickness=self.brush_size))
-                        self.save_state()
+                        points = simplify_stroke(self.temp_points, self.stroke_tolerance / self.zoom)
+                        self.add_shape(Shape('desenho livre', points, COLORS['draw'], thickness=self.brush_size))
                     self.temp_points.clear()
                 elif self.current_mode == 'linha' and len(self.temp_points) == 2:
-                    self.shapes.append(Shape('linha', self.temp_points.copy(), COLORS['draw'], thickness=self.brush_size))
-                    self.save_state()
+                    self.add_shape(Shape('linha', self.temp_points.copy(), COLORS['draw'], thickness=self.brush_size))
                     self.temp_points.clear()
                 elif self.current_mode == 'círculo' and len(self.temp_points) == 2:
                     radius = math.hypot(self.temp_points[1][0] - self.temp_points[0][0],
                                         self.temp_points[1][1] - self.temp_points[0][1])
-                    self.shapes.append(Shape('círculo', [self.temp_points[0]], COLORS['draw'], radius=int(radius), thickness=self.brush_size))
-                    self.save_state()
+                    self.add_shape(Shape('círculo', [self.temp_points[0]], COLORS['draw'], radius=int(radius), thickness=self.brush_size))
                     self.temp_points.clear()
             if event.type == pygame.MOUSEMOTION:
                 if self.current_mode == 'desenho livre' and self.drawing and self.is_in_drawing_area(mouse_pos):
-                    self.temp_points.append(mouse_pos)
+                    capture_point(self.temp_points, world_pos, self.stroke_min_distance / self.zoom,
+                                  self.stroke_collinear / self.zoom)
                 elif self.current_mode == 'selecionar' and self.dragging:
-                    self.selection_rect.width = mouse_pos[0] - self.selection_rect.x
-                    self.selection_rect.height = mouse_pos[1] - self.selection_rect.y
+                    self.selection_rect.width = world_pos[0] - self.selection_rect.x
+                    self.selection_rect.height = world_pos[1] - self.selection_rect.y
 
     def finalize_selection(self):
-        for shape in self.shapes:
-            if self.selection_rect.colliderect(shape.bounding_box):
-                shape.selected = True
-                if shape not in self.selected_shapes:
-                    self.selected_shapes.append(shape)
-            else:
-                if shape.selected and not self.selection_rect.colliderect(shape.bounding_box):
-                    shape.selected = False
-                    if shape in self.selected_shapes:
-                        self.selected_shapes.remove(shape)
+        hits = [shape for shape in self.index.query_rect(self.selection_rect)
+                if self.selection_rect.colliderect(shape.bounding_box)]
+        hit_set = set(hits)
+        for shape in list(self.selected_shapes):
+            if shape not in hit_set:
+                shape.selected = False
+                self.selected_shapes.remove(shape)
+        for shape in hits:
+            shape.selected = True
+            if shape not in self.selected_shapes:
+                self.selected_shapes.append(shape)
 
     def apply_clipping(self, algo):
         if not self.clipping_window:
             print("Nenhuma janela de recorte definida.")
             return
+        rect = self.clipping_window
         shapes_to_remove = []
+        changes = []
+        # Linhas: todas de uma vez pelos recortadores em lote. As totalmente
+        # dentro ficam intactas; as demais são recortadas ou descartadas.
+        lines = [shape for shape in self.shapes if shape.type == 'linha']
+        if lines:
+            bounds = shape_bounds(lines)
+            inside = ((bounds[:, 0] >= rect.left) & (bounds[:, 2] <= rect.right) &
+                      (bounds[:, 1] >= rect.top) & (bounds[:, 3] <= rect.bottom))
+            crossing = np.flatnonzero(~inside)
+            store = ShapeStore([lines[i] for i in crossing])
+            world, starts = store.world_points(), store.offsets[:-1]
+            segments = np.hstack((world[starts], world[starts + 1]))
+            clip_batch = cohen_sutherland_clip_batch if algo == 'cs' else liang_barsky_clip_batch
+            clipped, accept = clip_batch(segments, rect)
+            kept = [lines[i] for i in crossing[accept]]
+            changes.extend((shape, shape.geometry) for shape in kept)
+            ShapeStore(kept).scatter(clipped[accept].reshape(-1, 2))
+            self.reindex(kept)
+            shapes_to_remove.extend(lines[i] for i in crossing[~accept])
+        # Desenhos livres: todos os segmentos numa passada; cada trecho que
+        # volta para dentro da janela vira uma forma nova logo acima da original.
+        pieces = {}
+        strokes = [shape for shape in self.shapes if shape.type == 'desenho livre']
+        if strokes:
+            bounds = shape_bounds(strokes)
+            inside = ((bounds[:, 0] >= rect.left) & (bounds[:, 2] <= rect.right) &
+                      (bounds[:, 1] >= rect.top) & (bounds[:, 3] <= rect.bottom))
+            crossing = [strokes[i] for i in np.flatnonzero(~inside)]
+            store = ShapeStore(crossing)
+            clip_batch = cohen_sutherland_clip_batch if algo == 'cs' else liang_barsky_clip_batch
+            owners, runs = clip_polylines(store.world_points(), store.offsets, rect, clip_batch)
+            for owner, run in zip(owners.tolist(), runs):
+                shape = crossing[owner]
+                if shape in pieces:
+                    pieces[shape].append(Shape('desenho livre', run, shape.color, thickness=shape.thickness))
+                    continue
+                pieces[shape] = []
+                changes.append((shape, shape.geometry))
+                shape.points = run
+                shape.bounding_box = shape.calculate_bounding_box()
+                self.index.update(shape)
+            shapes_to_remove.extend(shape for shape in crossing if shape not in pieces)
+        # Formas fora do índice da janela estão totalmente fora: descartadas.
+        candidates = set(self.index.query_rect(rect))
         for shape in self.shapes:
-            if shape.type == 'linha':
-                if algo == 'cs':
-                    clipped = cohen_sutherland_clip(shape.points, self.clipping_window)
-                else:
-                    clipped = liang_barsky_clip(shape.points, self.clipping_window)
-                if clipped:
-                    shape.points = clipped
+            if shape.type not in ('polígono', 'círculo'):
+                continue
+            if shape not in candidates:
+                shapes_to_remove.append(shape)
+                continue
+            left, top, right, bottom = shape.bounds()
+            if left >= rect.left and right <= rect.right and top >= rect.top and bottom <= rect.bottom:
+                continue
+            if shape.type == 'círculo':
+                # O contorno vira arcos; os já existentes são levados ao referencial da tela.
+                arcs = shape.arcs
+                if shape.matrix is not None:
+                    arcs = transform_arcs(arcs, shape.matrix[:2, :2])
+                center = shape.points[0]
+                arcs = clip_circle_arcs(center, shape.radius, rect, arcs)
+                if arcs:
+                    changes.append((shape, shape.geometry))
+                    shape.points = [center]
+                    shape.arcs = arcs
                     shape.bounding_box = shape.calculate_bounding_box()
+                    self.index.update(shape)
                 else:
                     shapes_to_remove.append(shape)
-            elif shape.type == 'polígono':
-                clipped = sutherland_hodgman_clip(shape.points, self.clipping_window)
-                if clipped and len(clipped) >= 3:
-                    shape.points = clipped
-                    shape.bounding_box = shape.calculate_bounding_box()
-                else:
-                    shapes_to_remove.append(shape)
-        for s in shapes_to_remove:
-            self.shapes.remove(s)
+                continue
+            # Weiler-Atherton: um polígono côncavo pode virar vários pedaços.
+            if self.polygon_clip == 'WA':
+                clipped, *rest = weiler_atherton_clip(shape.points.tolist(), rect) or [None]
+                pieces[shape] = [Shape('polígono', part, shape.color, thickness=shape.thickness)
+                                 for part in rest]
+            else:
+                clipped = sutherland_hodgman_clip(shape.points.tolist(), rect)
+            if clipped and len(clipped) >= 3:
+                changes.append((shape, shape.geometry))
+                shape.points = clipped
+                shape.bounding_box = shape.calculate_bounding_box()
+                self.index.update(shape)
+            else:
+                shapes_to_remove.append(shape)
+        added = []
+        if any(pieces.values()):
+            shapes = []
+            for shape in self.shapes:
+                shapes.append(shape)
+                for piece in pieces.get(shape, ()):
+                    added.append((len(shapes), piece))
+                    shapes.append(piece)
+            self.insert_shapes(added)
+        removed = set(shapes_to_remove)
+        entries = [(i, s) for i, s in enumerate(self.shapes) if s in removed]
+        self.remove_shapes(shapes_to_remove)
+        self.invalidate()
         print("Recorte aplicado usando", "Cohen-Sutherland" if algo == 'cs' else "Liang-Barsky")
-        self.save_state()
+        if changes or entries:
+            self.history.push(CompositeCommand([
+                GeometryCommand([(s, b, s.geometry) for s, b in changes]),
+                AddShapesCommand(added),
+                RemoveShapesCommand(entries)]))
+
+    def reset_preview(self):
+        if self.preview_rect:
+            self.preview_layer.fill((0, 0, 0, 0), self.preview_rect)
+        self.preview_rect = None
+        self.preview_count = 0
+        self.preview_key = None
+
+    def extend_preview(self, points):
+        # Rasteriza no rascunho só os segmentos novos entre pontos fixos.
+        key = (self.current_mode, self.brush_size, self.line_algo, self.zoom, self.pan,
+               points[0] if points else None)
+        if key != self.preview_key or len(points) < self.preview_count:
+            self.reset_preview()
+            self.preview_key = key
+        start = max(self.preview_count - 1, 0)
+        if len(points) - start < 2:
+            return
+        new_points = [self.to_screen(p) for p in points[start:]]
+        if self.current_mode == 'desenho livre':
+            rect = draw_polyline(self.preview_layer, new_points,
+                                 COLORS['draw'], self.brush_size, self.line_algo)
+        else:
+            rect = pygame.draw.lines(self.preview_layer, COLORS['draw'], False, new_points, self.brush_size)
+        if rect.width and rect.height:
+            self.preview_rect = rect if self.preview_rect is None else self.preview_rect.union(rect)
+        self.preview_count = len(points)
 
     def draw_previews(self):
-        if self.is_in_drawing_area(pygame.mouse.get_pos()):
+        rects = []
+        mouse_pos = pygame.mouse.get_pos()
+        if not self.temp_points or self.current_mode not in ('desenho livre', 'polígono'):
+            if self.preview_key is not None:
+                self.reset_preview()
+        if self.is_in_drawing_area(mouse_pos):
             if self.current_mode == 'desenho livre' and len(self.temp_points) > 0:
-                if len(self.temp_points) >= 2:
-                    for i in range(len(self.temp_points)-1):
-                        if self.line_algo == 'DDA':
-                            draw_line_dda(self.screen, self.temp_points[i], self.temp_points[i+1], COLORS['draw'], self.brush_size)
-                        else:
-                            draw_line_bresenham(self.screen, self.temp_points[i], self.temp_points[i+1], COLORS['draw'], self.brush_size)
-                last_point = self.temp_points[-1]
-                if self.line_algo == 'DDA':
-                    draw_line_dda(self.screen, last_point, pygame.mouse.get_pos(), COLORS['draw'], self.brush_size)
-                else:
-                    draw_line_bresenham(self.screen, last_point, pygame.mouse.get_pos(), COLORS['draw'], self.brush_size)
+                # A ponta do traço ainda pode andar (capture_point): só os
+                # pontos anteriores a ela vão para o rascunho.
+                fixed = self.temp_points[:-1]
+                self.extend_preview(fixed)
+                if self.preview_rect:
+                    rects.append(self.screen.blit(self.preview_layer, self.preview_rect, self.preview_rect))
+                tail = [self.to_screen(p) for p in fixed[-1:] + self.temp_points[-1:]]
+                rects.append(draw_polyline(self.screen, tail + [mouse_pos],
+                                           COLORS['draw'], self.brush_size, self.line_algo))
             elif self.current_mode == 'linha' and len(self.temp_points) == 1:
-                if self.line_algo == 'DDA':
-                    draw_line_dda(self.screen, self.temp_points[0], pygame.mouse.get_pos(), COLORS['draw'], self.brush_size)
+                start = self.to_screen(self.temp_points[0])
+                if self.scheduler.degraded:
+                    # Sob carga a prévia usa as primitivas do pygame.
+                    rects.append(pygame.draw.line(self.screen, COLORS['draw'], start, mouse_pos, self.brush_size))
                 else:
-                    draw_line_bresenham(self.screen, self.temp_points[0], pygame.mouse.get_pos(), COLORS['draw'], self.brush_size)
+                    rects.append(draw_polyline(self.screen, [start, mouse_pos],
+                                               COLORS['draw'], self.brush_size, self.line_algo))
             elif self.current_mode == 'círculo' and len(self.temp_points) == 1:
-                radius = math.hypot(pygame.mouse.get_pos()[0] - self.temp_points[0][0],
-                                    pygame.mouse.get_pos()[1] - self.temp_points[0][1])
-                draw_circle_bresenham(self.screen, self.temp_points[0], int(radius), COLORS['draw'], self.brush_size)
+                # Mesmo raio (inteiro, no mundo) que o círculo terá ao ser criado.
+                world_pos = self.to_world(mouse_pos)
+                radius = int(math.hypot(world_pos[0] - self.temp_points[0][0],
+                                        world_pos[1] - self.temp_points[0][1]))
+                if self.view is not None:
+                    radius = int(radius * self.zoom)
+                center = self.to_screen(self.temp_points[0])
+                if self.scheduler.degraded:
+                    rects.append(pygame.draw.circle(self.screen, COLORS['draw'], center, radius, self.brush_size))
+                elif self.line_algo == 'AA':
+                    rects.append(draw_circle_aa(self.screen, center, radius, COLORS['draw'], self.brush_size))
+                else:
+                    rects.append(draw_circle_bresenham(self.screen, center, radius,
+                                                       COLORS['draw'], self.brush_size))
             elif self.current_mode == 'polígono' and len(self.temp_points) > 0:
-                if len(self.temp_points) >= 2:
-                    pygame.draw.lines(self.screen, COLORS['draw'], False, self.temp_points, self.brush_size)
-                pygame.draw.line(self.screen, COLORS['draw'],
-                                 self.temp_points[-1],
-                                 pygame.mouse.get_pos(),
-                                 self.brush_size)
+                self.extend_preview(self.temp_points)
+                if self.preview_rect:
+                    rects.append(self.screen.blit(self.preview_layer, self.preview_rect, self.preview_rect))
+                rects.append(pygame.draw.line(self.screen, COLORS['draw'],
+                                              self.to_screen(self.temp_points[-1]),
+                                              mouse_pos,
+                                              self.brush_size))
+        return rects
 
-    def draw(self):
-        self.screen.fill(COLORS['background'])
-        self.draw_toolbar()
-        self.draw_sidebar()
+    def needs_redraw(self):
+        # Com o perfil visível o resumo muda a cada quadro.
+        return bool(self.frame_dirty or self.scene_repaint or self.scene_present or self.profiler.visible)
 
-        for shape in self.shapes:
-            shape.draw(self.screen, self.line_algo)
+    def draw(self):
+        # Quadro ocioso (sem eventos nem mudanças na cena) não redesenha nada.
+        profiler = self.profiler
+        if self.needs_redraw():
+            SHAPE_CACHE.next_frame()
+            if self.scene_repaint:
+                with profiler.phase('cena'):
+                    self.repaint_scene()
+            dirty = []
+            if self.frame_dirty:
+                with profiler.phase('barras'):
+                    self.draw_toolbar()
+                    self.draw_sidebar()
+                dirty += [self.toolbar_rect, self.sidebar_rect]
 
-        self.draw_previews()
+            # Restaura da camada as regiões alteradas e as sobreposições do
+            # quadro anterior, e redesenha as sobreposições por cima.
+            with profiler.phase('sobreposições'):
+                self.screen.set_clip(self.drawing_area)
+                restore = self.scene_present + self.overlay_rects
+                for rect in restore:
+                    self.screen.blit(self.scene_layer, rect, rect)
+                self.overlay_rects = self.draw_overlays()
+                self.screen.set_clip(None)
+            dirty += [r.clip(self.drawing_area) for r in restore + self.overlay_rects]
+            profiler.count(dirty_area=sum(r.width * r.height for r in dirty))
 
-        if self.dragging and self.selection_rect and self.current_mode == 'selecionar':
-            surface = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-            pygame.draw.rect(surface, (255, 150, 50, 50), self.selection_rect)
-            pygame.draw.rect(surface, COLORS['selection'], self.selection_rect, 2)
-            self.screen.blit(surface, (0, 0))
+            self.scene_present.clear()
+            self.frame_dirty = False
+            if not self.headless:
+                with profiler.phase('tela'):
+                    pygame.display.update(dirty)
 
-        if self.current_mode == 'recorte' and self.recorte_rect:
-            surface = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-            pygame.draw.rect(surface, (255, 0, 0, 50), self.recorte_rect)
-            pygame.draw.rect(surface, COLORS['clip'], self.recorte_rect, 2)
-            self.screen.blit(surface, (0, 0))
-        elif self.clipping_window:
-            if self.clipping_window.width > 0 and self.clipping_window.height > 0:
-                clip_surface = pygame.Surface((self.clipping_window.width, self.clipping_window.height), pygame.SRCALPHA)
-                clip_surface.fill((255, 0, 0, 50))
-                self.screen.blit(clip_surface, (self.clipping_window.x, self.clipping_window.y))
-                pygame.draw.rect(self.screen, COLORS['clip'], self.clipping_window, 2)
-
-        pygame.display.flip()
-        self.clock.tick(60)
+    def render_frames(self, count=1, cold=False):
+        # Redesenha a cena inteira count vezes; cold descarta as superfícies
+        # guardadas antes de cada quadro (rasteriza tudo de novo).
+        for _ in range(count):
+            if cold:
+                SHAPE_CACHE.clear()
+            self.invalidate()
+            self.frame_dirty = True
+            self.draw()
+        return self.screen
 
     def run(self):
         while True:
-            self.handle_events()
-            self.draw()
+            with self.profiler.phase('espera'):
+                events = self.scheduler.next_events(self.needs_redraw())
+            with self.profiler.phase('eventos'):
+                self.handle_events(events)
+            if self.needs_redraw():
+                start = time.perf_counter()
+                self.draw()
+                self.scheduler.record(time.perf_counter() - start)
+            self.profiler.end(self.history.nbytes, SHAPE_CACHE.used)
+
+# ================ (renderização em lote) ================
+# Renderiza arquivos de cena (.tp1, .svg, .json) em PNG sem janela, em vários
+# processos. Cada processo cria um editor headless uma única vez e o reusa
+# (superfícies, índice, cache) para todas as cenas que recebe.
+SCENE_EXTENSIONS = ('.tp1', '.svg', '.json')
+_RENDER_EDITOR = None
+
+def init_render_worker(line_algo='DDA'):
+    global _RENDER_EDITOR
+    _RENDER_EDITOR = GraphicsEditor(headless=True)
+    _RENDER_EDITOR.line_algo = line_algo
+    # As cenas já são divididas entre os processos: sem blocos dentro deles.
+    _RENDER_EDITOR.tile_workers = 1
+
+def render_scene_file(path, output, clip=None, clip_algo='lb'):
+    # Devolve (formas, segundos, erro); um arquivo com problema vira erro
+    # (texto) em vez de interromper o lote inteiro.
+    if _RENDER_EDITOR is None:
+        init_render_worker()
+    editor = _RENDER_EDITOR
+    start = time.perf_counter()
+    try:
+        if path.lower().endswith('.tp1'):
+            editor.set_scene(*load_scene(path))
+        else:
+            editor.set_scene(list(import_shapes(path)))
+        if clip:
+            editor.clipping_window = pygame.Rect(clip)
+            with contextlib.redirect_stdout(io.StringIO()):
+                editor.apply_clipping(clip_algo)
+        editor.repaint_scene()
+        pygame.image.save(editor.scene_layer.subsurface(editor.drawing_area), output)
+    # Arquivos corrompidos podem falhar de muitas formas (struct, numpy, XML...).
+    except Exception as error:
+        editor.set_scene([])
+        return 0, time.perf_counter() - start, f"{type(error).__name__}: {error}"
+    finally:
+        editor.clipping_window = None
+    return len(editor.shapes), time.perf_counter() - start, None
+
+def render_directory(directory, output=None, workers=None, clip=None, clip_algo='lb', line_algo='DDA'):
+    output = output or directory
+    os.makedirs(output, exist_ok=True)
+    paths = sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                   if name.lower().endswith(SCENE_EXTENSIONS))
+    # A extensão de origem fica no nome (cena.svg -> cena.svg.png), então
+    # cena.svg e cena.json não gravam o mesmo PNG.
+    outputs = [os.path.join(output, os.path.basename(p) + '.png') for p in paths]
+    workers = workers or os.cpu_count() or 1
+    chunk = max(1, len(paths) // (4 * workers))
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_render_worker,
+                             initargs=(line_algo,)) as pool:
+        results = list(pool.map(render_scene_file, paths, outputs, [clip] * len(paths),
+                                [clip_algo] * len(paths), chunksize=chunk))
+    elapsed = time.perf_counter() - start
+    shapes = sum(count for count, _, _ in results)
+    busy = sum(seconds for _, seconds, _ in results)
+    failures = [(path, error) for path, (_, _, error) in zip(paths, results) if error]
+    elapsed = max(elapsed, 1e-9)
+    rendered = len(paths) - len(failures)
+    print(f"{rendered} cenas, {shapes} formas em {elapsed:.2f} s: "
+          f"{rendered / elapsed:.1f} cenas/s, {shapes / elapsed:.0f} formas/s "
+          f"({busy / elapsed:.1f} processos ocupados em média)")
+    if failures:
+        print(f"{len(failures)} cenas não renderizadas:")
+        for path, error in failures:
+            print(f"  {path}: {error}")
+    return results
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Editor gráfico. Com --render, renderiza cenas em PNG sem janela.")
+    parser.add_argument('--render', metavar='PASTA', help="pasta com cenas .tp1/.svg/.json")
+    parser.add_argument('--output', metavar='PASTA', help="pasta dos PNG (padrão: a mesma das cenas)")
+    parser.add_argument('--workers', type=int, help="número de processos (padrão: um por núcleo)")
+    parser.add_argument('--clip', type=int, nargs=4, metavar=('X', 'Y', 'L', 'A'), help="janela de recorte")
+    parser.add_argument('--clip-algo', choices=['cs', 'lb'], default='lb')
+    parser.add_argument('--line-algo', choices=LINE_ALGOS, default='DDA')
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    editor = GraphicsEditor()
-    editor.run()
+    args = parse_args()
+    if args.render:
+        render_directory(args.render, args.output, args.workers, args.clip, args.clip_algo, args.line_algo)
+    else:
+        editor = GraphicsEditor()
+        editor.run()
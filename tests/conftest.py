@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Sem janela: o SDL usa o driver de vídeo nulo.
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,37 @@
+import math
+
+import numpy as np
+
+import main
+
+def sample_shapes():
+    # Um de cada tipo, com coordenadas fracionárias, um círculo recortado e
+    # formas com transformação pendente.
+    rng = np.random.default_rng(0)
+    shapes = [
+        main.Shape('linha', [(10.25, 20.5), (300.125, 410.75)], (255, 0, 0), thickness=1),
+        main.Shape('círculo', [(400.5, 300.25)], (0, 128, 255), radius=75, thickness=3,
+                   arcs=((0.25, 1.5), (math.pi, 0.75))),
+        main.Shape('polígono', [(100, 100), (250.5, 120), (180, 260.75), (90.25, 200)], (10, 20, 30)),
+        main.Shape('desenho livre', rng.uniform(60, 700, (200, 2)), (0, 0, 0), thickness=5),
+    ]
+    moved = main.Shape('polígono', [(500, 500), (600, 520), (560, 610)], (200, 200, 0))
+    moved.transform(main.rotation_matrix(30) @ main.translation_matrix(12.5, -7.25))
+    turned = main.Shape('círculo', [(200, 500)], (90, 0, 90), radius=40, arcs=((0.5, 2.0),))
+    turned.transform(main.rotation_matrix(45))
+    shapes += [moved, turned]
+    return shapes
+
+def assert_same_shapes(loaded, shapes):
+    assert len(loaded) == len(shapes)
+    for got, shape in zip(loaded, shapes):
+        points, arcs = main.shape_export_data(shape)
+        assert got.type == shape.type
+        assert tuple(got.color) == tuple(shape.color)
+        assert got.thickness == shape.thickness
+        assert got.radius == shape.radius
+        assert (got.points == points).all()
+        if arcs:
+            np.testing.assert_allclose(got.arcs, arcs)
+        else:
+            assert not got.arcs
@@ -0,0 +1,44 @@
+import numpy as np
+import pygame
+import pytest
+
+import main
+
+# Referência pixel a pixel: o laço original, com o pincel de
+# pygame.draw.circle em cada ponto.
+def reference_circle_bresenham(surface, center, radius, color, thickness):
+    cx, cy = center
+    x, y = 0, radius
+    d = 3 - 2 * radius
+
+    def octants(x, y):
+        for px, py in ((x, y), (-x, y), (x, -y), (-x, -y), (y, x), (-y, x), (y, -x), (-y, -x)):
+            pygame.draw.circle(surface, color, (cx + px, cy + py), thickness)
+
+    while y >= x:
+        octants(x, y)
+        x += 1
+        if d > 0:
+            y -= 1
+            d += 4 * (x - y) + 10
+        else:
+            d += 4 * x + 6
+        octants(x, y)
+
+def blank(clip=None):
+    surface = pygame.Surface((320, 240))
+    surface.fill((255, 255, 255))
+    if clip is not None:
+        surface.set_clip(clip)
+    return surface
+
+@pytest.mark.parametrize('thickness', [1, 3])
+def test_span_circles_match_reference(thickness):
+    rng = np.random.default_rng(thickness)
+    surface, expected = blank(pygame.Rect(20, 20, 260, 180)), blank(pygame.Rect(20, 20, 260, 180))
+    for i in range(30):
+        center = tuple(rng.integers(-20, 340, 2).tolist())
+        radius = int(rng.integers(0, 120))
+        main.draw_circle_bresenham(surface, center, radius, (0, i * 8, 0), thickness)
+        reference_circle_bresenham(expected, center, radius, (0, i * 8, 0), thickness)
+    assert (pygame.surfarray.array2d(surface) == pygame.surfarray.array2d(expected)).all()
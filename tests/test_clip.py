@@ -0,0 +1,59 @@
+import numpy as np
+import pygame
+import pytest
+
+import main
+
+RECT = pygame.Rect(200, 150, 500, 400)
+
+def random_segments(seed, count=2000):
+    # Segmentos dentro, fora e cruzando o retângulo, incluindo horizontais,
+    # verticais, pontos e extremos sobre as bordas.
+    rng = np.random.default_rng(seed)
+    segments = rng.uniform(0, 900, (count, 4))
+    segments[::5] = segments[::5].round()
+    segments[1::7, 2] = segments[1::7, 0]
+    segments[2::7, 3] = segments[2::7, 1]
+    segments[3::11, 2:] = segments[3::11, :2]
+    segments[4::13, 0] = RECT.left
+    segments[5::13, 3] = RECT.bottom
+    return segments
+
+@pytest.mark.parametrize('scalar, batch', [
+    (main.cohen_sutherland_clip, main.cohen_sutherland_clip_batch),
+    (main.liang_barsky_clip, main.liang_barsky_clip_batch),
+])
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_batch_matches_scalar(scalar, batch, seed):
+    segments = random_segments(seed)
+    clipped, accept = batch(segments, RECT)
+    for segment, row, accepted in zip(segments.tolist(), clipped.tolist(), accept.tolist()):
+        expected = scalar([segment[:2], segment[2:]], RECT)
+        assert accepted == (expected is not None)
+        if accepted:
+            assert row == [*expected[0], *expected[1]]
+
+def test_batch_accepts_empty_input():
+    for batch in (main.cohen_sutherland_clip_batch, main.liang_barsky_clip_batch):
+        clipped, accept = batch(np.empty((0, 4)), RECT)
+        assert clipped.shape == (0, 4) and not len(accept)
+
+def test_clip_polylines_matches_segments():
+    # Os trechos devolvidos são os segmentos aceitos, em ordem, cada um
+    # marcado com a polilinha de origem.
+    rng = np.random.default_rng(3)
+    points = rng.uniform(0, 900, (60, 2))
+    offsets = np.array([0, 20, 45, 60])
+    owners, runs = main.clip_polylines(points, offsets, RECT)
+    expected = []
+    for owner, (start, end) in enumerate(zip(offsets[:-1], offsets[1:])):
+        for a, b in zip(points[start:end - 1].tolist(), points[start + 1:end].tolist()):
+            clipped = main.liang_barsky_clip([a, b], RECT)
+            if clipped is not None:
+                expected.append((owner, clipped))
+    segments = [(owner, run[i:i + 2]) for owner, run in zip(owners.tolist(), runs)
+                for i in range(len(run) - 1)]
+    assert len(segments) == len(expected)
+    for (owner, segment), (expected_owner, clipped) in zip(segments, expected):
+        assert owner == expected_owner
+        np.testing.assert_allclose(segment, clipped)
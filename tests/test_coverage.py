@@ -0,0 +1,102 @@
+import numpy as np
+import pygame
+import pytest
+
+import main
+
+def blank(clip=None):
+    surface = pygame.Surface((320, 240))
+    surface.fill((255, 255, 255))
+    if clip is not None:
+        surface.set_clip(clip)
+    return surface
+
+def random_lines(seed, count=40):
+    # Extremos fracionários, alguns fora da superfície e alguns degenerados.
+    rng = np.random.default_rng(seed)
+    lines = rng.uniform(-30, 350, (count, 4))
+    lines[::4] = lines[::4].round()
+    lines[1::9, 2:] = lines[1::9, :2]
+    return [((x0, y0), (x1, y1)) for x0, y0, x1, y1 in lines.tolist()]
+
+def reference_coverage(starts, ends, thickness):
+    # Cobertura de todos os pixels da caixa pela distância ao segmento mais
+    # próximo; só os pixels com alpha > 0.
+    starts, ends = np.asarray(starts, dtype=np.float64), np.asarray(ends, dtype=np.float64)
+    reach = thickness + 1
+    low = np.floor(np.minimum(starts, ends).min(axis=0) - reach).astype(int)
+    high = np.ceil(np.maximum(starts, ends).max(axis=0) + reach).astype(int)
+    xs, ys = np.meshgrid(np.arange(low[0], high[0] + 1), np.arange(low[1], high[1] + 1), indexing='ij')
+    grid = np.stack((xs.ravel(), ys.ravel()), axis=1).astype(np.float64)
+    distance = np.full(len(grid), np.inf)
+    for a, b in zip(starts, ends):
+        ab = b - a
+        t = np.clip((grid - a) @ ab / max(ab @ ab, 1e-24), 0, 1)
+        distance = np.minimum(distance, np.hypot(*(grid - a - t[:, None] * ab).T))
+    alpha = np.rint(np.clip(reach - distance, 0, 1) * 255).astype(np.int64)
+    return {(x, y): value for (x, y), value in zip(grid.astype(np.int64).tolist(), alpha.tolist()) if value}
+
+def coverage_dict(pixels):
+    # Pixels repetidos ficam com a maior cobertura (como na mistura).
+    result = {}
+    for x, y, alpha in pixels.tolist():
+        result[(x, y)] = max(alpha, result.get((x, y), 0))
+    return result
+
+@pytest.mark.parametrize('thickness', [1, 2, 4])
+def test_segment_coverage_matches_distance(thickness):
+    # Uma linha por vez (caminho escalar) e todas juntas (em lote).
+    lines = random_lines(10 + thickness, count=25)
+    for start, end in lines:
+        assert coverage_dict(main.segment_coverage([start], [end], thickness)) == \
+            reference_coverage([start], [end], thickness)
+    starts, ends = zip(*lines[:6])
+    assert coverage_dict(main.segment_coverage(starts, ends, thickness)) == \
+        reference_coverage(starts, ends, thickness)
+
+def test_blend_coverage_keeps_the_largest_repeat():
+    # Nas juntas os pixels se repetem; a mistura usa a maior cobertura, uma vez.
+    points = [(10.5, 10.25), (80.75, 40.5), (30.25, 90.5), (100.5, 95.75)]
+    pixels = main.polyline_coverage(points, 2)
+    assert len(np.unique(pixels[:, :2], axis=0)) < len(pixels)
+    merged = np.array([(x, y, alpha) for (x, y), alpha in coverage_dict(pixels).items()])
+    repeated, unique = blank(), blank()
+    main.blend_coverage(repeated, pixels, (200, 30, 90))
+    main.blend_coverage(unique, merged, (200, 30, 90))
+    assert (pygame.surfarray.array3d(repeated) == pygame.surfarray.array3d(unique)).all()
+    assert coverage_dict(pixels) == reference_coverage(points[:-1], points[1:], 2)
+
+@pytest.mark.parametrize('closed', [False, True])
+@pytest.mark.parametrize('thickness', [1, 3])
+def test_polyline_coverage_matches_distance(thickness, closed):
+    # Traços longos de segmentos curtos (quase só pontas), com vértices
+    # repetidos, trechos horizontais e verticais e pontos inteiros.
+    rng = np.random.default_rng(20 + thickness)
+    angles = np.cumsum(rng.normal(0, 0.6, 120))
+    points = np.cumsum(np.stack((np.cos(angles), np.sin(angles)), axis=1) * 3, axis=0) + 100
+    points[10:20] = points[10:20].round()
+    points[30] = points[29]
+    points[40:45, 1] = points[40, 1]
+    points[50:55, 0] = points[50, 0]
+    starts = points if closed else points[:-1]
+    ends = np.roll(points, -1, axis=0) if closed else points[1:]
+    assert coverage_dict(main.polyline_coverage(points, thickness, closed)) == \
+        reference_coverage(starts, ends, thickness)
+
+@pytest.mark.parametrize('thickness', [1, 3])
+def test_blend_coverage_matches_cached_blit(thickness):
+    # Misturar direto na superfície dá o mesmo que o caminho do cache: a
+    # cobertura numa superfície com alpha, blitada com RLE.
+    points = [(5.5, 8.25), (70.75, 40.5), (20.25, 60.5)]
+    pixels = main.polyline_coverage(points, thickness)
+    bounds = main.pixel_bounds(pixels, thickness)
+    direct = blank()
+    main.blend_coverage(direct, pixels, (200, 30, 90))
+    image = pygame.Surface(bounds.size, pygame.SRCALPHA)
+    image.fill((0, 0, 0, 0))
+    main.blend_coverage(image, pixels, (200, 30, 90), offset=bounds.topleft)
+    image.set_alpha(255, pygame.RLEACCEL)
+    cached = blank()
+    cached.blit(image, bounds.topleft)
+    # O byte livre do formato de 32 bits pode diferir; as cores não.
+    assert (pygame.surfarray.array3d(direct) == pygame.surfarray.array3d(cached)).all()
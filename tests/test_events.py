@@ -0,0 +1,32 @@
+import pygame
+
+import main
+
+def motion(pos):
+    return pygame.event.Event(pygame.MOUSEMOTION, pos=pos, rel=(0, 0), buttons=(0, 0, 0))
+
+def click(pos, kind=pygame.MOUSEBUTTONDOWN):
+    return pygame.event.Event(kind, pos=pos, button=1)
+
+def dirty_after(editor, events):
+    editor.frame_dirty = False
+    editor.handle_events(events)
+    return editor.frame_dirty
+
+def test_only_events_that_change_the_frame_mark_it_dirty():
+    editor = main.GraphicsEditor(headless=True)
+    editor.current_mode = 'linha'
+    editor.handle_events([motion((300, 300))])
+    # Cursor andando na área de desenho sem prévia: nada muda na tela.
+    assert not dirty_after(editor, [motion((310, 320)), motion((400, 330))])
+    # Entrar e sair de um botão troca o destaque.
+    button = editor.mode_rects[0].center
+    assert dirty_after(editor, [motion(button)])
+    assert not dirty_after(editor, [motion((button[0] + 1, button[1]))])
+    assert dirty_after(editor, [motion((300, 300))])
+    # Com a linha começada, a prévia segue o cursor.
+    assert dirty_after(editor, [click((300, 300))])
+    assert dirty_after(editor, [motion((350, 320))])
+    assert dirty_after(editor, [click((350, 320)), click((350, 320), pygame.MOUSEBUTTONUP)])
+    assert len(editor.shapes) == 1 and not editor.temp_points
+    assert not dirty_after(editor, [motion((360, 330))])
@@ -0,0 +1,92 @@
+import contextlib
+import io
+
+import numpy as np
+
+import main
+
+class Entry:
+    def __init__(self, nbytes):
+        self.nbytes = nbytes
+        self.log = []
+
+    def undo(self, editor):
+        self.log.append('undo')
+
+    def redo(self, editor):
+        self.log.append('redo')
+
+def snapshot(shapes):
+    return [(shape.points.copy(), shape.arcs) for shape in shapes]
+
+def test_undo_and_redo_everything_restores_each_state():
+    editor = main.GraphicsEditor(headless=True)
+    quiet = contextlib.redirect_stdout(io.StringIO())
+    states = [snapshot(editor.shapes)]
+    for k in range(3):
+        shape = main.Shape('polígono', [(100 + 50 * k, 100), (140 + 50 * k, 100), (120 + 50 * k, 160)], (0, 0, 0))
+        editor.add_shape(shape)
+        states.append(snapshot(editor.shapes))
+    editor.selected_shapes = list(editor.shapes[:2])
+    for matrix in (main.translation_matrix(15, -5), main.rotation_matrix(30), main.scale_matrix(2, 0.5)):
+        editor.transform_selected(matrix)
+        states.append(snapshot(editor.shapes))
+    with quiet:
+        editor.flatten_selected()
+    states.append(snapshot(editor.shapes))
+
+    def check(state):
+        assert len(editor.shapes) == len(state)
+        for shape, (points, arcs) in zip(editor.shapes, state):
+            np.testing.assert_allclose(shape.points, points)
+            assert shape.arcs == arcs
+
+    with quiet:
+        for state in reversed(states[:-1]):
+            editor.undo()
+            check(state)
+        assert not editor.history.undo(editor)
+        for state in states[1:]:
+            editor.redo()
+            check(state)
+        assert not editor.history.redo(editor)
+    assert editor.history.nbytes == sum(c.nbytes for c in editor.history.undo_stack)
+
+def test_limits_drop_the_oldest_entries():
+    history = main.History(max_entries=3, max_bytes=100)
+    entries = [Entry(10) for _ in range(5)]
+    for entry in entries:
+        history.push(entry)
+    assert history.undo_stack == entries[2:] and history.nbytes == 30
+    # Uma entrada grande empurra as antigas até caber no limite de bytes.
+    big = Entry(85)
+    history.push(big)
+    assert history.undo_stack == [entries[4], big] and history.nbytes == 95
+    # Maior que o limite sozinha: nem ela fica.
+    history.push(Entry(150))
+    assert history.undo_stack == [] and history.nbytes == 0
+
+def test_push_clears_redo_and_its_bytes():
+    history = main.History()
+    first, second, third = Entry(10), Entry(20), Entry(40)
+    history.push(first)
+    history.push(second)
+    assert history.undo(None) and history.undo(None)
+    assert history.redo_stack == [second, first] and history.nbytes == 30
+    assert first.log == ['undo'] and second.log == ['undo']
+    assert history.redo(None)
+    history.push(third)
+    assert history.undo_stack == [first, third] and history.redo_stack == []
+    assert history.nbytes == 50
+    assert first.log == ['undo', 'redo'] and second.log == ['undo']
+
+def test_command_sizes_share_unchanged_arrays():
+    shape = main.Shape('desenho livre', np.random.default_rng(0).uniform(0, 500, (1000, 2)), (0, 0, 0))
+    before = shape.geometry
+    shape.transform(main.translation_matrix(5, 5))
+    # Uma translação só troca a matriz: os pontos contam uma vez.
+    moved = main.GeometryCommand([(shape, before, shape.geometry)])
+    points = main.value_nbytes(shape.base)
+    assert points < moved.nbytes < 2 * points
+    added = main.AddShapesCommand([(0, shape)])
+    assert added.nbytes > points
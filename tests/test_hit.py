@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+import main
+
+def random_walk(rng, count):
+    return np.cumsum(rng.normal(0, 8, (count, 2)), axis=0) + 400
+
+@pytest.mark.parametrize('closed', [False, True])
+def test_bvh_candidates_match_brute_force(closed):
+    # Nenhum segmento cuja caixa fica a até radius do ponto escapa, e as
+    # folhas devolvidas são exatamente as que alcançam o ponto.
+    rng = np.random.default_rng(0)
+    for count in (2, 3, 9, 17, 500):
+        points = random_walk(rng, count)
+        bvh = main.SegmentBVH(points, closed=closed)
+        starts, ends = bvh.segments(np.arange(bvh.count))
+        low, high = np.minimum(starts, ends), np.maximum(starts, ends)
+        for x, y in rng.uniform(points.min(axis=0) - 20, points.max(axis=0) + 20, (50, 2)):
+            radius = float(rng.uniform(0, 15))
+            near = np.flatnonzero((low[:, 0] - radius <= x) & (high[:, 0] + radius >= x) &
+                                  (low[:, 1] - radius <= y) & (high[:, 1] + radius >= y))
+            found = bvh.candidates(x, y, radius)
+            assert set(near.tolist()) <= set(found.tolist())
+            boxes = bvh.levels[0]
+            leaves = np.flatnonzero((boxes[:, 0] - radius <= x) & (boxes[:, 2] + radius >= x) &
+                                    (boxes[:, 1] - radius <= y) & (boxes[:, 3] + radius >= y))
+            assert set((found // bvh.leaf).tolist()) == set(leaves.tolist())
+
+@pytest.mark.parametrize('shape_type', ['desenho livre', 'polígono'])
+def test_hit_test_matches_distance_to_every_segment(shape_type):
+    rng = np.random.default_rng(1)
+    points = random_walk(rng, 300)
+    shape = main.Shape(shape_type, points, (0, 0, 0), thickness=2)
+    matrices = [None,
+                main.translation_matrix(30, -12),
+                main.about_centers(main.rotation_matrix(37) @ main.scale_matrix(2.5, 0.4), [(400, 400)])[0]]
+    for matrix in matrices:
+        shape.set_matrix(matrix)
+        world = shape.points
+        closed = np.concatenate((world, world[:1])) if shape_type == 'polígono' else world
+        for zoom in (1.0, 3.0):
+            reach = (shape.thickness + main.PICK_TOLERANCE) / zoom
+            for pos in rng.uniform(world.min(axis=0) - 10, world.max(axis=0) + 10, (300, 2)):
+                expected = main.segment_distances(pos, closed[:-1], closed[1:]).min() <= reach
+                assert shape.hit_test(tuple(pos), zoom=zoom) == expected
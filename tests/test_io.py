@@ -0,0 +1,93 @@
+import json
+
+import pytest
+
+import main
+from samples import assert_same_shapes, sample_shapes
+
+@pytest.mark.parametrize('extension', ['svg', 'json'])
+def test_export_import_round_trip(tmp_path, extension):
+    shapes = sample_shapes()
+    path = str(tmp_path / f'cena.{extension}')
+    main.export_shapes(path, shapes)
+    assert_same_shapes(list(main.import_shapes(path)), shapes)
+
+def test_json_stream_reads_small_chunks(tmp_path):
+    # Valores cortados entre blocos e chaves extras antes de "shapes".
+    path = tmp_path / 'cena.json'
+    path.write_text('{"versao": [1, {"a": 2}], "shapes": [{"type": "linha", "points": '
+                    '[[1.5, 2.25], [300.125, 4]]}, {"type": "outro"}, 7]}', encoding='utf-8')
+    with open(path, encoding='utf-8') as f:
+        items = list(main.iter_json_array(f, chunk_size=3))
+    assert items == [{'type': 'linha', 'points': [[1.5, 2.25], [300.125, 4]]}, {'type': 'outro'}, 7]
+    loaded = list(main.import_json(str(path)))
+    assert len(loaded) == 1 and loaded[0].points.tolist() == [[1.5, 2.25], [300.125, 4]]
+
+GOOD_LINE = {'type': 'linha', 'points': [[5, 6], [7, 8]]}
+
+@pytest.mark.parametrize('record', [
+    '{"type": "linha", "points": [[1, 2], [3]]}',
+    '{"type": "linha", "points": [[1, 2], [3, NaN]]}',
+    '{"type": "linha", "color": [1, 2], "points": [[1, 2], [3, 4]]}',
+    '{"type": "círculo", "points": [[1, 2]], "radius": "x"}',
+])
+def test_json_skips_and_reports_malformed_records(tmp_path, record):
+    # O registro ruim é descartado e relatado; os vizinhos entram.
+    path = tmp_path / 'ruim.json'
+    good = json.dumps(GOOD_LINE)
+    path.write_text(f'{{"shapes": [{good}, {record}, {good}]}}', encoding='utf-8')
+    reports = []
+    loaded = list(main.import_json(str(path), reports.append))
+    assert len(loaded) == 2 and len(reports) == 1 and 'Registro 2' in reports[0]
+
+def test_json_rejects_truncated_documents(tmp_path):
+    path = tmp_path / 'ruim.json'
+    path.write_text('{"shapes": [{"type": "linha"', encoding='utf-8')
+    with pytest.raises(ValueError):
+        list(main.import_json(str(path)))
+
+@pytest.mark.parametrize('element', [
+    '<line x1="1" y1="2" x2="3" y2="4" stroke="rgb(1,2)"/>',
+    '<line x1="nan" y1="2" x2="3" y2="4"/>',
+    '<polyline points="1,2 3,inf 5,6"/>',
+    '<polygon points="1,2 3,4 5"/>',
+    '<circle cx="10" cy="10" r="5" data-arcs="1,2,3"/>',
+    '<circle cx="10" cy="10" r="5" data-arcs="1,nan"/>',
+    '<circle cx="10" cy="10" r="inf"/>',
+])
+def test_svg_skips_and_reports_malformed_elements(tmp_path, element):
+    path = tmp_path / 'ruim.svg'
+    good = '<line x1="5" y1="6" x2="7" y2="8"/>'
+    path.write_text(f'<svg xmlns="{main.SVG_NS}">{good}<g>{element}</g>{good}</svg>', encoding='utf-8')
+    reports = []
+    loaded = list(main.import_svg(str(path), reports.append))
+    assert [shape.points.tolist() for shape in loaded] == [[[5, 6], [7, 8]]] * 2
+    assert len(reports) == 1 and 'Elemento 2' in reports[0]
+
+def test_svg_named_colors_and_fractional_radius(tmp_path):
+    path = tmp_path / 'cena.svg'
+    path.write_text(f'<svg xmlns="{main.SVG_NS}">'
+                    '<line x1="0" y1="0" x2="9" y2="9" stroke="Green"/>'
+                    '<line x1="0" y1="0" x2="9" y2="9" style="stroke: navy"/>'
+                    '<line x1="0" y1="0" x2="9" y2="9" stroke="papayawhip"/>'
+                    '<circle cx="10" cy="10" r="7.5"/></svg>', encoding='utf-8')
+    reports = []
+    green, navy, unknown, circle = main.import_svg(str(path), reports.append)
+    assert green.color == (0, 128, 0) and navy.color == (0, 0, 128)
+    assert unknown.color == main.COLORS['draw'] and len(reports) == 1 and 'papayawhip' in reports[0]
+    assert circle.radius == 7.5
+    # O raio fracionário sobrevive ao arquivo de cena e à exportação.
+    scene = str(tmp_path / 'cena.tp1')
+    main.save_scene(scene, [circle])
+    assert main.load_scene(scene)[0][0].radius == 7.5
+    main.release_scene_maps(scene)
+    for extension in ('svg', 'json'):
+        exported = str(tmp_path / f'saida.{extension}')
+        main.export_shapes(exported, [circle])
+        assert next(main.import_shapes(exported)).radius == 7.5
+
+def test_svg_clamps_negative_radius(tmp_path):
+    path = tmp_path / 'cena.svg'
+    path.write_text(f'<svg xmlns="{main.SVG_NS}"><circle cx="10" cy="10" r="-5"/></svg>', encoding='utf-8')
+    (circle,) = main.import_svg(str(path))
+    assert circle.radius == 0
@@ -0,0 +1,77 @@
+import numpy as np
+import pygame
+import pytest
+
+import main
+
+# Referências pixel a pixel: os laços originais, com o pincel de
+# pygame.draw.circle em cada centro.
+def reference_line_dda(surface, start, end, color, thickness):
+    x0, y0 = start
+    x1, y1 = end
+    steps = int(max(abs(x1 - x0), abs(y1 - y0)))
+    if steps == 0:
+        pygame.draw.circle(surface, color, (int(x0), int(y0)), thickness)
+        return
+    x_inc, y_inc = (x1 - x0) / steps, (y1 - y0) / steps
+    x, y = x0, y0
+    for _ in range(steps):
+        pygame.draw.circle(surface, color, (int(round(x)), int(round(y))), thickness)
+        x += x_inc
+        y += y_inc
+
+def reference_line_bresenham(surface, start, end, color, thickness):
+    x0, y0 = map(int, start)
+    x1, y1 = map(int, end)
+    dx, dy = abs(x1 - x0), abs(y1 - y0)
+    sx = 1 if x0 < x1 else -1
+    sy = 1 if y0 < y1 else -1
+    err = dx - dy
+    while True:
+        pygame.draw.circle(surface, color, (x0, y0), thickness)
+        if x0 == x1 and y0 == y1:
+            break
+        e2 = 2 * err
+        if e2 > -dy:
+            err -= dy
+            x0 += sx
+        if e2 < dx:
+            err += dx
+            y0 += sy
+
+def blank(clip=None):
+    surface = pygame.Surface((320, 240))
+    surface.fill((255, 255, 255))
+    if clip is not None:
+        surface.set_clip(clip)
+    return surface
+
+def random_lines(seed, count=40):
+    # Extremos fracionários, alguns fora da superfície e alguns degenerados.
+    rng = np.random.default_rng(seed)
+    lines = rng.uniform(-30, 350, (count, 4))
+    lines[::4] = lines[::4].round()
+    lines[1::9, 2:] = lines[1::9, :2]
+    return [((x0, y0), (x1, y1)) for x0, y0, x1, y1 in lines.tolist()]
+
+@pytest.mark.parametrize('draw, reference', [
+    (main.draw_line_dda, reference_line_dda),
+    (main.draw_line_bresenham, reference_line_bresenham),
+])
+@pytest.mark.parametrize('thickness', [1, 2, 5])
+@pytest.mark.parametrize('clip', [None, pygame.Rect(40, 30, 200, 150)])
+def test_span_lines_match_reference(draw, reference, thickness, clip):
+    surface, expected = blank(clip), blank(clip)
+    for i, (start, end) in enumerate(random_lines(thickness)):
+        color = (i * 37 % 256, i * 91 % 256, 0)
+        draw(surface, start, end, color, thickness)
+        reference(expected, start, end, color, thickness)
+    assert (pygame.surfarray.array2d(surface) == pygame.surfarray.array2d(expected)).all()
+
+def test_stamp_points_returns_painted_rect():
+    surface = blank()
+    rect = main.draw_line_dda(surface, (10.4, 20.6), (90.2, 61.7), (0, 0, 0), 3)
+    painted = np.argwhere(pygame.surfarray.array2d(surface) != surface.map_rgb((255, 255, 255)))
+    left, top = painted.min(axis=0)
+    right, bottom = painted.max(axis=0)
+    assert rect == pygame.Rect(left, top, right - left + 1, bottom - top + 1)
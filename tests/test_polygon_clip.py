@@ -0,0 +1,90 @@
+import numpy as np
+import pygame
+import pytest
+
+import main
+
+RECT = pygame.Rect(200, 150, 500, 400)
+
+# Referência: o Sutherland–Hodgman original, uma lista por borda.
+def reference_sutherland_hodgman(polygon, clip_rect):
+    edges = [(0, clip_rect.left, 1), (0, clip_rect.right, -1),
+             (1, clip_rect.top, 1), (1, clip_rect.bottom, -1)]
+    for axis, bound, sign in edges:
+        clipped = []
+        prev = polygon[-1] if polygon else None
+        for curr in polygon:
+            if sign * (curr[axis] - bound) >= 0:
+                if sign * (prev[axis] - bound) < 0:
+                    clipped.append(main.edge_intersection(prev, curr, axis, bound))
+                clipped.append(curr)
+            elif sign * (prev[axis] - bound) >= 0:
+                clipped.append(main.edge_intersection(prev, curr, axis, bound))
+            prev = curr
+        polygon = clipped
+    return polygon
+
+def star_polygon(rng, count):
+    # Polígono estrelado em volta da janela, muitas vezes côncavo. Um vértice
+    # por setor de 2π / count mantém os intervalos entre ângulos abaixo de π,
+    # então o polígono é simples.
+    x, y = rng.uniform(100, 800), rng.uniform(50, 650)
+    angles = (np.arange(count) + rng.uniform(0, 1, count)) * (2 * np.pi / count)
+    radii = rng.uniform(20, 300, count)
+    return list(zip((x + radii * np.cos(angles)).tolist(), (y + radii * np.sin(angles)).tolist()))
+
+def area(polygon):
+    points = np.asarray(polygon, dtype=np.float64)
+    x, y = points[:, 0], points[:, 1]
+    return 0.5 * float(np.sum(x * np.roll(y, -1) - np.roll(x, -1) * y))
+
+def same_cycle(polygon, expected):
+    # Mesmos vértices na mesma ordem, a menos do vértice inicial.
+    if len(polygon) != len(expected):
+        return False
+    return not polygon or any(polygon[k:] + polygon[:k] == expected for k in range(len(polygon)))
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_sutherland_hodgman_matches_reference(seed):
+    rng = np.random.default_rng(seed)
+    for _ in range(200):
+        polygon = star_polygon(rng, int(rng.integers(3, 30)))
+        assert same_cycle(main.sutherland_hodgman_clip(polygon, RECT),
+                          reference_sutherland_hodgman(polygon, RECT))
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_weiler_atherton_keeps_the_clipped_area(seed):
+    # As partes do Weiler–Atherton ficam dentro da janela e somam a mesma área
+    # do Sutherland–Hodgman (as arestas sobre a borda dele não têm área).
+    rng = np.random.default_rng(seed)
+    for _ in range(200):
+        polygon = star_polygon(rng, int(rng.integers(3, 30)))
+        parts = main.weiler_atherton_clip(polygon, RECT)
+        for part in parts:
+            points = np.asarray(part)
+            assert (points >= np.array(RECT.topleft) - 1e-9).all()
+            assert (points <= np.array(RECT.bottomright) + 1e-9).all()
+        clipped = main.sutherland_hodgman_clip(polygon, RECT)
+        expected = abs(area(clipped)) if len(clipped) >= 3 else 0.0
+        assert sum(abs(area(part)) for part in parts) == pytest.approx(expected, abs=1e-6)
+
+def test_weiler_atherton_splits_concave_polygons():
+    # Um "U" que sai pela base da janela deixa as duas pernas separadas.
+    u_shape = [(250, 100), (350, 100), (350, 500), (550, 500), (550, 100), (650, 100),
+               (650, 700), (250, 700)]
+    window = pygame.Rect(200, 150, 500, 300)
+    parts = main.weiler_atherton_clip(u_shape, window)
+    assert len(parts) == 2
+    assert sorted(abs(area(part)) for part in parts) == pytest.approx([100 * 300, 100 * 300])
+    # No Sutherland–Hodgman as pernas ficam ligadas por arestas sobre a borda.
+    assert len(main.sutherland_hodgman_clip(u_shape, window)) > max(len(part) for part in parts)
+
+def test_weiler_atherton_without_crossings():
+    inside = [(300, 200), (400, 200), (350, 300)]
+    assert main.weiler_atherton_clip(inside, RECT) == [inside]
+    outside = [(0, 0), (100, 0), (50, 100)]
+    assert main.weiler_atherton_clip(outside, RECT) == []
+    # A janela inteira dentro do polígono: sobra o retângulo.
+    around = [(0, 0), (1000, 0), (1000, 1000), (0, 1000)]
+    parts = main.weiler_atherton_clip(around, RECT)
+    assert len(parts) == 1 and abs(area(parts[0])) == RECT.width * RECT.height
@@ -0,0 +1,45 @@
+import pytest
+
+import main
+from samples import assert_same_shapes, sample_shapes
+
+def test_scene_file_round_trip(tmp_path):
+    shapes = sample_shapes()
+    path = str(tmp_path / 'cena.tp1')
+    main.save_scene(path, shapes)
+    loaded, bounds = main.load_scene(path)
+    assert_same_shapes(loaded, shapes)
+    for box, shape in zip(bounds.tolist(), loaded):
+        if shape.type == 'círculo':
+            (cx, cy), r = shape.points[0].tolist(), shape.radius
+            assert box == [cx - r, cy - r, cx + r, cy + r]
+        else:
+            assert box == shape.points.min(axis=0).tolist() + shape.points.max(axis=0).tolist()
+    # Regravar por cima de um arquivo ainda mapeado.
+    main.save_scene(path, loaded[:2])
+    assert_same_shapes(main.load_scene(path)[0], shapes[:2])
+    main.release_scene_maps(path)
+
+def test_scene_file_rejects_garbage(tmp_path):
+    path = tmp_path / 'ruim.tp1'
+    path.write_bytes(b'TP1S' + bytes(60))
+    with pytest.raises(ValueError):
+        main.load_scene(str(path))
+
+def test_scene_file_loads_points_on_first_use(tmp_path):
+    shapes = sample_shapes()
+    path = str(tmp_path / 'cena.tp1')
+    main.save_scene(path, shapes)
+    loaded, bounds = main.load_scene(path)
+    editor = main.GraphicsEditor(headless=True)
+    editor.set_scene(loaded, bounds)
+    # Abrir a cena e montar o índice só usa a tabela: nenhum ponto foi lido.
+    assert all(shape._points is None for shape in loaded)
+    assert [shape.type for shape in loaded] == [shape.type for shape in shapes]
+    assert [shape.bounding_box for shape in loaded] == [shape.calculate_bounding_box() for shape in shapes]
+    first = loaded[0]
+    first.selected = True
+    assert first.bounds() == tuple(bounds[0].tolist()) and first._points is None
+    assert first.points is first.base and first._points is not None
+    assert first.selected and all(shape._points is None for shape in loaded[1:])
+    main.release_scene_maps(path)
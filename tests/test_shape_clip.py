@@ -0,0 +1,60 @@
+import contextlib
+import io
+import math
+
+import numpy as np
+import pygame
+import pytest
+
+import main
+
+RECT = pygame.Rect(200, 150, 500, 400)
+
+def inside_mask(center, radius, angles, rect):
+    x = center[0] + radius * np.cos(angles)
+    y = center[1] + radius * np.sin(angles)
+    return (x >= rect.left) & (x <= rect.right) & (y >= rect.top) & (y <= rect.bottom)
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_circle_arcs_are_the_contour_inside_the_window(seed):
+    # Cada ângulo do contorno está num arco exatamente quando o ponto dele
+    # fica na janela; com arcos anteriores, também precisa estar neles.
+    rng = np.random.default_rng(seed)
+    angles = rng.uniform(0, 2 * math.pi, 2000)
+    for _ in range(100):
+        center = rng.uniform(100, 800, 2).tolist()
+        radius = float(rng.uniform(5, 400))
+        expected = inside_mask(center, radius, angles, RECT)
+        arcs = main.clip_circle_arcs(center, radius, RECT)
+        assert (main.arc_contains(arcs, angles) == expected).all()
+        previous = ((float(rng.uniform(0, 2 * math.pi)), float(rng.uniform(0.1, 3))),)
+        arcs = main.clip_circle_arcs(center, radius, RECT, previous)
+        assert (main.arc_contains(arcs, angles) == (expected & main.arc_contains(previous, angles))).all()
+
+def test_circle_arcs_inside_and_outside():
+    assert main.clip_circle_arcs((400, 300), 50, RECT) == ((0.0, 2 * math.pi),)
+    assert main.clip_circle_arcs((50, 50), 40, RECT) == ()
+    # Janela inteira dentro do círculo: o contorno fica todo fora.
+    assert main.clip_circle_arcs((450, 350), 1000, RECT) == ()
+
+def test_apply_clipping_splits_strokes_and_cuts_circles():
+    editor = main.GraphicsEditor(headless=True)
+    # Traço que sai pela direita e volta: dois trechos, o primeiro na forma original.
+    stroke = main.Shape('desenho livre', [(300, 200), (800, 250), (300, 300), (400, 400)], (0, 0, 0))
+    circle = main.Shape('círculo', [(700, 300)], (0, 0, 0), radius=50)
+    outside = main.Shape('desenho livre', [(10, 10), (50, 60)], (0, 0, 0))
+    editor.set_scene([stroke, circle, outside])
+    editor.clipping_window = RECT
+    with contextlib.redirect_stdout(io.StringIO()):
+        editor.apply_clipping('lb')
+    strokes = [shape for shape in editor.shapes if shape.type == 'desenho livre']
+    assert strokes[0] is stroke and len(strokes) == 2
+    np.testing.assert_allclose(stroke.points, [(300, 200), (700, 240)])
+    np.testing.assert_allclose(strokes[1].points, [(700, 260), (300, 300), (400, 400)])
+    assert outside not in editor.shapes
+    # Só a metade esquerda do círculo (x <= 700) sobra.
+    assert circle.arcs == ((math.pi / 2, math.pi),)
+    with contextlib.redirect_stdout(io.StringIO()):
+        editor.undo()
+    assert editor.shapes == [stroke, circle, outside]
+    assert len(stroke.points) == 4 and circle.arcs is None
@@ -0,0 +1,52 @@
+import math
+
+import numpy as np
+
+import main
+
+def capture(samples, *args):
+    points = []
+    for point in samples:
+        main.capture_point(points, point, *args)
+    return points
+
+def test_capture_drops_repeats_and_near_points():
+    points = capture([(10, 10), (10, 10), (11, 10), (20, 10), (20, 10), (21, 11)])
+    # O segundo ponto só anda enquanto está a menos de STROKE_MIN_DISTANCE do primeiro.
+    assert points == [(10, 10), (20, 10), (21, 11)]
+
+def test_capture_merges_collinear_points_with_fractional_coordinates():
+    # Com zoom os pontos do mundo são fracionários: a reta y = 0,1x não é
+    # exata em ponto flutuante, mas os pontos ainda são colineares.
+    samples = [(x / 3, x / 30) for x in range(0, 300, 7)]
+    assert capture(samples) == [samples[0], samples[-1]]
+    # Voltar pela mesma reta não é seguir em frente: o ponto fica.
+    back = capture(samples + [(50.0, 5.0)])
+    assert back == [samples[0], samples[-1], (50.0, 5.0)]
+
+def test_capture_keeps_corners():
+    square = [(0, 0), (10, 0), (20, 0), (20, 10), (20, 20), (10, 20), (0, 20)]
+    assert capture(square) == [(0, 0), (20, 0), (20, 20), (0, 20)]
+    # Desvios maiores que a tolerância (em px) contam como curva.
+    assert len(capture([(0, 0), (10, 0), (20, 0.3)])) == 3
+    assert len(capture([(0, 0), (10, 0), (20, 0.3)], main.STROKE_MIN_DISTANCE, 0.5)) == 2
+
+def test_simplify_stroke_stays_within_tolerance():
+    rng = np.random.default_rng(0)
+    angles = np.cumsum(rng.normal(0, 0.2, 2000))
+    points = np.cumsum(np.stack((np.cos(angles), np.sin(angles)), axis=1), axis=0)
+    simplified = main.simplify_stroke(points, 1.0)
+    assert len(simplified) < len(points) / 5
+    assert (simplified[0] == points[0]).all() and (simplified[-1] == points[-1]).all()
+    # Todo ponto original fica a até 1 px do traço simplificado.
+    distance = np.min([main.segment_distances(point, simplified[:-1], simplified[1:])
+                       for point in points], axis=1)
+    assert distance.max() <= 1.0 + 1e-9
+
+def test_simplify_stroke_straight_and_short():
+    line = np.stack((np.arange(50.0), np.arange(50.0) * 0.5), axis=1)
+    assert main.simplify_stroke(line).tolist() == [[0.0, 0.0], [49.0, 24.5]]
+    assert len(main.simplify_stroke([(0, 0), (5, 5)])) == 2
+    # Traço fechado (início = fim): os pontos são medidos até o próprio início.
+    loop = [(math.cos(t) * 10, math.sin(t) * 10) for t in np.linspace(0, 2 * math.pi, 40)]
+    assert len(main.simplify_stroke(loop)) >= 4
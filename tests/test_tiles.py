@@ -0,0 +1,45 @@
+import pygame
+
+import main
+from samples import sample_shapes
+
+def scene_pixels(editor, workers, cold=True):
+    editor.tile_workers = workers
+    editor.render_frames(1, cold=cold)
+    # Compara as cores: a camada compartilhada também guarda um byte de alfa.
+    return pygame.surfarray.array3d(editor.scene_layer)
+
+def test_tiles_match_sequential_and_skip_warm_cache(monkeypatch):
+    # Com o cache frio os blocos desenham o mesmo que o redesenho sequencial;
+    # com ele quente, a cena é composta das superfícies guardadas.
+    monkeypatch.setattr(main, 'TILE_MIN_SHAPES', 4)
+    shapes = sample_shapes()
+    for shape in shapes:
+        shape.bounding_box = shape.calculate_bounding_box()
+    editor = main.GraphicsEditor(headless=True)
+    editor.set_scene(shapes)
+    tiled = []
+    render_tiled = editor.render_tiled
+    editor.render_tiled = lambda shapes: tiled.append(render_tiled(shapes))
+    try:
+        for line_algo in ('DDA', 'AA'):
+            editor.line_algo = line_algo
+            expected = scene_pixels(editor, 1)
+            assert (scene_pixels(editor, 2) == expected).all() and len(tiled) == 1
+            # Os processos desenham na própria camada, sem cópia no fim.
+            assert editor.scene_layer is editor.tile_renderer.canvas
+            # A mesma cena não é regravada na memória compartilhada.
+            version = editor.tile_renderer.version
+            assert (scene_pixels(editor, 2) == expected).all() and len(tiled) == 2
+            assert editor.tile_renderer.version == version
+            scene_pixels(editor, 1, cold=False)
+            assert (scene_pixels(editor, 2, cold=False) == expected).all() and len(tiled) == 2
+            tiled.clear()
+        # Uma forma transformada muda a geometria compartilhada.
+        editor.shapes[0].transform(main.rotation_matrix(15))
+        editor.shapes[0].bounding_box = editor.shapes[0].calculate_bounding_box()
+        expected = scene_pixels(editor, 1)
+        assert (scene_pixels(editor, 2) == expected).all()
+        assert editor.tile_renderer.version > version
+    finally:
+        editor.close_tiles()